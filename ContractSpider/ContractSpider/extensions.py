@@ -0,0 +1,195 @@
+# 按主机自适应限速：根据响应延迟、403/429 与空响应调整每个下载槽的并发数与下载延迟
+#
+# 采用 AIMD（加性增、乘性减）：
+#   - 正常响应且延迟不超过目标：并发数约每一轮（concurrency 个响应）加 1，延迟减少 delay_step
+#   - 403/429/503、200 空响应或延迟超过 max_latency：并发数乘以 decrease_factor，延迟翻倍；
+#     同一主机两次减速之间至少间隔 decrease_interval 秒，避免同一批在途请求的失败被重复计算
+#   - 延迟介于 target_latency 与 max_latency 之间：保持不变
+# 参数按 ADAPTIVE_THROTTLE_TARGETS 中 主机名 > 阶段名 > 爬虫名 > 默认值 的顺序取值（阶段见 utils/stages.py，
+# 单阶段爬虫的阶段名即爬虫名）。下载槽的初始并发与延迟沿用槽创建时的值（DOWNLOAD_SLOTS 或爬虫级别的初始值）。
+# CONCURRENT_REQUESTS 仍是所有下载槽合计的并发上限。
+
+import json
+import os
+import time
+from typing import Dict, Optional
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet import task
+
+from ContractSpider.utils.stages import request_stage
+
+THROTTLE_STATUS = (403, 429, 503)
+DONT_ADJUST_META = "adaptive_throttle_dont_adjust"
+
+DEFAULT_TARGET = {
+    "start_concurrency": 2,
+    "min_concurrency": 1,
+    "max_concurrency": 8,
+    "start_delay": 5.0,
+    "min_delay": 0.0,
+    "max_delay": 60.0,
+    "delay_step": 0.1,
+    "target_latency": 3.0,
+    "max_latency": 15.0,
+    "decrease_factor": 0.5,
+    "decrease_interval": 10.0,
+}
+
+
+class HostThrottle:
+    """单个下载槽的限速状态"""
+
+    def __init__(self, host: str, target: dict, concurrency: float, delay: float):
+        self.host = host
+        self.target = target
+        self.concurrency = float(min(max(concurrency, target["min_concurrency"]), target["max_concurrency"]))
+        self.delay = float(min(max(delay, target["min_delay"]), target["max_delay"]))
+        self.latency: Optional[float] = None
+        self.last_decrease = 0.0
+        self.responses = 0
+        self.throttled = 0
+
+    def on_response(self, latency: Optional[float], throttled: bool, now: float) -> bool:
+        """记录一次响应，返回是否执行了减速"""
+        target = self.target
+        self.responses += 1
+        if latency is not None:
+            self.latency = latency if self.latency is None else 0.3 * latency + 0.7 * self.latency
+
+        if throttled or (self.latency is not None and self.latency > target["max_latency"]):
+            self.throttled += int(throttled)
+            if now - self.last_decrease < target["decrease_interval"]:
+                return False
+            self.last_decrease = now
+            self.concurrency = max(target["min_concurrency"], self.concurrency * target["decrease_factor"])
+            self.delay = min(target["max_delay"], max(self.delay * 2, target["delay_step"], target["min_delay"]))
+            return True
+
+        if self.latency is None or self.latency <= target["target_latency"]:
+            self.concurrency = min(target["max_concurrency"], self.concurrency + 1 / self.concurrency)
+            self.delay = max(target["min_delay"], self.delay - target["delay_step"])
+        return False
+
+    def apply(self, slot):
+        slot.concurrency = max(1, int(self.concurrency))
+        slot.delay = self.delay
+
+
+class AdaptiveThrottle:
+    """
+    在 EXTENSIONS 中启用，并设置 ADAPTIVE_THROTTLE_ENABLED = True。
+    与 Scrapy 自带的 AutoThrottle 互斥。
+    """
+
+    def __init__(self, crawler, defaults: dict, targets: Dict[str, dict]):
+        self.crawler = crawler
+        self.defaults = defaults
+        self.targets = targets
+        self.hosts: Dict[str, HostThrottle] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            raise NotConfigured
+        if settings.getbool("AUTOTHROTTLE_ENABLED"):
+            raise NotConfigured("ADAPTIVE_THROTTLE_ENABLED 与 AUTOTHROTTLE_ENABLED 不能同时开启")
+
+        defaults = {**DEFAULT_TARGET, **settings.getdict("ADAPTIVE_THROTTLE_DEFAULTS")}
+        extension = cls(crawler, defaults, settings.getdict("ADAPTIVE_THROTTLE_TARGETS"))
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def target_for(self, *keys: str) -> dict:
+        """默认值依次被 keys 对应的配置覆盖，后面的优先"""
+        target = dict(self.defaults)
+        for key in keys:
+            target.update(self.targets.get(key, {}))
+        return target
+
+    def spider_opened(self, spider):
+        # 新建的下载槽使用爬虫级别的初始值，各主机自己的参数在第一次响应后生效
+        target = self.target_for(spider.name)
+        spider.download_delay = target["start_delay"]
+        spider.max_concurrent_requests = target["start_concurrency"]
+
+    def response_downloaded(self, response, request, spider):
+        if request.meta.get(DONT_ADJUST_META):
+            return
+        key = request.meta.get("download_slot")
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is None:
+            return
+
+        host = self.hosts.get(key)
+        if host is None:
+            target = self.target_for(spider.name, request_stage(request, spider), urlparse_cached(request).hostname or key)
+            host = self.hosts[key] = HostThrottle(key, target, slot.concurrency, slot.delay)
+
+        throttled = response.status in THROTTLE_STATUS or (response.status == 200 and not response.body)
+        if host.on_response(request.meta.get("download_latency"), throttled, time.monotonic()):
+            logger = getattr(spider, "custom_logger", None)
+            if logger is not None:
+                reason = f"状态码 {response.status}" if throttled else f"延迟 {host.latency:.1f}s"
+                logger.warning(
+                    f"[限速] {key} {reason}，并发降为 {int(host.concurrency)}，下载延迟升为 {host.delay:.1f}s"
+                )
+        host.apply(slot)
+
+    def spider_closed(self, spider):
+        stats = self.crawler.stats
+        for key, host in self.hosts.items():
+            prefix = f"adaptive_throttle/{key}"
+            stats.set_value(f"{prefix}/concurrency", int(host.concurrency))
+            stats.set_value(f"{prefix}/delay", round(host.delay, 2))
+            stats.set_value(f"{prefix}/latency", None if host.latency is None else round(host.latency, 3))
+            stats.set_value(f"{prefix}/responses", host.responses)
+            stats.set_value(f"{prefix}/throttled", host.throttled)
+
+
+class StatsFile:
+    """
+    设置 STATS_FILE 时启用：每隔 STATS_FILE_INTERVAL 秒将 stats 写入该 JSON 文件，爬虫结束时再写入一次，
+    供回填启动器（ContractSpider/launcher.py）汇总各进程的进度与吞吐。
+    """
+
+    def __init__(self, crawler, path: str, interval: float):
+        self.crawler = crawler
+        self.path = path
+        self.interval = interval
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get("STATS_FILE")
+        if not path:
+            raise NotConfigured
+        extension = cls(crawler, path, crawler.settings.getfloat("STATS_FILE_INTERVAL", 10))
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        self.task = task.LoopingCall(self.dump)
+        self.task.start(self.interval, now=True)
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        # CoreStats 先于本扩展处理 spider_closed，finish_reason 等已写入 stats
+        self.dump(finished=True)
+
+    def dump(self, finished: bool = False):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        data = {"finished": finished, "stats": self.crawler.stats.get_stats()}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self.path)
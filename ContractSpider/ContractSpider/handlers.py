@@ -0,0 +1,258 @@
+# 流式下载处理器：附件响应体边下载边写入临时文件，内存占用与文件大小无关
+#
+# 在请求 meta 中设置 STREAM_TO_META 为目标路径即可启用：
+#   - 响应体写入 {目标路径}.part，同时计算 sha256 并保留文件头用于识别类型
+#   - 下载结束后结果写入 request.meta[STREAM_RESULT_META]
+#   - response.body 只包含文件头（最多 HEAD_SIZE 字节），完整内容在 .part 文件中
+# 校验通过后由调用方将 .part 文件原子地重命名为最终文件名（见 commit_part()）
+#
+# 断点续传：.part 旁的 {目标路径}.part.json 记录 ETag / Last-Modified / 总大小，
+# 再次下载同一目标时自动发送 Range 与 If-Range：
+#   - 206 且 Content-Range 起点与已下载大小一致时追加写入
+#   - 200（服务端不支持 Range 或文件已变化）时从头写入
+#   - 416 时丢弃临时文件，由调用方重试
+
+import hashlib
+import json
+import os
+import re
+from typing import Optional
+
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler, ScrapyAgent
+from twisted.python.failure import Failure
+from twisted.web.iweb import UNKNOWN_LENGTH
+
+STREAM_TO_META = "stream_to"
+STREAM_RESULT_META = "stream_result"
+PART_SUFFIX = ".part"
+SIDECAR_SUFFIX = ".json"
+HEAD_SIZE = 8192
+INCOMPLETE_FLAGS = ("dataloss", "partial", "download_stopped")
+
+_CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+def part_path(file_path: str) -> str:
+    return f"{file_path}{PART_SUFFIX}"
+
+
+def sidecar_path(part: str) -> str:
+    return f"{part}{SIDECAR_SUFFIX}"
+
+
+def commit_part(part: str, file_path: str):
+    """校验通过后将临时文件替换为最终文件"""
+    os.replace(part, file_path)
+    _remove(sidecar_path(part))
+
+
+def discard_part(part: str):
+    """丢弃临时文件及其续传记录，下次从头下载"""
+    _remove(part)
+    _remove(sidecar_path(part))
+
+
+def load_resume_state(file_path: str) -> Optional[dict]:
+    """读取可续传的下载进度，offset 以 .part 文件的实际大小为准"""
+    part = part_path(file_path)
+    try:
+        with open(sidecar_path(part), "r", encoding="utf-8") as f:
+            state = json.load(f)
+        state["offset"] = os.path.getsize(part)
+    except (OSError, ValueError):
+        return None
+    return state if state["offset"] > 0 else None
+
+
+def parse_content_range(value) -> Optional[tuple]:
+    """解析 Content-Range: bytes start-end/total，返回 (start, total)，total 未知时为 None"""
+    if isinstance(value, bytes):
+        value = value.decode("latin-1")
+    match = _CONTENT_RANGE.match(value or "")
+    if not match:
+        return None
+    total = match.group(3)
+    return int(match.group(1)), None if total == "*" else int(total)
+
+
+def _remove(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _header(headers, name: str) -> Optional[str]:
+    value = headers.get(name)
+    return value.decode("latin-1") if value else None
+
+
+class FileSink:
+    """
+    替换 _ResponseReader 的内存缓冲区：写入文件、计算 sha256、保留文件头。
+    getvalue() 只返回文件头，供 Scrapy 推断响应类型以及回调识别文件类型。
+    offset > 0 时在已有的 .part 文件后追加，并先对已有内容计算摘要。
+    """
+
+    def __init__(self, path: str, offset: int = 0, expected: Optional[int] = None):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.expected = expected
+        self.sha256 = hashlib.sha256()
+        self.head = b""
+        self.size = 0
+        self.valid = True
+        self.resumed = bool(offset)
+        if offset:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    self._update(chunk)
+            self.file = open(path, "ab")
+        else:
+            self.file = open(path, "wb")
+
+    def _update(self, data: bytes):
+        self.sha256.update(data)
+        if len(self.head) < HEAD_SIZE:
+            self.head += data[:HEAD_SIZE - len(self.head)]
+        self.size += len(data)
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self._update(data)
+
+    def getvalue(self) -> bytes:
+        return self.head
+
+    def truncate(self, size: int = 0):
+        # 超过 DOWNLOAD_MAXSIZE 时 Scrapy 会清空缓冲区
+        self.file.truncate(size)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    @property
+    def complete(self) -> bool:
+        return self.expected is None or self.size == self.expected
+
+    def result(self, complete: bool = True) -> dict:
+        return {
+            "path": self.path,
+            "size": self.size,
+            "expected": self.expected,
+            "complete": complete and self.complete,
+            "resumed": self.resumed,
+            "sha256": self.sha256.hexdigest(),
+            "head": self.head,
+        }
+
+
+class StreamingScrapyAgent(ScrapyAgent):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._sink: Optional[FileSink] = None
+        self._resume: Optional[dict] = None
+
+    def download_request(self, request):
+        request.meta.pop(STREAM_RESULT_META, None)
+        path = request.meta.get(STREAM_TO_META)
+        if path:
+            self._prepare_range(request, path)
+        d = super().download_request(request)
+        if path:
+            d.addBoth(self._cb_stream_done, request)
+        return d
+
+    def _prepare_range(self, request, path: str):
+        # 写入磁盘的必须是原始字节，Range 的偏移也以原始字节计算
+        request.headers["Accept-Encoding"] = "identity"
+        request.headers.pop("Range", None)
+        request.headers.pop("If-Range", None)
+        self._resume = load_resume_state(path)
+        if self._resume is None:
+            return
+        request.headers["Range"] = f"bytes={self._resume['offset']}-"
+        validator = self._resume.get("etag") or self._resume.get("last_modified")
+        if validator:
+            request.headers["If-Range"] = validator
+
+    def _cb_bodyready(self, txresponse, request):
+        path = request.meta.get(STREAM_TO_META)
+        if path and txresponse.code == 416:
+            discard_part(part_path(path))
+        elif path and 200 <= txresponse.code < 300:
+            self._open_sink(txresponse, request, part_path(path))
+        return super()._cb_bodyready(txresponse, request)
+
+    def _open_sink(self, txresponse, request, part: str):
+        headers = self._headers_from_twisted_response(txresponse)
+        length = None if txresponse.length == UNKNOWN_LENGTH else txresponse.length
+        offset, expected, valid = 0, length, True
+
+        if txresponse.code == 206:
+            content_range = parse_content_range(headers.get("Content-Range"))
+            if self._resume is not None and content_range and content_range[0] == self._resume["offset"]:
+                offset = self._resume["offset"]
+                expected = content_range[1] if content_range[1] is not None else (
+                    offset + length if length is not None else None
+                )
+            else:
+                valid = False  # 返回的区间与本地进度不一致，本次结果作废
+
+        state = {
+            "url": request.url,
+            "etag": _header(headers, "ETag") or (self._resume or {}).get("etag"),
+            "last_modified": _header(headers, "Last-Modified") or (self._resume or {}).get("last_modified"),
+            "total": expected,
+        }
+        deliver_body = txresponse.deliverBody
+
+        def deliver_to_sink(protocol):
+            self._sink = FileSink(part, offset=offset, expected=expected)
+            self._sink.valid = valid
+            with open(sidecar_path(part), "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            protocol._bodybuf = self._sink
+            deliver_body(protocol)
+
+        txresponse.deliverBody = deliver_to_sink
+
+    def _cb_bodydone(self, result, request, url):
+        response = super()._cb_bodydone(result, request, url)
+        if self._sink is not None and hasattr(response, "flags"):
+            response.flags.append("streamed")
+        return response
+
+    def _cb_stream_done(self, result, request):
+        sink, self._sink = self._sink, None
+        if sink is None:
+            return result
+        sink.close()
+        if not sink.valid:
+            discard_part(sink.path)
+            return result
+        if isinstance(result, Failure):
+            # 下载中断：保留已写入的部分，下次通过 Range 续传
+            if not sink.size:
+                discard_part(sink.path)
+            return result
+        complete = not any(flag in result.flags for flag in INCOMPLETE_FLAGS)
+        request.meta[STREAM_RESULT_META] = sink.result(complete)
+        return result
+
+
+class StreamingDownloadHandler(HTTP11DownloadHandler):
+    """在 DOWNLOAD_HANDLERS 中替换 http/https 处理器；未设置 STREAM_TO_META 的请求行为不变"""
+
+    def download_request(self, request, spider):
+        agent = StreamingScrapyAgent(
+            contextFactory=self._contextFactory,
+            pool=self._pool,
+            maxsize=getattr(spider, "download_maxsize", self._default_maxsize),
+            warnsize=getattr(spider, "download_warnsize", self._default_warnsize),
+            fail_on_dataloss=self._fail_on_dataloss,
+            crawler=self._crawler,
+        )
+        return agent.download_request(request)
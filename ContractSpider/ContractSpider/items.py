@@ -35,4 +35,5 @@ class DetailItem(scrapy.Item):
     contract_announcement_date = scrapy.Field()
     attachment_name = scrapy.Field()
     attachment_download_url = scrapy.Field()
+    contract_link = scrapy.Field()  # 合同详情链接
 
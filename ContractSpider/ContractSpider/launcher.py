@@ -0,0 +1,249 @@
+# 回填历史数据：将较长的日期范围按天拆分为若干块，每块由一个独立的 scrapy crawl 进程爬取，多个进程并行
+#
+# 用法（在 scrapy.cfg 所在目录运行）：
+#   python -m ContractSpider.launcher contract 2024-01-01 2024-07-01 --chunk-days 7 --workers 4
+#   python -m ContractSpider.launcher detail 2024-01-01 2024-06-30 --workers 4 -a incremental=1
+#
+# - 日期范围的含义与对应爬虫一致：contract / chain 左闭右开，detail / attachment 闭区间
+# - 每块覆盖完整的若干天，按天存储的数据文件（YYYY-MM-DD.xlsx 等）只会由一个进程写入
+# - 每个进程有独立的代理池与限速状态，Scrapy 日志写入 logs/backfill/ 下各块自己的日志文件；
+#   通过 STATS_FILE 定期写出 stats，启动器据此汇总进度与吞吐
+# - 失败的块（进程异常退出或爬虫未正常结束）按 --retries 重新运行，断点续爬会跳过已完成的部分
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from tqdm import tqdm
+
+DATE_FORMAT = "%Y-%m-%d"
+
+# 爬虫名 -> (开始日期参数, 结束日期参数, 结束日期是否不含)
+SPIDER_DATE_ARGS = {
+    "contract": ("CONTRACT_START_DATE", "CONTRACT_END_DATE", True),
+    "chain": ("CONTRACT_START_DATE", "CONTRACT_END_DATE", True),
+    "detail": ("DETAIL_START_DATE", "DETAIL_END_DATE", False),
+    "attachment": ("ATTACHMENT_START_DATE", "ATTACHMENT_END_DATE", False),
+}
+
+# 汇总的计数：合同、详情产出 item；附件不产出 item，以响应数衡量
+COUNTERS = ("item_scraped_count", "response_received_count")
+
+
+def split_range(start_date: str, end_date: str, chunk_days: int, end_exclusive: bool) -> List[Tuple[str, str]]:
+    """将日期范围按 chunk_days 天拆分，返回每块的 (第一天, 最后一天)，均包含"""
+    first = datetime.strptime(start_date, DATE_FORMAT).date()
+    last = datetime.strptime(end_date, DATE_FORMAT).date()
+    if end_exclusive:
+        last -= timedelta(days=1)
+
+    chunks = []
+    while first <= last:
+        chunk_last = min(first + timedelta(days=chunk_days - 1), last)
+        chunks.append((first.strftime(DATE_FORMAT), chunk_last.strftime(DATE_FORMAT)))
+        first = chunk_last + timedelta(days=1)
+    return chunks
+
+
+class Chunk:
+    """一个日期块及其爬虫进程"""
+
+    def __init__(self, spider: str, first_day: str, last_day: str, log_folder: str):
+        self.spider = spider
+        self.first_day = first_day
+        self.last_day = last_day
+        name = f"{spider}_{first_day}_{last_day}"
+        self.log_path = os.path.join(log_folder, f"{name}.log")
+        self.output_path = os.path.join(log_folder, f"{name}.out")  # 标准输出与错误（进度条、启动失败的异常）
+        self.stats_path = os.path.join(log_folder, f"{name}.stats.json")
+        self.process: Optional[subprocess.Popen] = None
+        self.output = None
+        self.attempts = 0
+        self.started = None
+        self.elapsed = 0.0
+        self.returncode = None
+        self.stats = {}
+        self.finished = False
+
+    @property
+    def label(self) -> str:
+        return self.first_day if self.first_day == self.last_day else f"{self.first_day}~{self.last_day}"
+
+    def date_args(self) -> List[str]:
+        start_arg, end_arg, end_exclusive = SPIDER_DATE_ARGS[self.spider]
+        end = self.last_day
+        if end_exclusive:
+            end = (datetime.strptime(end, DATE_FORMAT) + timedelta(days=1)).strftime(DATE_FORMAT)
+        return ["-a", f"{start_arg}={self.first_day}", "-a", f"{end_arg}={end}"]
+
+    def command(self, spider_args: List[str], settings: List[str], stats_interval: float) -> List[str]:
+        command = [sys.executable, "-m", "scrapy", "crawl", self.spider] + self.date_args()
+        for arg in spider_args:
+            command += ["-a", arg]
+        command += [
+            "-s", "LOG_ENABLED=1",
+            "-s", "LOG_LEVEL=INFO",
+            "-s", f"LOG_FILE={self.log_path}",
+            "-s", f"STATS_FILE={self.stats_path}",
+            "-s", f"STATS_FILE_INTERVAL={stats_interval}",
+        ]
+        for setting in settings:
+            command += ["-s", setting]
+        return command
+
+    def start(self, spider_args: List[str], settings: List[str], stats_interval: float):
+        for path in (self.stats_path, self.log_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.attempts += 1
+        self.stats = {}
+        self.finished = False
+        self.returncode = None
+        self.output = open(self.output_path, "ab")
+        self.started = time.monotonic()
+        self.process = subprocess.Popen(
+            self.command(spider_args, settings, stats_interval),
+            stdout=self.output,
+            stderr=subprocess.STDOUT,
+        )
+
+    def poll(self) -> bool:
+        """读取最新的统计，进程结束时返回 True"""
+        self.read_stats()
+        returncode = self.process.poll()
+        if returncode is None:
+            return False
+        self.returncode = returncode
+        self.elapsed += time.monotonic() - self.started
+        self.output.close()
+        self.read_stats()
+        return True
+
+    def read_stats(self):
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return  # 尚未写出，或者正好在替换文件
+        self.stats = data.get("stats", {})
+        self.finished = data.get("finished", False)
+
+    @property
+    def succeeded(self) -> bool:
+        return self.returncode == 0 and self.finished and self.stats.get("finish_reason") == "finished"
+
+    def count(self, key: str) -> int:
+        return int(self.stats.get(key, 0) or 0)
+
+    def terminate(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+
+def run(chunks: List[Chunk], workers: int, retries: int, spider_args: List[str], settings: List[str],
+        interval: float = 5) -> List[Chunk]:
+    """以最多 workers 个进程运行所有块，定期汇总进度，返回最终失败的块"""
+    pending = list(chunks)
+    running: List[Chunk] = []
+    failed: List[Chunk] = []
+    done = 0
+    began = time.monotonic()
+    progress = tqdm(total=len(chunks), desc="回填", unit="块")
+
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                chunk = pending.pop(0)
+                chunk.start(spider_args, settings, stats_interval=interval)
+                running.append(chunk)
+
+            time.sleep(interval)
+            for chunk in list(running):
+                if not chunk.poll():
+                    continue
+                running.remove(chunk)
+                if chunk.succeeded:
+                    done += 1
+                    progress.update(1)
+                elif chunk.attempts <= retries:
+                    progress.write(f"⚠️ {chunk.label} 未正常结束（退出码 {chunk.returncode}），重新运行，日志: {chunk.log_path}")
+                    pending.append(chunk)
+                else:
+                    failed.append(chunk)
+                    progress.update(1)
+                    progress.write(f"❌ {chunk.label} 失败 {chunk.attempts} 次，日志: {chunk.log_path}")
+
+            elapsed = time.monotonic() - began
+            totals = {key: sum(chunk.count(key) for chunk in chunks) for key in COUNTERS}
+            progress.set_postfix({
+                "运行中": len(running),
+                "items": totals["item_scraped_count"],
+                "items/s": f"{totals['item_scraped_count'] / elapsed:.1f}",
+                "响应/s": f"{totals['response_received_count'] / elapsed:.1f}",
+            })
+    except KeyboardInterrupt:
+        for chunk in running:
+            chunk.terminate()
+        raise
+    finally:
+        progress.close()
+
+    report(chunks, time.monotonic() - began)
+    return failed
+
+
+def report(chunks: List[Chunk], elapsed: float):
+    print(f"\n{'日期':<23} {'状态':<4} {'次数':>4} {'items':>8} {'响应':>8} {'耗时(s)':>8} {'items/s':>8}")
+    for chunk in chunks:
+        items = chunk.count("item_scraped_count")
+        status = "成功" if chunk.succeeded else "失败"
+        rate = items / chunk.elapsed if chunk.elapsed else 0
+        print(f"{chunk.label:<23} {status:<4} {chunk.attempts:>4} {items:>8} "
+              f"{chunk.count('response_received_count'):>8} {chunk.elapsed:>8.0f} {rate:>8.1f}")
+
+    items = sum(chunk.count("item_scraped_count") for chunk in chunks)
+    responses = sum(chunk.count("response_received_count") for chunk in chunks)
+    print(f"合计: {items} items，{responses} 个响应，耗时 {elapsed:.0f}s，"
+          f"{items / elapsed:.1f} items/s，{responses / elapsed:.1f} 响应/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按日期拆分并行回填历史数据")
+    parser.add_argument("spider", choices=sorted(SPIDER_DATE_ARGS), help="爬虫名")
+    parser.add_argument("start_date", help="开始日期 YYYY-MM-DD（含）")
+    parser.add_argument("end_date", help="结束日期 YYYY-MM-DD：contract / chain 不含，detail / attachment 含")
+    parser.add_argument("--chunk-days", type=int, default=7, help="每块的天数")
+    parser.add_argument("--workers", type=int, default=4, help="同时运行的爬虫进程数")
+    parser.add_argument("--retries", type=int, default=1, help="失败的块重新运行的次数")
+    parser.add_argument("--interval", type=float, default=5, help="汇总进度的间隔（秒）")
+    parser.add_argument("--log-folder", default=os.path.join("logs", "backfill"))
+    parser.add_argument("-a", dest="spider_args", action="append", default=[], metavar="NAME=VALUE",
+                        help="传给每个爬虫的参数，例如 -a incremental=1")
+    parser.add_argument("-s", dest="settings", action="append", default=[], metavar="NAME=VALUE",
+                        help="传给每个爬虫的设置，例如 -s CONCURRENT_REQUESTS=4")
+    args = parser.parse_args(argv)
+
+    if args.chunk_days < 1 or args.workers < 1:
+        parser.error("--chunk-days 与 --workers 必须大于 0")
+    end_exclusive = SPIDER_DATE_ARGS[args.spider][2]
+    ranges = split_range(args.start_date, args.end_date, args.chunk_days, end_exclusive)
+    if not ranges:
+        parser.error(f"日期范围为空: {args.start_date} ~ {args.end_date}")
+
+    os.makedirs(args.log_folder, exist_ok=True)
+    chunks = [Chunk(args.spider, first, last, args.log_folder) for first, last in ranges]
+    print(f"🚀 {args.spider}: {ranges[0][0]} ~ {ranges[-1][1]}，{len(chunks)} 块，{args.workers} 个进程")
+
+    failed = run(chunks, args.workers, args.retries, args.spider_args, args.settings, args.interval)
+    if failed:
+        raise SystemExit(f"❌ {len(failed)} 块失败: {', '.join(chunk.label for chunk in failed)}")
+    print("✅ 全部完成")
+
+
+if __name__ == "__main__":
+    main()
@@ -110,44 +110,53 @@ class ContractspiderDownloaderMiddleware:
         spider.logger.info("Spider opened: %s" % spider.name)
 
 
-import time
 from scrapy.downloadermiddlewares.retry import get_retry_request
 
+from ContractSpider.utils.backoff import BackoffScheduler
+from ContractSpider.utils.proxy_pool import ProxyPool
+from ContractSpider.utils.stages import STAGE_ATTACHMENT, STAGE_CONTRACT, STAGE_DETAIL, claim_request, request_stage
+
+
+def set_proxy_or_backoff(middleware, request, spider, max_attempts=10):
+    """从代理池为请求分配代理；代理池暂时为空时退避后重新调度该请求，超过次数则不使用代理继续"""
+    try:
+        middleware.pool.assign(request)
+        return
+    except Exception as e:
+        attempts = request.meta.get('proxy_attempts', 0) + 1
+        if attempts >= max_attempts:
+            spider.custom_logger.error("超过最大重试次数，放弃设置代理")
+            return
+        spider.custom_logger.error(f"获取代理失败，第 {attempts} 次重试: {e}")
+
+    retry_request = request.copy()
+    retry_request.meta['proxy_attempts'] = attempts
+    raise middleware.backoff.reschedule(request, retry_request, spider)
+
 
 class RotateProxyMiddleware:
     MAX_RETRY_COUNT = 5  # 允许的最大重试次数
     FAILED_JSON_FILE = "failed_requests.json"  # 失败请求存储文件
+    stage = STAGE_CONTRACT  # 只处理搜索页请求
 
-    def __init__(self, api_url):
-        self.api_url = api_url
+    def __init__(self, pool, backoff=None):
+        self.pool = pool
+        self.backoff = backoff
         self.failed_urls = {}
 
     @classmethod
     def from_crawler(cls, crawler):
-        api_url = crawler.settings.get('PROXY_API_URL', '')
-        return cls(api_url)
-
-    def get_new_proxy(self):
-        """获取新的代理IP"""
-        return self.api_url  # 假设 API 直接返回代理地址
+        return cls(ProxyPool.from_crawler(crawler), BackoffScheduler.from_crawler(crawler))
 
     def process_request(self, request, spider):
-        max_retries = 10
-        retry_delay = 3
-        for attempt in range(max_retries):
-            try:
-                new_proxy = self.get_new_proxy()
-                request.meta['proxy'] = new_proxy
-                return
-            except Exception as e:
-                spider.custom_logger.error(f"获取代理失败，第 {attempt + 1} 次重试: {e}")
-                time.sleep(retry_delay)
-
-        spider.custom_logger.error("超过最大重试次数，放弃设置代理")
-
+        if claim_request(request, spider, self.stage):
+            set_proxy_or_backoff(self, request, spider)
 
     def process_response(self, request, response, spider):
         """处理非200状态请求，超过最大重试次数则返回空响应，避免程序中断"""
+        if request_stage(request, spider) != self.stage:
+            return response
+        self.pool.report_response(request, response)
 
         if response.status != 200:
             start_date = request.meta.get('searchPlacardStartDate', '')
@@ -172,19 +181,14 @@ class RotateProxyMiddleware:
                     encoding='utf-8'
                 )
 
-            # ✅ 重试逻辑
-            time.sleep(5)
-            new_proxy = self.get_new_proxy()
-            request.meta['proxy'] = new_proxy
+            # ✅ 重试逻辑（退避后重新入队，不阻塞其他请求；重新入队时从代理池换用新代理）
             spider.custom_logger.warning(
-                f"[重试] 状态码 {response.status} 第 {retry_count} 次，使用代理 {new_proxy} - {page}"
+                f"[重试] 状态码 {response.status} 第 {retry_count} 次 - {page}"
             )
 
             retry_request = get_retry_request(request, spider=spider, reason=f"Status {response.status}")
             if retry_request:
-                retry_request.meta['proxy'] = new_proxy
-                retry_request.dont_filter = True
-                return retry_request
+                raise self.backoff.reschedule(request, retry_request, spider)
             else:
                 return HtmlResponse(
                     url=response.url,
@@ -196,6 +200,11 @@ class RotateProxyMiddleware:
 
         return response  # 正常响应返回
 
+    def process_exception(self, request, exception, spider):
+        if request_stage(request, spider) == self.stage and not isinstance(exception, IgnoreRequest):
+            self.pool.report_exception(request, exception)
+        return None
+
     def save_failed_json(self, start_date, end_date, page, url, spider):
         """将失败的请求信息保存到 JSON 文件"""
         failed_data = {
@@ -232,36 +241,26 @@ class RotateProxyMiddleware:
 class DetailProxyMiddleware:
     MAX_RETRY_COUNT = 5  # 允许的最大重试次数
     FAILED_JSON_FILE = "failed_detail.json"  # 失败请求存储文件
+    stage = STAGE_DETAIL  # 只处理详情页请求
 
-    def __init__(self, api_url):
-        self.api_url = api_url
+    def __init__(self, pool, backoff=None):
+        self.pool = pool
+        self.backoff = backoff
         self.failed_urls = {}
 
     @classmethod
     def from_crawler(cls, crawler):
-        api_url = crawler.settings.get('PROXY_API_URL', '')
-        return cls(api_url)
-
-    def get_new_proxy(self):
-        """获取新的代理IP"""
-        return self.api_url  # 假设 API 直接返回代理地址
+        return cls(ProxyPool.from_crawler(crawler), BackoffScheduler.from_crawler(crawler))
 
     def process_request(self, request, spider):
-        max_retries = 10
-        retry_delay = 3
-        for attempt in range(max_retries):
-            try:
-                new_proxy = self.get_new_proxy()
-                request.meta['proxy'] = new_proxy
-                return
-            except Exception as e:
-                spider.custom_logger.error(f"获取代理失败，第 {attempt + 1} 次重试: {e}")
-                time.sleep(retry_delay)
-
-        spider.custom_logger.error("超过最大重试次数，放弃设置代理")
+        if claim_request(request, spider, self.stage):
+            set_proxy_or_backoff(self, request, spider)
 
     def process_response(self, request, response, spider):
         """处理403或其他错误状态，进行重试或记录失败URL"""
+        if request_stage(request, spider) != self.stage:
+            return response
+        self.pool.report_response(request, response)
         if response.status != 200:
             retry_times = request.meta.get('retry_times', 0)
 
@@ -270,12 +269,9 @@ class DetailProxyMiddleware:
                 retry_times += 1
                 new_request = request.copy()
                 new_request.meta['retry_times'] = retry_times
-                new_request.dont_filter = True  # 避免被 Scrapy 过滤掉
-                time.sleep(5)  # 避免请求过快
-                new_proxy = self.get_new_proxy()
-                new_request.meta['proxy'] = new_proxy
                 spider.custom_logger.warning(f"重试 {retry_times}/{self.MAX_RETRY_COUNT} - {request.url}，状态码: {response.status}")
-                return new_request
+                # 退避后重新入队，避免请求过快且不阻塞其他请求
+                raise self.backoff.reschedule(request, new_request, spider)
             else:
                 # 记录失败的请求
                 self.record_failed_request(request.url, response.status)
@@ -293,17 +289,17 @@ class DetailProxyMiddleware:
 
     def process_exception(self, request, exception, spider):
         """处理请求异常，例如代理失效"""
+        if request_stage(request, spider) != self.stage or isinstance(exception, IgnoreRequest):
+            return None
+        self.pool.report_exception(request, exception)
         retry_times = request.meta.get('retry_times', 0)
 
         if retry_times < self.MAX_RETRY_COUNT:
             retry_times += 1
             new_request = request.copy()
             new_request.meta['retry_times'] = retry_times
-            new_request.dont_filter = True
-            new_proxy = self.get_new_proxy()
-            new_request.meta['proxy'] = new_proxy
             spider.custom_logger.warning(f"请求异常 {exception}，重试 {retry_times}/{self.MAX_RETRY_COUNT} - {request.url}")
-            return new_request
+            raise self.backoff.reschedule(request, new_request, spider)
         else:
             self.record_failed_request(request.url, str(exception))
             spider.custom_logger.error(f"请求异常失败（已达最大重试次数）: {request.url} 异常: {exception}")
@@ -321,7 +317,6 @@ class DetailProxyMiddleware:
 import os
 from scrapy.exceptions import IgnoreRequest
 import json
-import time
 from scrapy.http import HtmlResponse
 from fake_useragent import UserAgent
 
@@ -329,56 +324,58 @@ from fake_useragent import UserAgent
 class AttachmentProxyMiddleware:
     MAX_RETRY_COUNT = 5  # 最大重试次数
     FAILED_JSON_FILE = "failed_attachment.json"
+    stage = STAGE_ATTACHMENT  # 只处理附件下载请求
 
-    def __init__(self, api_url):
-        self.api_url = api_url
+    def __init__(self, pool, backoff=None):
+        self.pool = pool
+        self.backoff = backoff
         self.failed_urls = {}
         self.ua = UserAgent()
 
     @classmethod
     def from_crawler(cls, crawler):
-        api_url = crawler.settings.get('PROXY_API_URL', '')
-        return cls(api_url)
-
-    def get_new_proxy(self):
-        """从 API 获取代理地址"""
-        # 可根据实际接口修改为请求远程 API
-        return self.api_url
+        return cls(ProxyPool.from_crawler(crawler), BackoffScheduler.from_crawler(crawler))
 
     def get_random_user_agent(self):
         """生成随机 User-Agent"""
         return self.ua.random
 
-    def set_proxy_and_ua(self, request, spider, max_attempts=5, retry_delay=2):
-        """为请求设置代理和 User-Agent，最多尝试 max_attempts 次"""
-        for attempt in range(1, max_attempts + 1):
-            try:
-                new_proxy = self.get_new_proxy()
-                random_ua = self.get_random_user_agent()
-                request.meta['proxy'] = new_proxy
-                request.headers['User-Agent'] = random_ua
-                # spider.custom_logger.info(f"✅ 使用代理: {new_proxy}，User-Agent: {random_ua}")
-                return  # 成功后退出
-            except Exception as e:
-                spider.custom_logger.warning(f"⚠️ 第 {attempt} 次设置代理/User-Agent 失败: {e}")
-                time.sleep(retry_delay)
-
-        spider.custom_logger.error(f"❌ 多次尝试设置代理和 User-Agent 均失败")
-
-    def process_request(self, request, spider):
-        """每个请求都设置代理和 User-Agent"""
-        self.set_proxy_and_ua(request, spider)
+    def set_proxy_and_ua(self, request, spider):
+        """为请求设置代理和 User-Agent，返回是否成功"""
+        try:
+            random_ua = self.get_random_user_agent()
+            new_proxy = self.pool.assign(request)
+        except Exception as e:
+            spider.custom_logger.warning(f"⚠️ 设置代理/User-Agent 失败: {e}")
+            return False
+        request.headers['User-Agent'] = random_ua
+        # spider.custom_logger.info(f"✅ 使用代理: {new_proxy}，User-Agent: {random_ua}")
+        return True
+
+    def process_request(self, request, spider, max_attempts=5):
+        """每个请求都设置代理和 User-Agent，失败时退避后重新调度"""
+        if not claim_request(request, spider, self.stage) or self.set_proxy_and_ua(request, spider):
+            return
+        attempts = request.meta.get('proxy_attempts', 0) + 1
+        if attempts >= max_attempts:
+            spider.custom_logger.error(f"❌ 多次尝试设置代理和 User-Agent 均失败")
+            return
+        retry_request = request.copy()
+        retry_request.meta['proxy_attempts'] = attempts
+        raise self.backoff.reschedule(request, retry_request, spider)
 
     def process_response(self, request, response, spider):
         """请求失败时更换代理和 UA 并重试"""
+        if request_stage(request, spider) != self.stage:
+            return response
+        self.pool.report_response(request, response)
         if response.status in [403, 429, 500, 502, 503, 504]:
             retry_count = request.meta.get("retry_count", 0)
             if retry_count < self.MAX_RETRY_COUNT:
                 retry_request = request.copy()
                 retry_request.meta["retry_count"] = retry_count + 1
-                self.set_proxy_and_ua(retry_request, spider)
                 spider.custom_logger.warning(f"⚠️ 第 {retry_count + 1} 次重试请求: {request.url},文件名: {request.meta.get('file_name')}")
-                return retry_request
+                raise self.backoff.reschedule(request, retry_request, spider)
 
             # 达到最大重试次数
             self.failed_urls[request.url] = retry_count + 1
@@ -395,6 +392,11 @@ class AttachmentProxyMiddleware:
 
         return response
 
+    def process_exception(self, request, exception, spider):
+        if request_stage(request, spider) == self.stage and not isinstance(exception, IgnoreRequest):
+            self.pool.report_exception(request, exception)
+        return None
+
     def save_failed_urls(self, spider):
         """保存失败的 URL 到 JSON"""
         if self.failed_urls:
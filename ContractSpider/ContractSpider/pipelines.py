@@ -4,56 +4,157 @@ from scrapy.exceptions import DropItem
 
 
 import os
+import shutil
+import time
 import pandas as pd
 from openpyxl import load_workbook
 from pathlib import Path
 from typing import Optional
 
+from twisted.internet import defer, task
+
+from ContractSpider.items import ContractItem, DetailItem
+from ContractSpider.utils.buffered_writer import BufferedWriter, BufferFlushError
+from ContractSpider.utils.checkpoint import KIND_DETAIL
 from ContractSpider.utils.excel_writer import append_df_to_excel, has_data_in_sheet
+from ContractSpider.utils.file_lock import FileLock
+from ContractSpider.utils.stages import STAGE_CONTRACT, STAGE_DETAIL, stage_checkpoint
+from ContractSpider.utils.storage import FORMAT_PARQUET, FORMAT_XLSX, ParquetPartitionWriter, parse_formats
+
+
+def retry_until_saved(attempt, timeout: float, interval: float = 1.0):
+    """
+    爬虫结束时反复调用 attempt()（返回是否已全部写入），直到成功或超过 timeout 秒（None 表示一直重试）。
+    其他进程持有文件锁时不阻塞 reactor，两次尝试之间让出；返回 Deferred，结果为是否全部写入。
+    """
+    from twisted.internet import reactor
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    @defer.inlineCallbacks
+    def run():
+        while not attempt():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            yield task.deferLater(reactor, interval, lambda: None)
+        return True
+
+    return run()
 
 
 class ContractPipeline:
 
-    def __init__(self):
+    def __init__(self, flush_rows: int = 200, flush_interval: float = 30, formats=(FORMAT_XLSX,),
+                 lock_timeout: Optional[float] = None):
         # 存储目录
         self.base_folder = "downloads"
         os.makedirs(self.base_folder, exist_ok=True)
+        # 爬虫结束时，等待其他进程释放日文件锁的最长时间；爬取期间不等待，写不进去的数据留在缓存中下次再写
+        self.lock_timeout = lock_timeout
+
+        # 按文件缓存合同数据，每种存储格式一个缓存，批量写入
+        self.flush_interval = flush_interval
+        self.writers = []
+        retry_interval = flush_interval or 30  # 写入失败后，达到缓存阈值时也要间隔这么久才再次自动刷新
+        if FORMAT_XLSX in formats:
+            self.writers.append(BufferedWriter(self.write_frame, max_rows=flush_rows, retry_interval=retry_interval))
+        if FORMAT_PARQUET in formats:
+            parquet = ParquetPartitionWriter(self.base_folder)
+            self.writers.append(BufferedWriter(parquet.write, max_rows=flush_rows, retry_interval=retry_interval))
+        self.flush_task = None
+        self.spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            flush_rows=crawler.settings.getint("CONTRACT_FLUSH_ROWS", 200),
+            flush_interval=crawler.settings.getfloat("CONTRACT_FLUSH_INTERVAL", 30),
+            formats=parse_formats(crawler.settings.get("STORAGE_FORMATS", [FORMAT_XLSX])),
+            lock_timeout=crawler.settings.getfloat("FILE_LOCK_TIMEOUT", 120),
+        )
+
+    def open_spider(self, spider):
+        self.spider = spider
+        if self.flush_interval > 0:
+            # 定时刷新，避免数据长时间停留在内存中
+            self.flush_task = task.LoopingCall(self.flush, spider)
+            self.flush_task.start(self.flush_interval, now=False)
+
+    def close_spider(self, spider):
+        if self.flush_task and self.flush_task.running:
+            self.flush_task.stop()
+        d = retry_until_saved(lambda: self.flush(spider), self.lock_timeout)
+        d.addCallback(self.report_unsaved, spider)
+        return d
+
+    def report_unsaved(self, saved, spider):
+        if not saved:
+            unsaved = max(writer.pending_rows for writer in self.writers)
+            spider.custom_logger.error(f"等待 {self.lock_timeout}s 后仍有 {unsaved} 条合同数据未能保存")
 
     def process_item(self, item, spider):
         # spider.custom_logger.info(f"收到合同数据: {item}")
+        if not isinstance(item, ContractItem):
+            return item  # 合并爬取时由其他管道处理
         file_path = item.get("file_path")
         if not file_path:
             spider.custom_logger.error("缺少文件路径，跳过保存")
             return item  # 跳过无效数据
 
-        # 将数据转换为 DataFrame
-        data = {
-            "签订日期": [item["sign_date"]],
-            "发布时间": [item["publish_date"]],
-            "采购人": [item["purchaser"]],
-            "供应商": [item["supplier"]],
-            "代理机构": [item["agent"]],
-            "合同名称": [item["contract_name"]],
-            "项目名称": [item["project_name"]],
-            "网页链接": [item["contract_link"]],
+        # 缓存数据，达到阈值时批量写入
+        row = {
+            "签订日期": item["sign_date"],
+            "发布时间": item["publish_date"],
+            "采购人": item["purchaser"],
+            "供应商": item["supplier"],
+            "代理机构": item["agent"],
+            "合同名称": item["contract_name"],
+            "项目名称": item["project_name"],
+            "网页链接": item["contract_link"],
         }
-
-        df = pd.DataFrame(data)
-
-        # 获取 pandas 版本
-        pandas_version = pd.__version__
-
-        header_needed = not has_data_in_sheet(file_path, sheet_name="Contracts")
-
-        # 根据 pandas 版本选择写入方式
-        if self.is_pandas_version_less_than("1.4.0", pandas_version):
-            append_df_to_excel(file_path, df, sheet_name="Contracts", header=header_needed)
-        else:
-            self.append_data_to_excel(spider=spider, filename=file_path, df=df, sheet_name="Contracts")
-
-        spider.custom_logger.info(f"保存合同数据: {file_path}")
+        flushed = False
+        for writer in self.writers:
+            try:
+                flushed = writer.append(file_path, row) > 0 or flushed
+            except BufferFlushError as e:
+                spider.custom_logger.error(f"批量保存合同数据失败，稍后重试: {e}")
+        if flushed:
+            self.commit_checkpoint(spider)
         return item
 
+    def flush(self, spider) -> bool:
+        """将缓存的合同数据写入各存储格式，返回缓存是否已全部写入"""
+        for writer in self.writers:
+            try:
+                written = writer.flush()
+            except BufferFlushError as e:
+                spider.custom_logger.error(f"批量保存合同数据失败，稍后重试: {e}")
+                continue
+            if written:
+                spider.custom_logger.info(f"批量保存合同数据 {written} 条")
+        self.commit_checkpoint(spider)
+        return not any(writer.pending_rows for writer in self.writers)
+
+    def commit_checkpoint(self, spider):
+        """缓存全部写入后提交断点，此时已标记完成的分页数据均已落盘"""
+        checkpoint = stage_checkpoint(spider, STAGE_CONTRACT)
+        if checkpoint is not None and not any(writer.pending_rows for writer in self.writers):
+            checkpoint.commit()
+
+    def write_frame(self, file_path: str, df: pd.DataFrame):
+        """
+        将一批数据追加到指定的 Excel 文件，读-改-写在文件锁内完成，多个进程写同一日文件时不会丢行；
+        锁被占用时不等待，抛出 FileLockTimeout，这批数据留在缓存中下次刷新时再写
+        """
+        with FileLock(file_path, timeout=0):
+            # 根据 pandas 版本选择写入方式
+            if self.is_pandas_version_less_than("1.4.0", pd.__version__):
+                header_needed = not has_data_in_sheet(file_path, sheet_name="Contracts")
+                append_df_to_excel(file_path, df, sheet_name="Contracts", header=header_needed)
+            else:
+                self.append_data_to_excel(spider=self.spider, filename=file_path, df=df, sheet_name="Contracts")
+        self.spider.custom_logger.info(f"保存合同数据 {len(df)} 条: {file_path}")
+
     def is_pandas_version_less_than(self, version_str: str, current_version: str) -> bool:
         """
         Helper function to compare pandas version.
@@ -66,30 +167,59 @@ class ContractPipeline:
         - 如果文件存在且表存在：追加数据（不写表头）
         - 如果文件存在但表不存在：创建表（写表头）
         - 如果文件不存在：创建文件和表（写表头）
+        先写入临时文件再原子替换，中途被杀不会损坏原文件
         """
-        # **保存到 Excel**
-        if os.path.exists(filename):
-            # 文件已存在时，追加数据
-            with pd.ExcelWriter(filename, mode="a", if_sheet_exists="overlay", engine="openpyxl") as writer:
-                df.to_excel(writer, index=False, sheet_name="Contracts", header=False,
-                            startrow=writer.sheets["Contracts"].max_row)
-        else:
-            # 文件不存在时，创建新文件
-            df.to_excel(filename, index=False, sheet_name="Contracts")
+        tmp_path = f"{filename}.tmp"
+        try:
+            # **保存到 Excel**
+            if os.path.exists(filename):
+                # 文件已存在时，在副本上追加数据
+                # 临时文件名不是 .xlsx 结尾，传入文件对象，否则 pandas 无法按扩展名选择引擎
+                shutil.copyfile(filename, tmp_path)
+                with open(tmp_path, "r+b") as f, \
+                        pd.ExcelWriter(f, mode="a", if_sheet_exists="overlay", engine="openpyxl") as writer:
+                    df.to_excel(writer, index=False, sheet_name="Contracts", header=False,
+                                startrow=writer.sheets["Contracts"].max_row)
+            else:
+                # 文件不存在时，创建新文件
+                with open(tmp_path, "wb") as f:
+                    df.to_excel(f, index=False, sheet_name="Contracts", engine="openpyxl")
+            os.replace(tmp_path, filename)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
 
 
 
 import pandas as pd
-from packaging import version
 from openpyxl import load_workbook
 from datetime import datetime
 import os
 from scrapy.exceptions import DropItem
 
+from ContractSpider.utils.xlsx_stream import StreamingWorkbook
+
+
 class DetailPipeline:
-    def __init__(self):
+    def __init__(self, commit_rows: int = 500, formats=(FORMAT_XLSX,), lock_timeout: Optional[float] = None):
         self.base_folder = "detail_downloads"
         os.makedirs(self.base_folder, exist_ok=True)
+        # 爬虫结束时，等待其他进程释放日文件锁的最长时间；爬取期间不等待，提交不了的日文件之后再提交
+        self.lock_timeout = lock_timeout
+
+        # 每个日文件一个流式工作簿，写满 commit_rows 行或爬虫结束时提交
+        self.sheet_name = "Details"
+        self.commit_rows = commit_rows
+        self.use_xlsx = FORMAT_XLSX in formats
+        self.workbooks = {}
+        self.pending_links = {}  # 每个日文件自上次提交以来写入的详情链接
+
+        # Parquet 按天分区，随日文件一起提交，每次提交写一个 part 文件
+        self.parquet_writer = None
+        if FORMAT_PARQUET in formats:
+            parquet = ParquetPartitionWriter(self.base_folder)
+            self.parquet_writer = BufferedWriter(parquet.write, max_rows=0)
 
         self.headers_map = {
             "contract_number": "合同编号",
@@ -112,11 +242,22 @@ class DetailPipeline:
             "contract_sign_date": "合同签订日期",
             "contract_announcement_date": "合同公告日期",
             "attachment_name": "附件名称",
-            "attachment_download_url": "附件下载链接"
+            "attachment_download_url": "附件下载链接",
+            "contract_link": "网页链接"
         }
 
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            commit_rows=crawler.settings.getint("DETAIL_COMMIT_ROWS", 500),
+            formats=parse_formats(crawler.settings.get("STORAGE_FORMATS", [FORMAT_XLSX])),
+            lock_timeout=crawler.settings.getfloat("FILE_LOCK_TIMEOUT", 120),
+        )
+
     def process_item(self, item, spider):
         # spider.custom_logger.info(f"[DetailPipeline] 接收详情数据: {item}")
+        if not isinstance(item, DetailItem):
+            return item  # 合并爬取时由其他管道处理
 
         # 校验和解析公告日期
         announce_date_str = item.get("contract_announcement_date", "")
@@ -139,31 +280,84 @@ class DetailPipeline:
         if isinstance(item.get("attachment_download_url"), list):
             item["attachment_download_url"] = ", ".join(item["attachment_download_url"])
 
-        # 映射字段生成 DataFrame
-        item_dict = {
+        # 映射字段
+        row = {
             self.headers_map[k]: v for k, v in dict(item).items() if k in self.headers_map
         }
-        df = pd.DataFrame([item_dict])
-
-        # 判断是否存在表头
-        sheet_name = "Details"
-        file_exists = os.path.exists(file_path)
-        sheet_has_data = has_data_in_sheet(file_path, sheet_name=sheet_name)
-
-        header = not sheet_has_data  # 有数据则不写表头
-
-        # Pandas 版本判断
-        if version.parse(pd.__version__) < version.parse("1.4.0"):
-            append_df_to_excel(file_path, df, sheet_name=sheet_name, header=header)
-        else:
-            # 判断文件是否存在
-            if os.path.exists(file_path):
-                with pd.ExcelWriter(file_path, mode="a", if_sheet_exists="overlay", engine="openpyxl") as writer:
-                    df.to_excel(writer, index=False, sheet_name="Details", header=False,
-                                startrow=writer.sheets["Details"].max_row)
-            else:
-                df.to_excel(file_path, index=False, sheet_name="Details")
 
-        return item
+        if self.parquet_writer is not None:
+            self.parquet_writer.append(file_path, row)
+
+        if self.use_xlsx:
+            workbook = self.workbooks.get(file_path)
+            if workbook is None:
+                workbook = StreamingWorkbook(file_path, self.sheet_name, list(self.headers_map.values()))
+                self.workbooks[file_path] = workbook
+            workbook.append(row)
+
+        # 定期提交，限制异常退出时丢失的数据量
+        links = self.pending_links.setdefault(file_path, [])
+        links.append(item.get("contract_link"))
+        if self.commit_rows and len(links) >= self.commit_rows:
+            self.commit(file_path, spider)
 
+        return item
 
+    def commit(self, file_path, spider) -> bool:
+        """
+        提交单个日文件，各格式都写入成功后再记录断点，返回是否提交成功。
+        失败（锁被其他进程占用或写入出错）时数据与详情链接保留，下次提交或爬虫结束时重试
+        """
+        links = self.pending_links.get(file_path, [])
+
+        workbook = self.workbooks.get(file_path)
+        if workbook is not None:
+            try:
+                if not workbook.commit():
+                    spider.custom_logger.warning(f"{file_path} 正被其他进程写入，稍后重新提交")
+                    return False
+            except Exception as e:
+                spider.custom_logger.error(f"保存详情数据失败，稍后重试 {file_path}: {e}")
+                return False
+            del self.workbooks[file_path]
+            if workbook.merged:
+                spider.custom_logger.info(f"其他进程在此期间写入过 {file_path}，已合并")
+
+        if self.parquet_writer is not None:
+            try:
+                self.parquet_writer.flush(file_path)
+            except BufferFlushError as e:
+                spider.custom_logger.error(f"保存详情数据失败，稍后重试 {file_path}: {e}")
+                return False
+
+        del self.pending_links[file_path]
+        spider.custom_logger.info(f"保存详情数据 {len(links)} 条: {file_path}")
+
+        links = [link for link in links if link]
+        checkpoint = stage_checkpoint(spider, STAGE_DETAIL)
+        if checkpoint is not None:
+            checkpoint.mark_many(KIND_DETAIL, links)
+            checkpoint.commit()
+        detail_index = getattr(spider, "detail_index", None)
+        if detail_index is not None:
+            detail_index.add_links(links)
+        return True
+
+    def commit_all(self, spider) -> bool:
+        results = [self.commit(file_path, spider) for file_path in list(self.pending_links)]
+        return all(results)
+
+    def close_spider(self, spider):
+        d = retry_until_saved(lambda: self.commit_all(spider), self.lock_timeout)
+        d.addCallback(self.report_unsaved, spider)
+        return d
+
+    def report_unsaved(self, saved, spider):
+        if saved:
+            return
+        unsaved = sum(len(links) for links in self.pending_links.values())
+        spider.custom_logger.error(f"等待 {self.lock_timeout}s 后仍有 {unsaved} 条详情数据未能保存: "
+                                   f"{', '.join(self.pending_links)}")
+        for workbook in self.workbooks.values():
+            workbook.abort()
+        self.workbooks.clear()
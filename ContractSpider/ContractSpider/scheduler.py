@@ -0,0 +1,209 @@
+# 分布式调度：多个进程 / 机器上的同名爬虫共享请求队列与去重集合（存储后端见 utils/shared_queue.py）
+#
+# 启用：scrapy crawl detail -s SCHEDULER=ContractSpider.scheduler.SharedScheduler
+#   - 请求通过 Request.to_dict() 序列化后入队，回调与 errback 必须是爬虫的方法
+#   - 种子节点（SHARED_QUEUE_SEED = True，默认）运行 start_requests() 读取起始任务；
+#     其他节点设置 SHARED_QUEUE_SEED = False，只从共享队列取任务（见 SharedQueueWorkerMiddleware）
+#   - 共享队列持续为空 SHARED_QUEUE_IDLE_TIMEOUT 秒后才结束，期间其他节点的在途请求仍可能产生新请求
+#   - 去重集合跨运行保留；开始新的任务时在种子节点上设置 SHARED_QUEUE_FLUSH = True 清空队列与去重集合
+#   - 出队的请求是租出的，回调 / errback 执行完（engine 将其移出处理中的请求）后才从共享队列删除；
+#     处理期间定期续租。节点崩溃或被杀时，它租出的请求在 SHARED_QUEUE_VISIBILITY_TIMEOUT 秒后
+#     放回队列，由其他节点（或重新启动的节点）处理
+
+import pickle
+import time
+
+from scrapy import signals
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+from scrapy.utils.misc import load_object
+from scrapy.utils.request import request_from_dict
+
+from ContractSpider.utils.shared_queue import open_backend
+
+
+def queue_name(crawler) -> str:
+    """共享队列名：SHARED_QUEUE_NAME，未设置时为爬虫名（同名爬虫共用一个队列）"""
+    return crawler.settings.get("SHARED_QUEUE_NAME") or crawler.spider.name
+
+
+class SharedDupeFilter(BaseDupeFilter):
+    """去重集合保存在共享存储中；也可以单独通过 DUPEFILTER_CLASS 与 Scrapy 自带的调度器一起使用"""
+
+    def __init__(self, backend, fingerprinter, name: str, debug: bool = False, owns_backend: bool = False):
+        self.backend = backend
+        self.fingerprinter = fingerprinter
+        self.name = name
+        self.debug = debug
+        self.owns_backend = owns_backend
+        self.logdupes = True
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(open_backend(crawler.settings), crawler.request_fingerprinter, queue_name(crawler),
+                   debug=crawler.settings.getbool("DUPEFILTER_DEBUG"), owns_backend=True)
+
+    def request_seen(self, request) -> bool:
+        return not self.backend.add_seen(self.name, self.fingerprinter.fingerprint(request).hex())
+
+    def log(self, request, spider):
+        if self.debug:
+            spider.custom_logger.debug(f"[去重] 过滤重复请求: {request}")
+        elif self.logdupes:
+            spider.custom_logger.info(f"[去重] 过滤重复请求: {request}（之后不再逐条记录，设置 DUPEFILTER_DEBUG 可显示全部）")
+            self.logdupes = False
+        spider.crawler.stats.inc_value("dupefilter/filtered", spider=spider)
+
+    def close(self, reason):
+        if self.owns_backend:
+            self.backend.close()
+
+
+class SharedScheduler(BaseScheduler):
+    """按优先级从共享队列出队；不经过内存或磁盘队列，所有节点看到的是同一份待处理请求"""
+
+    REQUEUE_INTERVAL = 10  # 检查过期租约的间隔（秒）
+
+    def __init__(self, crawler, backend, dupefilter, name: str, idle_timeout: float = 60, flush: bool = False,
+                 visibility_timeout: float = 300):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.backend = backend
+        self.dupefilter = dupefilter
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self.flush = flush
+        self.visibility_timeout = visibility_timeout
+        self.spider = None
+        self.last_active = time.monotonic()
+        self.leases = {}  # 本节点租出、尚未处理完的请求 -> 共享队列中的项目 id
+        self.last_renew = time.monotonic()
+        self.last_requeue = 0.0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        backend = open_backend(settings)
+        name = queue_name(crawler)
+        dupefilter = SharedDupeFilter(backend, crawler.request_fingerprinter, name,
+                                      debug=settings.getbool("DUPEFILTER_DEBUG"))
+        scheduler = cls(
+            crawler, backend, dupefilter, name,
+            idle_timeout=settings.getfloat("SHARED_QUEUE_IDLE_TIMEOUT", 60),
+            flush=settings.getbool("SHARED_QUEUE_FLUSH"),
+            visibility_timeout=settings.getfloat("SHARED_QUEUE_VISIBILITY_TIMEOUT", 300),
+        )
+        crawler.signals.connect(scheduler.spider_idle, signal=signals.spider_idle)
+        return scheduler
+
+    def open(self, spider):
+        self.spider = spider
+        spider.shared_queue = True
+        if self.flush:
+            self.backend.clear(self.name)
+            spider.custom_logger.info(f"[分布式] 已清空共享队列与去重集合: {self.name}")
+        spider.custom_logger.info(f"[分布式] 共享队列 {self.name}，待处理请求 {self.backend.size(self.name)} 个（含各节点正在处理的请求）")
+        self.last_active = time.monotonic()
+        return self.dupefilter.open()
+
+    def close(self, reason):
+        self.release_finished()
+        if self.leases:
+            # 强制结束时仍在处理的请求立即归还，其他节点不必等到租约到期
+            self.backend.touch(self.name, self.leases.values(), 0)
+            self.spider.custom_logger.warning(f"[分布式] {len(self.leases)} 个请求未处理完，已放回共享队列")
+            self.leases.clear()
+        self.dupefilter.close(reason)
+        self.backend.close()
+
+    def has_pending_requests(self) -> bool:
+        return self.backend.has_items(self.name)
+
+    def enqueue_request(self, request) -> bool:
+        if not request.dont_filter and self.dupefilter.request_seen(request):
+            self.dupefilter.log(request, self.spider)
+            return False
+        data = pickle.dumps(request.to_dict(spider=self.spider), protocol=4)
+        self.backend.push(self.name, data, request.priority)
+        self.last_active = time.monotonic()
+        self.stats.inc_value("scheduler/enqueued/shared", spider=self.spider)
+        self.stats.inc_value("scheduler/enqueued", spider=self.spider)
+        return True
+
+    def next_request(self):
+        self.release_finished()
+        self.requeue_expired()
+        while True:
+            popped = self.backend.pop(self.name, self.visibility_timeout)
+            if popped is None:
+                return None
+            item_id, data = popped
+            self.last_active = time.monotonic()
+            try:
+                request = request_from_dict(pickle.loads(data), spider=self.spider)
+            except Exception as e:
+                # 例如其他节点运行的爬虫版本不同、回调已不存在；丢弃该请求，继续取下一个
+                self.spider.custom_logger.error(f"[分布式] 无法还原共享队列中的请求，已丢弃: {e}")
+                self.stats.inc_value("scheduler/unserializable", spider=self.spider)
+                self.backend.ack(self.name, [item_id])
+                continue
+            self.leases[request] = item_id
+            self.stats.inc_value("scheduler/dequeued/shared", spider=self.spider)
+            self.stats.inc_value("scheduler/dequeued", spider=self.spider)
+            return request
+
+    def release_finished(self):
+        """
+        确认已处理完的请求：engine 在回调 / errback 的输出（新请求、item）全部处理后才将请求移出 inprogress，
+        此时再从共享队列删除，崩溃时不会丢失回调尚未产出的请求；仍在处理的请求定期续租
+        """
+        if not self.leases:
+            return
+        slot = self.crawler.engine.slot
+        inprogress = slot.inprogress if slot is not None else ()
+        finished = [request for request in self.leases if request not in inprogress]
+        if finished:
+            self.backend.ack(self.name, [self.leases.pop(request) for request in finished])
+        now = time.monotonic()
+        if self.leases and now - self.last_renew >= self.visibility_timeout / 3:
+            self.backend.touch(self.name, self.leases.values(), self.visibility_timeout)
+            self.last_renew = now
+
+    def requeue_expired(self):
+        """定期将租约过期的请求（处理它们的节点已退出）放回队列"""
+        now = time.monotonic()
+        if now - self.last_requeue < self.REQUEUE_INTERVAL:
+            return
+        self.last_requeue = now
+        requeued = self.backend.requeue_expired(self.name)
+        if requeued:
+            self.last_active = now
+            self.spider.custom_logger.warning(f"[分布式] {requeued} 个请求的租约已过期（处理它们的节点可能已退出），重新放回队列")
+            self.stats.inc_value("scheduler/requeued/shared", requeued, spider=self.spider)
+
+    def __len__(self) -> int:
+        return self.backend.size(self.name)
+
+    def spider_idle(self, spider):
+        """共享队列暂时为空时继续等待一段时间，其他节点的在途请求仍可能产生新请求"""
+        if time.monotonic() - self.last_active < self.idle_timeout:
+            raise DontCloseSpider
+
+
+class SharedQueueWorkerMiddleware:
+    """
+    爬虫中间件：使用 SharedScheduler 且 SHARED_QUEUE_SEED = False 时丢弃起始请求，
+    start_requests() 不会执行（不读取本机的数据文件），节点只处理共享队列中的请求。
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if settings.getbool("SHARED_QUEUE_SEED", True) or not issubclass(load_object(settings["SCHEDULER"]), SharedScheduler):
+            raise NotConfigured
+        return cls()
+
+    def process_start_requests(self, start_requests, spider):
+        spider.custom_logger.info("[分布式] 工作节点：不读取起始请求，只从共享队列取任务")
+        return iter(())
@@ -99,20 +99,129 @@ FEED_EXPORT_ENCODING = "utf-8"
 CONTRACT_START_DATE = "2024-10-01"
 CONTRACT_END_DATE = "2024-10-28"
 
+# 搜索页分页模式：serial 逐页翻页；parallel 获取总页数后按窗口并发调度
+CONTRACT_PAGING_MODE = "parallel"
+CONTRACT_PAGE_WINDOW = 8  # 同时在途的最大页数，0 表示一次性调度全部页
+CONTRACT_MISSING_ROUNDS = 1  # 所有页结束后对缺页的补抓轮数
+# 搜索日期拆分：none 不拆分；day 按天拆分；adaptive 窗口内合同数超过阈值时对半拆分（最小到一天）
+# 拆分后各窗口独立获取总数并并发翻页
+CONTRACT_SHARD_MODE = "adaptive"
+CONTRACT_SHARD_MAX_COUNT = 2000
+
+# 断点续爬：记录已完成的分页、详情链接与附件 UUID，重启后只抓取剩余部分
+CHECKPOINT_ENABLED = True
+CHECKPOINT_PATH = "logs/checkpoint.sqlite3"
+
+# 数据存储格式：xlsx / parquet，可同时写入多种格式（parquet 需安装 pyarrow）
+STORAGE_FORMATS = ["xlsx"]
+# 下游读取时的格式优先级（详情页读取搜索页结果、附件页读取详情页结果）
+STORAGE_READ_FORMATS = ["parquet", "xlsx"]
+# 下游按块读取数据文件的行数，链接边读边发请求，不一次性载入整个日期范围
+STORAGE_READ_CHUNK_SIZE = 10000
+
+# 搜索页结果批量写入：缓存行数达到阈值或间隔秒数到达时写入 Excel
+CONTRACT_FLUSH_ROWS = 200
+CONTRACT_FLUSH_INTERVAL = 30
+
 # 详情页时间范围 需前者已经爬取
 DETAIL_START_DATE = "2025-03-10"
 DETAIL_END_DATE = "2025-03-11"
 
+# 详情页增量抓取：跳过 detail_downloads 中已存在的合同（按合同 UUID 判断）
+DETAIL_INCREMENTAL = False
+DETAIL_INDEX_PATH = "logs/detail_index.sqlite3"
+
+# 详情页流式写入：每个日文件写入该行数后提交一次（0 表示仅在爬虫结束时提交）
+DETAIL_COMMIT_ROWS = 500
+
+# 多个进程写同一日文件（并行回填、重叠日期的多次运行）时通过 {文件}.lock 串行化；爬取期间锁被占用时不等待，
+# 数据留在内存中稍后重试，爬虫结束时最多再等待该秒数，仍写不进去的数据记录为错误
+FILE_LOCK_TIMEOUT = 120
+
 # 附件页时间范围 需前者已经爬取
 ATTACHMENT_START_DATE = "2022-11-01"
 ATTACHMENT_END_DATE = "2022-11-02"
 
+# 附件完整性校验在独立进程中执行：进程数（0 表示在爬虫进程内校验）与同时排队的校验数上限
+ATTACHMENT_VERIFY_WORKERS = 2
+ATTACHMENT_VERIFY_MAX_PENDING = 16
+# 附件先做只读文件头尾的快速检查，通过后按扩展名抽样做完整解析；可疑文件（续传拼接、大小未知）总是完整校验
+ATTACHMENT_VERIFY_FULL_RATES = {
+    ".pdf": 0.05,
+    ".zip": 0.05,
+    ".docx": 0.05,
+    ".xlsx": 0.05,
+    ".xls": 0,  # OLE 格式只做文件头检查，不做完整解析
+    ".doc": 0,
+    ".rar": 1.0,  # RAR 快速检查只能确认文件头
+    ".txt": 1.0,
+}
+ATTACHMENT_VERIFY_DEFAULT_FULL_RATE = 0.05
+
 ROBOTSTXT_OBEY = False  # 是否遵守 robots.txt 规则
 DOWNLOAD_DELAY = 5  # 避免被封，延迟 2 秒
 CONCURRENT_REQUESTS = 8  # 并发数
 COOKIES_ENABLED = False  # 禁用 Cookies
 LOG_ENABLED = False
 
+# 合并爬取（scrapy crawl chain）时各阶段使用独立的下载槽，分别限制并发数与下载延迟；
+# 启用自适应限速时作为各阶段的初始值，之后在 ADAPTIVE_THROTTLE_TARGETS 的范围内调整
+DOWNLOAD_SLOTS = {
+    "contract": {"concurrency": 2, "delay": 5},
+    "detail": {"concurrency": 4, "delay": 2},
+    "attachment": {"concurrency": 4, "delay": 1},
+}
+
+EXTENSIONS = {
+    'ContractSpider.extensions.AdaptiveThrottle': 500,
+    'ContractSpider.extensions.StatsFile': 510,
+}
+
+# 设置 STATS_FILE 时定期将 stats 写入该 JSON 文件（回填启动器为每个进程单独设置）
+STATS_FILE = ""
+STATS_FILE_INTERVAL = 10
+
+# 按主机自适应限速（AIMD）：正常响应时逐步提高并发、缩短延迟；403/429/503、空响应或延迟过高时并发减半、延迟翻倍。
+# 启用后 DOWNLOAD_DELAY 只作为未启用时的回退值，CONCURRENT_REQUESTS 仍是总并发上限。
+ADAPTIVE_THROTTLE_ENABLED = True
+ADAPTIVE_THROTTLE_DEFAULTS = {
+    "start_concurrency": 2,
+    "min_concurrency": 1,
+    "max_concurrency": 8,
+    "start_delay": 5.0,
+    "min_delay": 1.0,
+    "max_delay": 60.0,
+    "delay_step": 0.1,  # 每个正常响应缩短的延迟（秒）
+    "target_latency": 3.0,  # 平均延迟不超过该值才继续加速
+    "max_latency": 15.0,  # 平均延迟超过该值视同被限流
+    "decrease_factor": 0.5,
+    "decrease_interval": 10.0,  # 同一主机两次减速的最小间隔（秒）
+}
+# 按爬虫名或主机名覆盖上面的参数，主机名优先
+ADAPTIVE_THROTTLE_TARGETS = {
+    "contract": {"max_concurrency": 4, "min_delay": 2.0},  # 搜索接口对频率最敏感
+    "detail": {"max_concurrency": 8, "min_delay": 1.0},
+    "attachment": {"max_concurrency": 8, "min_delay": 0.5, "target_latency": 10.0, "max_latency": 60.0},
+    "download.ccgp.gov.cn": {"target_latency": 10.0, "max_latency": 60.0},  # 附件服务器首包响应较慢
+}
+
+# 分布式爬取：多个进程 / 机器上的同名爬虫共享请求队列与去重集合，按需通过命令行启用
+# scrapy crawl detail -s SCHEDULER=ContractSpider.scheduler.SharedScheduler
+#SCHEDULER = "ContractSpider.scheduler.SharedScheduler"
+SHARED_QUEUE_BACKEND = "sqlite"  # sqlite：同一台机器的多个进程；redis：多台机器（需安装 redis）
+SHARED_QUEUE_SQLITE_PATH = "logs/shared_queue.sqlite3"
+SHARED_QUEUE_REDIS_URL = "redis://localhost:6379/0"
+SHARED_QUEUE_NAME = ""  # 队列名，为空时使用爬虫名
+SHARED_QUEUE_SEED = True  # 是否运行 start_requests() 读取起始任务，工作节点设置为 False
+SHARED_QUEUE_FLUSH = False  # 启动时清空队列与去重集合，开始新的任务时在种子节点上设置
+SHARED_QUEUE_IDLE_TIMEOUT = 60  # 队列持续为空多少秒后结束
+# 出队的请求处理完才从队列删除，处理期间自动续租；节点崩溃后它未处理完的请求在该秒数后放回队列
+SHARED_QUEUE_VISIBILITY_TIMEOUT = 300
+
+SPIDER_MIDDLEWARES = {
+    'ContractSpider.scheduler.SharedQueueWorkerMiddleware': 10,
+}
+
 ITEM_PIPELINES = {
     'ContractSpider.pipelines.ContractPipeline': 300, # 搜索页管道
     'ContractSpider.pipelines.DetailPipeline': 400, # 详情页管道
@@ -130,6 +239,19 @@ PROXY_API_URL = "http://%(user)s:%(password)s@%(server)s" % {
     "server": proxyAddr,
 }  # 代理API URL，返回新的IP
 
+# 代理池：static 使用上面的隧道代理；api 定时从 PROXY_FETCH_URL 拉取代理列表；stub 使用固定列表（本地测试）
+PROXY_PROVIDER = "static"
+PROXY_FETCH_URL = ""
+PROXY_URL_TEMPLATE = "http://%(user)s:%(password)s@{server}" % {"user": authKey, "password": password}
+PROXY_FETCH_INTERVAL = 60
+PROXY_STUB_LIST = []
+PROXY_POOL_MIN_SIZE = 1
+PROXY_MAX_BANS = 3  # 403/407/空响应达到该次数即淘汰
+PROXY_MAX_CONSECUTIVE_FAILURES = 5
+PROXY_MIN_SUCCESS_RATE = 0.3  # 请求数达到 PROXY_MIN_SAMPLES 后成功率低于该值即淘汰
+PROXY_MIN_SAMPLES = 10
+PROXY_EVICT_COOLDOWN = 300  # 淘汰后多少秒内不再使用
+
 DOWNLOADER_MIDDLEWARES = {
     'ContractSpider.middlewares.RotateProxyMiddleware': 400,  # 搜索页中间件
     'ContractSpider.middlewares.DetailProxyMiddleware': 500,  # 详情页中间件
@@ -138,6 +260,10 @@ DOWNLOADER_MIDDLEWARES = {
 
 }
 
+# 中间件重试的退避参数：第 n 次重试在 [0, min(MAX, BASE * 2^n)] 秒内随机延迟后重新入队
+BACKOFF_BASE_DELAY = 2.0
+BACKOFF_MAX_DELAY = 60.0
+
 RETRY_ENABLED = True
 RETRY_TIMES = 5
 RETRY_HTTP_CODES = [403, 404, 407, 500, 502, 503, 504]
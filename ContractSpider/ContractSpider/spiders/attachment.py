@@ -1,8 +1,8 @@
-import glob
+import hashlib
 import os
 import json
 import logging
-import zipfile
+import random
 
 import scrapy
 import pandas as pd
@@ -12,25 +12,27 @@ from fake_useragent import UserAgent
 from filetype import filetype
 from scrapy.utils.project import get_project_settings
 from tqdm import tqdm
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, unquote
+
+from ContractSpider.handlers import HEAD_SIZE, PART_SUFFIX, SIDECAR_SUFFIX, STREAM_RESULT_META, STREAM_TO_META, discard_part, part_path
+from ContractSpider.utils.attachment_store import AttachmentStore, FolderIndex
+from ContractSpider.utils.backoff import is_rescheduled
+from ContractSpider.utils.checkpoint import KIND_ATTACHMENT, open_checkpoint
+from ContractSpider.utils.file_lock import FileLock, FileLockTimeout
+from ContractSpider.utils.stages import STAGE_ATTACHMENT, STAGE_META, stage_checkpoint
+from ContractSpider.utils.storage import iter_table, list_day_sources
+from ContractSpider.utils.verify import VerifyPool
 import mimetypes
-import requests
 import filetype
 import os
-import rarfile
-from PIL import Image
 
-# 加了修改5.11
-
-class AttachmentSpider(scrapy.Spider):
-    name = "attachment"
 
-    custom_settings = {
-        'DOWNLOADER_MIDDLEWARES': {
-            'ContractSpider.middlewares.AttachmentProxyMiddleware': 300,
-        },
-        'LOG_ENABLED': False,
-    }
+class AttachmentDownloadMixin:
+    """
+    附件下载：为任务生成请求，流式保存、校验后存入内容仓库。
+    AttachmentSpider 从详情数据文件中读取任务；合并爬虫（chain）由每条 DetailItem 直接生成任务。
+    使用前调用 init_attachment_download()，爬虫结束时调用 close_attachment_download()。
+    """
 
     ACCEPTED_MIME_TYPES = {
         "application/pdf",
@@ -66,13 +68,400 @@ class AttachmentSpider(scrapy.Spider):
         "text/plain": ".txt"
     }
 
+    def init_attachment_download(self, settings):
+        self.save_folder = "attachments"
+        self.max_retry = 3
+        self.failed_tasks_path = os.path.join("logs", "failed_downloads.json")
+        self.file_lock_timeout = settings.getfloat("FILE_LOCK_TIMEOUT", 120)
+        self.unsaved_failed_tasks = []  # 记录文件被其他进程锁住时暂存，下次记录或爬虫结束时写入
+        self.verify_pool = VerifyPool.from_settings(settings)
+        # 按内容寻址存储附件，同一 UUID 或相同内容只下载、保存一次
+        self.store = AttachmentStore(self.save_folder)
+        self.waiting = {}  # 本次运行中已调度下载的 UUID -> 等待同一附件的其他合同文件
+        self.folder_index = FolderIndex(self.save_folder, ignore_suffixes=(PART_SUFFIX, PART_SUFFIX + SIDECAR_SUFFIX, ".tmp"))
+        # 任务边读边调度，总数随读取进度增长；分布式爬取的工作节点不运行 start_requests()，因此在这里创建
+        self.attachment_progress = tqdm(total=0, desc="下载进度", ncols=80)
+
+    def close_attachment_download(self):
+        if self.unsaved_failed_tasks:
+            # 爬虫已结束，可以阻塞等待其他进程释放锁
+            self.save_failed_task(timeout=self.file_lock_timeout)
+        self.verify_pool.shutdown()
+        self.store.close()
+        self.custom_logger.info(f"附件校验统计: {self.verify_pool.counts}")
+        if self.attachment_progress:
+            self.attachment_progress.close()
+
+    def detail_tasks(self, item):
+        """由一条详情数据直接生成下载任务，文件夹与文件名规则与 AttachmentSpider.build_tasks() 一致"""
+        try:
+            folder_name = datetime.strptime(item.get("contract_announcement_date", ""), "%Y-%m-%d").strftime("%Y-%m")
+        except ValueError:
+            return []
+
+        urls = item.get("attachment_download_url") or []
+        if isinstance(urls, str):
+            urls = urls.split(",")
+        prefix = f"{item.get('contract_number', '')}_{item.get('contract_name', '')}_"
+        tasks = []
+        for url in (url.strip() for url in urls):
+            if url:
+                file_name = f"{prefix}{len(tasks) + 1}{self.get_file_extension(url)}"
+                tasks.append({"folder_name": folder_name, "file_name": file_name, "url": url})
+        return tasks
+
+    def requests_for(self, batch, user_agents, done_uuids, priority=0):
+        """
+        为一批任务生成下载请求，已下载的附件直接跳过；同一附件只发一个请求，其他合同文件在下载完成后建立链接。
+        使用共享队列时请求可能由其他节点下载，等待同一附件的文件随请求传递（meta["duplicates"]）。
+        """
+        shared = getattr(self, "shared_queue", False)
+        groups = {}  # UUID -> (任务, 文件路径, 等待同一附件的其他任务)
+        for item, uuid, file_path in self._pending_tasks(batch, done_uuids):
+            if uuid in groups:
+                groups[uuid][2].append(item)
+            elif uuid in self.waiting and not shared:
+                self.waiting[uuid].append(item)
+            else:
+                groups[uuid] = (item, file_path, [])
+                continue
+            self.custom_logger.info(f"同一附件已在下载队列中：{item['file_name']}，等待下载完成")
+
+        for uuid, (item, file_path, duplicates) in groups.items():
+            request = scrapy.Request(
+                method="GET",
+                url=item["url"],
+                headers={
+                    'Connection': 'close',
+                    'Referer': 'http://htgs.ccgp.gov.cn/',
+                    'User-Agent': random.choice(user_agents),  # 添加随机 User-Agent
+                },
+                meta={
+                    "file_path": file_path,
+                    "file_name": item["file_name"],
+                    "folder_name": item["folder_name"],
+                    "retry_count": 0,
+                    STREAM_TO_META: file_path,
+                    STAGE_META: STAGE_ATTACHMENT,
+                },
+                priority=priority,
+                callback=self.save_attachment,
+                errback=self.handle_error
+            )
+            if shared:
+                # 之前的批次已放入共享队列的附件无法再附加等待文件，单独下载（内容相同只保存一份）
+                request.meta["duplicates"] = duplicates
+                request.dont_filter = uuid in self.waiting
+                self.waiting[uuid] = []
+            else:
+                self.waiting[uuid] = duplicates
+            yield request
+
+    def _pending_tasks(self, batch, done_uuids):
+        """过滤掉已下载的任务，返回 (任务, 附件 UUID, 文件路径)"""
+        for item in batch:
+            folder_path = os.path.join(self.save_folder, item["folder_name"])
+            os.makedirs(folder_path, exist_ok=True)
+
+            file_path = os.path.join(folder_path, item["file_name"])
+            uuid = self.attachment_uuid(item["url"])
+
+            # 附件内容已在仓库中（其他合同引用过同一 UUID），直接建立链接
+            sha256 = self.store.sha_for_uuid(uuid)
+            if sha256 is not None:
+                linked_path = self.store.link(sha256, file_path)
+                self.custom_logger.info(f"附件已存在于仓库，建立链接：{linked_path}，跳过下载")
+                self.attachment_progress.update(1)
+                continue
+
+            if uuid in done_uuids:
+                self.custom_logger.info(f"断点记录中已完成：{item['file_name']}，跳过下载")
+                self.attachment_progress.update(1)
+                continue
+
+            # 文件已存在（任意后缀），通过目录索引判断，避免每个任务扫描一次目录
+            if self.folder_index.exists(item["folder_name"], item["file_name"]):
+                self.custom_logger.info(f"文件已存在（匹配后缀）：{file_path}，跳过下载")
+                self.attachment_progress.update(1)
+                continue
+
+            yield item, uuid, file_path
+
+    async def save_attachment(self, response):
+        file_path = response.meta["file_path"]
+        retry_count = response.meta.get("retry_count", 0)
+        max_retries = 3
+
+        self.custom_logger.info(f"📥 开始下载: {file_path}")
+
+        # 流式下载处理器已将响应体写入 .part 文件；未启用时将内存中的响应体写入临时文件
+        stream = response.meta.get(STREAM_RESULT_META)
+        if stream is None and response.status == 200:
+            stream = self._write_part(file_path, response.body)
+        size = stream["size"] if stream else len(response.body)
+
+        if stream and not stream["complete"]:
+            # 下载中断：保留 .part 文件，重试时通过 Range 从中断处继续
+            self.custom_logger.warning(f"⚠️ 下载中断（已下载 {size}/{stream['expected']} 字节），将断点续传: {file_path}")
+            if retry_count < max_retries:
+                yield self._retry_request(response, retry_count + 1)
+            else:
+                self.custom_logger.error(f"❌ 重试失败次数过多，保留已下载部分等待下次续传: {file_path}")
+                self._give_up(response.request)
+            return
+
+        # stream 为空：非 200 的响应没有流式结果，例如 206 的 Content-Range 与本地进度不一致时
+        # 处理器已作废并删除 .part，response.body 只是响应头部的缓冲，重试时从头下载
+        if stream is None or response.status not in (200, 206) or size < 100:
+            self.custom_logger.warning(f"⚠️ 下载失败、续传区间不一致或内容过小（状态码: {response.status}，长度: {size}），将重试")
+            self._discard_part(stream)
+            if retry_count < max_retries:
+                yield self._retry_request(response, retry_count + 1)
+            else:
+                self.custom_logger.error(f"❌ 重试失败次数过多，放弃下载: {file_path}")
+                self._give_up(response.request)
+            return
+
+        self.custom_logger.info(f"✅ 原始文件保存成功: {stream['path']}（{size} 字节，sha256 {stream['sha256']}）")
+
+        # 文件类型识别，校验通过后再重命名为最终文件名
+        base, ext = os.path.splitext(file_path)
+        if not ext:
+            ext = self.detect_extension(response)
+            if ext:
+                file_path = f"{file_path}{ext}"
+                self.custom_logger.info(f"🔁 文件类型识别成功，重命名为: {file_path}")
+            else:
+                self.custom_logger.warning(f"⚠️ 无法识别文件类型，保持原始文件名: {file_path}")
+        else:
+            self.custom_logger.info(f"✅ 文件已存在扩展名，跳过重命名: {file_path}")
+
+        # 验证文件：快速结构检查，抽样或可疑时再在进程池中完整解析，不阻塞其他下载
+        suspicious = stream.get("resumed", False) or stream["expected"] is None
+        valid, error = await self.verify_pool.verify(stream["path"], ext, stream["expected"], suspicious)
+        if not valid:
+            self.custom_logger.error(f"⚠️ 验证失败: {file_path}，异常: {error}")
+            self.custom_logger.warning(f"⚠️ 文件验证失败，删除并重试: {file_path}")
+            self._discard_part(stream)
+            if retry_count < max_retries:
+                yield self._retry_request(response, retry_count + 1)
+            else:
+                self.custom_logger.error(f"❌ 文件验证失败重试超过上限，放弃: {file_path}")
+                self._give_up(response.request)
+            return
+
+        uuid = self.attachment_uuid(response.request.url)
+        sha256 = self.store.put(stream["path"], stream["sha256"], uuid, ext)
+        discard_part(stream["path"])  # 清理续传记录
+        file_path = self.store.link(sha256, file_path)
+        self.custom_logger.info(f"✅ 下载完成并验证通过: {file_path}")
+        self.attachment_progress.update(1)
+        self._release_duplicates(response.request, sha256)
+
+        checkpoint = stage_checkpoint(self, STAGE_ATTACHMENT)
+        if checkpoint is not None:
+            checkpoint.mark(KIND_ATTACHMENT, uuid)
+            checkpoint.commit()
+
+    def _release_duplicates(self, request, sha256=None, failed=False):
+        """下载结束后处理等待同一附件的其他合同文件：成功则建立链接，最终失败则一并记录"""
+        waiting = self.waiting.pop(self.attachment_uuid(request.url), [])
+        for item in waiting + request.meta.get("duplicates", []):
+            if sha256 is not None:
+                file_path = os.path.join(self.save_folder, item["folder_name"], item["file_name"])
+                self.custom_logger.info(f"🔗 相同附件建立链接: {self.store.link(sha256, file_path)}")
+            elif failed:
+                self.save_failed_task({"url": item["url"], "file_name": item["file_name"], "folder_name": item["folder_name"]})
+            self.attachment_progress.update(1)
+
+    @staticmethod
+    def _write_part(file_path, body):
+        path = part_path(file_path)
+        with open(path, "wb") as f:
+            f.write(body)
+        return {"path": path, "size": len(body), "expected": len(body), "complete": True,
+                "sha256": hashlib.sha256(body).hexdigest(), "head": body[:HEAD_SIZE]}
+
+    @staticmethod
+    def _discard_part(stream):
+        if stream:
+            discard_part(stream["path"])
+
+    @staticmethod
+    def _retry_request(response, retry_count):
+        meta = {k: v for k, v in response.meta.items() if k != STREAM_RESULT_META}
+        return response.request.replace(meta={**meta, "retry_count": retry_count}, dont_filter=True)
+
+    def handle_error(self, failure):
+        if is_rescheduled(failure):
+            return  # 中间件已安排退避重试
+        request = failure.request
+        retry_count = request.meta.get("retry_count", 0)
+        file_path = request.meta.get("file_path")
+
+        if retry_count < self.max_retry:
+            new_request = request.copy()
+            new_request.meta["retry_count"] = retry_count + 1
+            self.custom_logger.warning(f"⚠️ 第 {retry_count + 1} 次重试: {request.url}")
+            yield new_request
+        else:
+            self.custom_logger.error(f"❌ 最终失败: {request.url} => {file_path}, 原因：{failure}")
+            # 记录文件夹信息的同时打印日志，方便调试
+            self._give_up(request)
+
+    def _give_up(self, request):
+        """最终失败：记录本任务与等待同一附件的其他合同文件，重跑失败任务时一并处理"""
+        file_name = request.meta.get("file_name")
+        folder_name = request.meta.get("folder_name")
+        # 记录文件夹信息的同时打印日志，方便调试
+        self.custom_logger.info(f"📁 记录失败任务，文件夹: {folder_name}, 文件: {file_name}")
+        failed_item = {
+            "url": request.url,
+            "file_name": file_name,
+            "folder_name": folder_name
+        }
+        self.save_failed_task(failed_item)
+        self.attachment_progress.update(1)
+        self._release_duplicates(request, failed=True)
+
+    def save_failed_task(self, failed_item=None, timeout: float = 0):
+        # 多个附件进程（并行回填）共用同一个记录文件，读-改-写在文件锁内完成；
+        # 爬取期间在 reactor 线程中调用，不等待锁，锁被占用时暂存，之后再写入
+        if failed_item is not None:
+            self.unsaved_failed_tasks.append(failed_item)
+        try:
+            with FileLock(self.failed_tasks_path, timeout=timeout):
+                self._append_failed_task(self.unsaved_failed_tasks)
+        except FileLockTimeout as e:
+            if timeout:
+                self.custom_logger.error(f"❌ 保存失败记录出错，{len(self.unsaved_failed_tasks)} 条未保存：{e}")
+            return
+        self.unsaved_failed_tasks = []
+
+    def _append_failed_task(self, failed_items):
+        try:
+            if os.path.exists(self.failed_tasks_path):
+                with open(self.failed_tasks_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            else:
+                data = []
+        except Exception as e:
+            self.custom_logger.error(f"❌ 读取失败文件记录出错：{e}")
+            data = []
+
+        data.extend(failed_items)
+
+        try:
+            # 写临时文件后原子替换，中途被杀不会留下截断的 JSON
+            tmp_path = f"{self.failed_tasks_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, self.failed_tasks_path)
+            self.custom_logger.info(f"💾 保存失败记录成功: {', '.join(str(item.get('file_name')) for item in failed_items)}")
+        except Exception as e:
+            self.custom_logger.error(f"❌ 保存失败记录出错：{e}")
+
+    @staticmethod
+    def attachment_uuid(url):
+        """从 download?uuid=... 链接中取出附件 UUID，没有 uuid 参数时使用完整链接"""
+        return parse_qs(urlparse(url).query).get("uuid", [url])[0]
+
+    def get_file_extension(self, url):
+        """仅从链接本身推断扩展名（纯本地计算，不发请求），推断不出时返回空字符串"""
+        # 1. 从 URL 路径中提取
+        path = urlparse(url).path
+        _, ext = os.path.splitext(path)
+        if ext:
+            return ext
+
+        # 2. 从 URL 参数中提取
+        ext = self.query_extension(urlparse(url).query)
+        if ext:
+            return ext
+
+        # 3. 所有方法都失败时返回空字符串，由 detect_extension() 根据下载响应识别
+        return ''
+
+    @staticmethod
+    def query_extension(query):
+        """从 URL 查询参数的值中提取扩展名（例如 ?name=合同.pdf），没有时返回空字符串"""
+        for value_list in parse_qs(query).values():
+            for value in value_list:
+                _, ext = os.path.splitext(value)
+                if ext:
+                    return ext
+        return ''
+
+    def detect_extension(self, response):
+        """根据下载响应识别扩展名：Content-Disposition 文件名 > Content-Type > 文件头魔数"""
+        # 1. Content-Disposition 中的文件名
+        disposition = response.headers.get('Content-Disposition')
+        if disposition:
+            _, ext = os.path.splitext(self.disposition_filename(disposition))
+            if ext:
+                return ext.lower()
+
+        # 2. Content-Type（增加过滤）
+        content_type = (response.headers.get('Content-Type') or b'').decode('latin-1').split(';')[0].strip().lower()
+        ext = self.MIME_EXTENSION_MAP.get(content_type)
+        if ext is None and content_type in self.ACCEPTED_MIME_TYPES:
+            ext = mimetypes.guess_extension(content_type)
+        if ext:
+            return ext
+
+        # 3. 文件头魔数
+        kind = filetype.guess(response.body[:8192])
+        if kind:
+            extension = kind.extension
+            if extension == 'xls':
+                extension = 'docx'  # 临时修复策略
+            return f".{extension}"
+        return ''
+
+    @staticmethod
+    def disposition_filename(value):
+        """解析 Content-Disposition 中的 filename / filename*（RFC 5987）"""
+        if isinstance(value, bytes):
+            try:
+                value = value.decode('utf-8')
+            except UnicodeDecodeError:
+                value = value.decode('latin-1')
+        filename = ''
+        for part in value.split(';'):
+            key, _, val = part.strip().partition('=')
+            key = key.strip().lower()
+            val = val.strip().strip('"')
+            if key == 'filename*':
+                _, _, encoded = val.partition("''")
+                return unquote(encoded or val)
+            if key == 'filename':
+                filename = unquote(val)
+        return filename
+
+
+# 加了修改5.11
+
+class AttachmentSpider(AttachmentDownloadMixin, scrapy.Spider):
+    name = "attachment"
+
+    custom_settings = {
+        'DOWNLOADER_MIDDLEWARES': {
+            'ContractSpider.middlewares.AttachmentProxyMiddleware': 300,
+        },
+        # 附件边下载边写入磁盘，不在内存中缓存整个文件
+        'DOWNLOAD_HANDLERS': {
+            'http': 'ContractSpider.handlers.StreamingDownloadHandler',
+            'https': 'ContractSpider.handlers.StreamingDownloadHandler',
+        },
+        'LOG_ENABLED': False,
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.settings = get_project_settings()
         self.start_date = kwargs.get("ATTACHMENT_START_DATE")
         self.end_date = kwargs.get("ATTACHMENT_END_DATE")
         self.retry_failed = kwargs.get("retry_failed", "0") == "1"  # 新增参数，用于控制是否重跑失败任务
-        self.max_retry = 3
 
         today = datetime.now()
         log_filename = f"attachment_{today.year}_{today.month:02d}_{today.day:02d}.log"
@@ -101,20 +490,19 @@ class AttachmentSpider(scrapy.Spider):
             self.end_date = self.settings.get('ATTACHMENT_END_DATE')
 
         self.downloads_folder = "detail_downloads"
-        self.save_folder = "attachments"
         self.target_column = "附件下载链接"
         self.contract_number_column = "合同编号"
         self.contract_name_column = "合同名称"
+        self.read_formats = self.settings.getlist("STORAGE_READ_FORMATS", ["parquet", "xlsx"])
+        self.init_attachment_download(self.settings)
+
+        # 断点续爬：默认跳过上次同一日期范围已下载的附件 UUID，-a resume=0 重新开始
+        self.resume = kwargs.get("resume", "1") == "1"
+        self.checkpoint = open_checkpoint(self.settings, f"{self.name}:{self.start_date}:{self.end_date}", self.resume)
         
-        self.failed_tasks_path = os.path.join("logs", "failed_downloads.json")
-        
+        self.chunk_size = self.settings.getint("STORAGE_READ_CHUNK_SIZE", 10000)
         if self.retry_failed:
             self.custom_logger.info("📢 正在重跑失败任务模式...")
-            self.attachment_data = self.load_failed_tasks()
-        else:
-            self.attachment_data = self.extract_links()
-        
-        self.progress_bar = None
 
     def load_failed_tasks(self):
         """加载失败的下载任务"""
@@ -171,316 +559,121 @@ class AttachmentSpider(scrapy.Spider):
             self.custom_logger.error(f"❌ 读取失败任务文件出错: {e}")
             return []
 
-    def extract_links(self):
-        attachment_list = []
+    def iter_task_batches(self):
+        """按批产出下载任务：重跑模式一次性读取失败记录，否则逐个文件、逐块读取详情数据"""
+        if self.retry_failed:
+            yield self.load_failed_tasks()
+        else:
+            yield from self.extract_links()
 
+    def extract_links(self):
         try:
             start_dt = datetime.strptime(self.start_date, "%Y-%m-%d")
             end_dt = datetime.strptime(self.end_date, "%Y-%m-%d")
         except Exception as e:
             self.custom_logger.error(f"⚠️ 日期格式错误: {e}")
-            return []
-
-        for folder_name in os.listdir(self.downloads_folder):
-            folder_path = os.path.join(self.downloads_folder, folder_name)
-            if not os.path.isdir(folder_path):
-                continue
-
-            for file_name in os.listdir(folder_path):
-                if not file_name.endswith(".xlsx"):
-                    continue
-
-                # 从文件名中解析出日期部分（假设文件名格式为 yyyy-mm-dd.xlsx）
-                try:
-                    file_date = datetime.strptime(file_name.replace(".xlsx", ""), "%Y-%m-%d")
-                except ValueError:
-                    continue  # 跳过非日期命名的文件
-
-                if start_dt <= file_date <= end_dt:
-                    file_path = os.path.join(folder_path, file_name)
-                    attachment_list.extend(self.process_excel(file_path))
+            return
 
-        return attachment_list
+        # 按天列出详情数据（优先读取 Parquet 分区，其次 Excel）
+        for file_path in list_day_sources(self.downloads_folder, start_dt.strftime("%Y-%m-%d"),
+                                          end_dt.strftime("%Y-%m-%d"), prefer=self.read_formats):
+            yield from self.process_excel(file_path)
 
     def process_excel(self, file_path):
+        """分块读取一天的详情数据，每块产出一批下载任务"""
+        columns = [self.target_column, self.contract_number_column, self.contract_name_column, "合同公告日期"]
+        count = 0
         try:
-            df = pd.read_excel(file_path, engine="openpyxl")
+            for df in iter_table(file_path, columns=columns, chunk_size=self.chunk_size):
+                if self.target_column not in df.columns or \
+                   self.contract_number_column not in df.columns or \
+                   self.contract_name_column not in df.columns:
+                    self.custom_logger.error(f"⚠️ {file_path} 缺少必要列，跳过处理。")
+                    return
+
+                attachment_list = self.build_tasks(df)
+                count += len(attachment_list)
+                yield attachment_list
         except Exception as e:
-            self.custom_logger.error(f"❌ 无法读取 Excel 文件 {file_path}，跳过处理。错误信息: {e}")
-            return []
-
-        if self.target_column not in df.columns or \
-           self.contract_number_column not in df.columns or \
-           self.contract_name_column not in df.columns:
-            self.custom_logger.error(f"⚠️ {file_path} 缺少必要列，跳过处理。")
-            return []
+            self.custom_logger.error(f"❌ 无法读取数据文件 {file_path}，跳过处理。错误信息: {e}")
+            return
 
-        attachment_list = []
-        for _, row in df.iterrows():
-            contract_date = row.get("合同公告日期", "")
-            if not self.is_within_date_range(contract_date):
-                continue
+        self.custom_logger.info(f"✅ 从{file_path}中提取到: {count} 个链接")
 
-            contract_number = row[self.contract_number_column]
-            contract_name = row[self.contract_name_column]
-            attachment_links = row[self.target_column]
+    def build_tasks(self, df):
+        """
+        将一天的详情数据转换为附件下载任务（向量化）：
+        按合同公告日期过滤 -> 拆分附件链接 -> 拼接保存文件名
+        """
+        date_column = "合同公告日期"
+        if date_column not in df.columns or df.empty:
+            return []
 
-            if pd.isna(attachment_links):
-                continue
+        dates = pd.to_datetime(df[date_column], format="%Y-%m-%d", errors="coerce")
+        mask = dates.notna() & df[self.target_column].notna()
+        if self.start_date:
+            mask &= dates >= pd.Timestamp(self.start_date)
+        if self.end_date:
+            mask &= dates <= pd.Timestamp(self.end_date)
+        if not mask.any():
+            return []
 
-            links = [link.strip() for link in str(attachment_links).split(",") if link.strip()]
-            for index, link in enumerate(links, start=1):
-                try:
-                    folder_name = datetime.strptime(contract_date, "%Y-%m-%d").strftime("%Y-%m")
-                except Exception:
-                    folder_name = "未知日期"
-                # 并不是全都是PDF
-                ext = self.get_file_extension(link)
-                save_name = f"{contract_number}_{contract_name}_{index}{ext}"
-                attachment_list.append({
-                    "folder_name": folder_name,
-                    "file_name": save_name,
-                    "url": link
-                })
+        rows = pd.DataFrame({
+            "folder_name": dates[mask].dt.strftime("%Y-%m"),
+            "prefix": df.loc[mask, self.contract_number_column].astype(str) + "_"
+                      + df.loc[mask, self.contract_name_column].astype(str) + "_",
+            "url": df.loc[mask, self.target_column].astype(str).str.split(","),
+        }).reset_index(drop=True)
+
+        tasks = rows.explode("url")
+        tasks["url"] = tasks["url"].str.strip()
+        tasks = tasks[tasks["url"].notna() & (tasks["url"] != "")]
+        if tasks.empty:
+            return []
 
-        self.custom_logger.info(f"✅ 从{file_path}中提取到: {len(attachment_list)} 个链接")
-        return attachment_list
-
-    def is_within_date_range(self, contract_date):
-        if not contract_date or pd.isna(contract_date):
-            return False
-        try:
-            contract_date = datetime.strptime(str(contract_date), "%Y-%m-%d")
-        except ValueError:
-            return False
-        if self.start_date and contract_date < datetime.strptime(self.start_date, "%Y-%m-%d"):
-            return False
-        if self.end_date and contract_date > datetime.strptime(self.end_date, "%Y-%m-%d"):
-            return False
-        return True
+        # 序号按每个合同内的链接顺序从 1 开始；并不是全都是PDF，链接中没有扩展名时，下载后再根据响应识别
+        index = tasks.groupby(level=0).cumcount() + 1
+        tasks["file_name"] = tasks["prefix"] + index.astype(str) + self.file_extensions(tasks["url"])
+        # DataFrame.to_dict("records") 会逐个装箱，直接 zip 列更快
+        return [
+            {"folder_name": folder_name, "file_name": file_name, "url": url}
+            for folder_name, file_name, url in zip(tasks["folder_name"], tasks["file_name"], tasks["url"])
+        ]
+
+    def file_extensions(self, urls):
+        """get_file_extension() 的向量化版本：先取 URL 路径中的扩展名，路径中没有时再逐个解析查询参数"""
+        without_host = urls.str.replace(r"^[A-Za-z][A-Za-z0-9+.-]*://[^/?#]*", "", regex=True)
+        name = without_host.str.extract(r"^([^?#]*)", expand=False).str.rsplit("/", n=1).str[-1]
+        exts = name.str.extract(r"^\.*[^.].*(\.[^.]*)$", expand=False).fillna("")
+
+        query = without_host.str.extract(r"^[^?#]*\?([^#]*)", expand=False).fillna("")
+        fallback = (exts == "") & query.str.contains(r"[.%]")  # 值经过 URL 解码后才可能出现 "."
+        if fallback.any():
+            exts[fallback] = query[fallback].map(self.query_extension)
+        return exts
 
     def start_requests(self):
-        ua = UserAgent()  # 创建 UserAgent 实例
-
-        total_files = len(self.attachment_data)
-        self.progress_bar = tqdm(total=total_files, desc="下载进度", ncols=80)
-
-        if total_files == 0:
-            self.custom_logger.warning("⚠️ 没有可下载的附件")
-            return
+        # 每次 ua.random 都要过滤整个 UA 列表（约 10ms），预先抽取一批，逐个请求随机选择
+        ua = UserAgent()
+        user_agents = [ua.random for _ in range(50)]
 
         mode = "重跑失败任务" if self.retry_failed else "正常下载"
-        self.custom_logger.info(f"🚀 开始{mode}，共 {total_files} 个文件")
-
-        for item in self.attachment_data:
-            folder_path = os.path.join(self.save_folder, item["folder_name"])
-            os.makedirs(folder_path, exist_ok=True)
-
-            file_path = os.path.join(folder_path, item["file_name"])
-            # 提取文件基础路径（不带扩展名）
-            file_base = item["file_name"]
-            file_pattern = os.path.join(folder_path, f"{file_base}.*")
-
-            # 使用 glob 查找所有匹配的文件
-            existing_files = glob.glob(file_pattern)
-            if existing_files:
-                self.custom_logger.info(f"文件已存在（匹配后缀）：{existing_files[0]}，跳过下载")
-                self.progress_bar.update(1)
-                continue
-
-            request = scrapy.Request(
-                method="GET",
-                url=item["url"],
-                headers={
-                    'Connection': 'close',
-                    'Referer': 'http://htgs.ccgp.gov.cn/',
-                    'User-Agent': ua.random,  # 添加随机 User-Agent
-                },
-                meta={
-                    "file_path": file_path,
-                    "file_name": item["file_name"],
-                    "folder_name": item["folder_name"],
-                    "retry_count": 0,
-                },
-                callback=self.save_attachment,
-                errback=self.handle_error
-            )
-            yield request
-
-    def save_attachment(self, response):
-        file_path = response.meta["file_path"]
-        retry_count = response.meta.get("retry_count", 0)
-        max_retries = 3
-
-        self.custom_logger.info(f"📥 开始下载: {file_path}")
-
-        if response.status != 200 or len(response.body) < 100:
-            self.custom_logger.warning(f"⚠️ 下载失败或内容过小（长度: {len(response.body)}），将重试")
-            if retry_count < max_retries:
-                yield response.request.replace(meta={**response.meta, "retry_count": retry_count + 1}, dont_filter=True)
-            else:
-                self.custom_logger.error(f"❌ 重试失败次数过多，放弃下载: {file_path}")
-            return
-
-        # 保存文件
-        with open(file_path, "wb") as f:
-            f.write(response.body)
-            self.custom_logger.info(f"✅ 原始文件保存成功: {file_path}")
-
-        # 文件类型识别与重命名
-        base, ext = os.path.splitext(file_path)
-        if not ext:
-            kind = filetype.guess(response.body)
-            if kind:
-                extension = kind.extension
-                if extension == 'xls':
-                    extension = 'docx'  # 临时修复策略
-                new_file_path = f"{file_path}.{extension}"
-                os.rename(file_path, new_file_path)
-                file_path = new_file_path
-                self.custom_logger.info(f"🔁 文件类型识别成功，重命名为: {file_path}")
-            else:
-                self.custom_logger.warning(f"⚠️ 无法识别文件类型，保持原始文件名: {file_path}")
-        else:
-            self.custom_logger.info(f"✅ 文件已存在扩展名，跳过重命名: {file_path}")
-
-        # 验证文件能否打开
-        valid = self._verify_file_integrity(file_path)
-        if not valid:
-            self.custom_logger.warning(f"⚠️ 文件验证失败，删除并重试: {file_path}")
-            os.remove(file_path)
-            if retry_count < max_retries:
-                yield response.request.replace(meta={**response.meta, "retry_count": retry_count + 1}, dont_filter=True)
-            else:
-                self.custom_logger.error(f"❌ 文件验证失败重试超过上限，放弃: {file_path}")
-            return
+        self.custom_logger.info(f"🚀 开始{mode}")
 
-        self.custom_logger.info(f"✅ 下载完成并验证通过: {file_path}")
-        self.progress_bar.update(1)
+        done_uuids = self.checkpoint.done(KIND_ATTACHMENT) if self.checkpoint is not None else set()
 
-    def handle_error(self, failure):
-        request = failure.request
-        retry_count = request.meta.get("retry_count", 0)
-        file_path = request.meta.get("file_path")
-        file_name = request.meta.get("file_name")
-        folder_name = request.meta.get("folder_name")
+        for batch in self.iter_task_batches():
+            self.attachment_progress.total += len(batch)
+            self.attachment_progress.refresh()
+            yield from self.requests_for(batch, user_agents, done_uuids)
 
-        if retry_count < self.max_retry:
-            new_request = request.copy()
-            new_request.meta["retry_count"] = retry_count + 1
-            self.custom_logger.warning(f"⚠️ 第 {retry_count + 1} 次重试: {request.url}")
-            yield new_request
+        if self.attachment_progress.total == 0:
+            self.custom_logger.warning("⚠️ 没有可下载的附件")
         else:
-            self.custom_logger.error(f"❌ 最终失败: {request.url} => {file_path}, 原因：{failure}")
-            # 记录文件夹信息的同时打印日志，方便调试
-            self.custom_logger.info(f"📁 记录失败任务，文件夹: {folder_name}, 文件: {file_name}")
-            failed_item = {
-                "url": request.url, 
-                "file_name": file_name,
-                "folder_name": folder_name
-            }
-            self.save_failed_task(failed_item)
-            self.progress_bar.update(1)
-
-    def save_failed_task(self, failed_item):
-        try:
-            if os.path.exists(self.failed_tasks_path):
-                with open(self.failed_tasks_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            else:
-                data = []
-        except Exception as e:
-            self.custom_logger.error(f"❌ 读取失败文件记录出错：{e}")
-            data = []
-
-        data.append(failed_item)
-
-        try:
-            with open(self.failed_tasks_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
-            self.custom_logger.info(f"💾 保存失败记录成功: {failed_item.get('file_name')}")
-        except Exception as e:
-            self.custom_logger.error(f"❌ 保存失败记录出错：{e}")
+            self.custom_logger.info(f"📋 任务读取完成，共 {self.attachment_progress.total} 个文件")
 
     def closed(self, reason):
-        if self.progress_bar:
-            self.progress_bar.close()
+        self.close_attachment_download()
+        if self.checkpoint is not None:
+            self.checkpoint.close()
         self.custom_logger.info(f"爬虫结束，原因：{reason}")
-
-    def get_file_extension(self, url):
-        # 1. 从 URL 路径中提取
-        path = urlparse(url).path
-        _, ext = os.path.splitext(path)
-        if ext:
-            return ext
-
-        # 2. 从 URL 参数中提取
-        query = urlparse(url).query
-        params = parse_qs(query)
-        for value_list in params.values():
-            for value in value_list:
-                _, ext = os.path.splitext(value)
-                if ext:
-                    return ext
-
-        # 3. 从 Content-Type 判断（增加过滤）
-        try:
-            response = requests.head(url, allow_redirects=True, timeout=5)
-            content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
-            if content_type in self.ACCEPTED_MIME_TYPES:
-                guessed_ext = mimetypes.guess_extension(content_type)
-                if guessed_ext:
-                    return guessed_ext
-        except Exception:
-            pass
-
-        # 4. 所有方法都失败时返回空字符串
-        return ''
-
-
-    def _verify_file_integrity(self, file_path):
-        ext = os.path.splitext(file_path)[-1].lower()
-
-        try:
-            if ext in [".xlsx", ".xls"]:
-                from openpyxl import load_workbook
-                load_workbook(file_path)
-
-            elif ext in [".docx"]:
-                from docx import Document
-                Document(file_path)
-
-            elif ext == ".pdf":
-                import PyPDF2
-                with open(file_path, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    _ = reader.pages[0]
-
-            elif ext in [".zip"]:
-                with zipfile.ZipFile(file_path, 'r') as zf:
-                    bad = zf.testzip()
-                    if bad:
-                        raise ValueError(f"ZIP 文件损坏: {bad}")
-
-            elif ext in [".rar"]:
-                with rarfile.RarFile(file_path, 'r') as rf:
-                    rf.testrar()  # 若失败将抛出异常
-
-            elif ext in [".txt"]:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    _ = f.read(1024)  # 尝试读取前1KB
-
-            elif ext in [".jpg", ".jpeg", ".png", ".bmp"]:
-                with Image.open(file_path) as img:
-                    img.verify()  # PIL验证图像完整性
-
-            else:
-                # 不支持类型，默认以非空文件判断
-                return os.path.getsize(file_path) > 100
-
-            return True
-
-        except Exception as e:
-            self.custom_logger.error(f"⚠️ 验证失败: {file_path}，异常: {e}")
-            return False
-
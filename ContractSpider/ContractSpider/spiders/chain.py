@@ -0,0 +1,213 @@
+import os
+from datetime import datetime, timedelta
+
+import scrapy
+from fake_useragent import UserAgent
+from scrapy.utils.project import get_project_settings
+from tqdm import tqdm
+
+from ContractSpider.items import DetailItem
+from ContractSpider.spiders.attachment import AttachmentDownloadMixin
+from ContractSpider.spiders.contract import ContractSpider
+from ContractSpider.utils.checkpoint import KIND_ATTACHMENT, KIND_DETAIL, KIND_PAGE, open_checkpoint
+from ContractSpider.utils.detail_index import LINK_COLUMN, DetailIndex, contract_uuid
+from ContractSpider.utils.detail_link import DetailsExtractor
+from ContractSpider.utils.detail_parser import parse_detail
+from ContractSpider.utils.stages import STAGE_ATTACHMENT, STAGE_CONTRACT, STAGE_DETAIL, STAGE_META
+from ContractSpider.utils.storage import iter_table, list_day_sources
+
+# 下游阶段优先出队，已发现的合同尽快走完全部阶段，而不是先积压大量搜索页
+DETAIL_PRIORITY = 10
+ATTACHMENT_PRIORITY = 20
+
+
+class ChainSpider(AttachmentDownloadMixin, ContractSpider):
+    """
+    在一次爬取中完成 搜索页 → 详情页 → 附件：
+    每条合同数据产出后立即调度其详情页，每条详情数据解析后立即调度其附件下载，
+    不再等待上一阶段全部结束，也不重新读取上一阶段的数据文件。
+    各阶段的请求放入以阶段命名的下载槽，并发数与下载延迟见 settings.py 中的 DOWNLOAD_SLOTS。
+    """
+    name = "chain"
+    allowed_domains = ["ccgp.gov.cn"]
+    default_stage = STAGE_CONTRACT  # 继承自搜索页爬虫的请求未在 meta 中标明阶段
+    stage_slots = True
+
+    custom_settings = {
+        'DOWNLOADER_MIDDLEWARES': {
+            'ContractSpider.middlewares.RotateProxyMiddleware': 300,
+            'ContractSpider.middlewares.DetailProxyMiddleware': 310,
+            'ContractSpider.middlewares.AttachmentProxyMiddleware': 320,
+        },
+        'ITEM_PIPELINES': {
+            'ContractSpider.pipelines.ContractPipeline': 300,
+            'ContractSpider.pipelines.DetailPipeline': 400,
+        },
+        # 附件边下载边写入磁盘；未设置 STREAM_TO_META 的搜索页、详情页请求不受影响
+        'DOWNLOAD_HANDLERS': {
+            'http': 'ContractSpider.handlers.StreamingDownloadHandler',
+            'https': 'ContractSpider.handlers.StreamingDownloadHandler',
+        },
+        # 实际并发由各阶段的下载槽限制；总数还包括在槽内排队的请求，需明显大于各阶段并发之和，
+        # 否则某一阶段排队的请求会占满总数，其他阶段无法继续
+        'CONCURRENT_REQUESTS': 64,
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        settings = get_project_settings()
+
+        # 各阶段共用同一个断点任务，但分别记录、分别提交：
+        # 详情、附件的提交不会带上搜索页中尚未写入文件的分页
+        self.checkpoints = {STAGE_CONTRACT: self.checkpoint, STAGE_DETAIL: None, STAGE_ATTACHMENT: None}
+        if self.checkpoint is not None:
+            for stage in (STAGE_DETAIL, STAGE_ATTACHMENT):
+                self.checkpoints[stage] = open_checkpoint(settings, self.checkpoint.job)
+        self.detail_done = self._done(STAGE_DETAIL, KIND_DETAIL)
+        self.attachment_done = self._done(STAGE_ATTACHMENT, KIND_ATTACHMENT)
+
+        # 增量抓取：跳过 detail_downloads 中已存在的合同，-a incremental=1 开启
+        self.incremental = kwargs.get("incremental", "1" if settings.getbool("DETAIL_INCREMENTAL") else "0") == "1"
+        self.detail_index = DetailIndex(settings.get("DETAIL_INDEX_PATH", os.path.join("logs", "detail_index.sqlite3")))
+        self.checkpoint_path = settings.get("CHECKPOINT_PATH") if settings.getbool("CHECKPOINT_ENABLED") else None
+        self.detail_folder = "detail_downloads"
+        self.read_formats = settings.getlist("STORAGE_READ_FORMATS", ["parquet", "xlsx"])
+        self.chunk_size = settings.getint("STORAGE_READ_CHUNK_SIZE", 10000)
+        self.known_uuids = set()
+        self.scheduled_links = set()  # 本次已调度的详情链接，分页重试时不重复调度
+
+        self.init_attachment_download(settings)
+        # 分布式爬取的工作节点不运行 start_requests()，调度附件下载时才抽取
+        self.user_agents = []
+        self.detail_progress = tqdm(total=0, desc="合同详情", unit="条")
+
+    def _done(self, stage, kind):
+        checkpoint = self.checkpoints[stage]
+        return checkpoint.done(kind) if checkpoint is not None else set()
+
+    def start_requests(self):
+        if self.incremental:
+            self.known_uuids = self.load_known_uuids()
+        self.user_agents = self.sample_user_agents()
+        if self.checkpoint is not None and self.checkpoint.done(KIND_PAGE):
+            yield from self.resume_requests()
+        yield from super().start_requests()
+
+    def resume_requests(self):
+        """
+        断点续爬时补发上次中断时只在内存中的下游请求：分页在合同数据写入后即提交、详情在详情数据写入后即提交，
+        它们产生的详情页、附件请求并未持久化。按本次日期范围从数据文件重建：
+        downloads 中详情尚未完成的合同，以及 detail_downloads 中详情已完成、附件尚未全部下载的合同
+        """
+        last_day = (datetime.strptime(self.end_date, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+        details = 0
+        for links in DetailsExtractor(self.start_date, last_day).iter_url_batches(self):
+            for link in links:
+                request = self.detail_request(link)
+                if request is not None:
+                    details += 1
+                    yield request
+
+        # 详情数据按合同公告日期分天存储，读取同一日期范围内的日文件
+        attachments = 0
+        columns = [LINK_COLUMN, "合同编号", "合同名称", "合同公告日期", "附件下载链接"]
+        for path in list_day_sources(self.detail_folder, self.start_date, last_day, prefer=self.read_formats):
+            try:
+                for df in iter_table(path, columns=columns, chunk_size=self.chunk_size):
+                    for row in df.to_dict("records"):
+                        if row.get(LINK_COLUMN) not in self.detail_done:
+                            continue
+                        tasks = self.detail_tasks({
+                            "contract_number": row.get("合同编号") or "",
+                            "contract_name": row.get("合同名称") or "",
+                            "contract_announcement_date": row.get("合同公告日期") or "",
+                            "attachment_download_url": row.get("附件下载链接") or "",
+                        })
+                        attachments += len(tasks)
+                        yield from self.attachment_requests(tasks)
+            except Exception as e:
+                self.custom_logger.error(f"❌ 读取 {path} 失败: {e}")
+
+        self.custom_logger.info(f"断点续爬：补发详情页 {details} 个，重新检查附件任务 {attachments} 个")
+
+    @staticmethod
+    def sample_user_agents():
+        # 每次 ua.random 都要过滤整个 UA 列表，预先抽取一批，逐个请求随机选择
+        ua = UserAgent()
+        return [ua.random for _ in range(50)]
+
+    def load_known_uuids(self):
+        """刷新索引并返回已保存的合同 UUID"""
+        scanned = self.detail_index.refresh(self.detail_folder, self.checkpoint_path, self.custom_logger)
+        known = self.detail_index.uuids()
+        self.custom_logger.info(f"增量抓取：扫描 {scanned} 个新数据文件，索引 {len(known)} 个合同")
+        return known
+
+    def _emit_rows(self, items):
+        """
+        每条合同数据之后紧跟其详情页请求。分页整页解析成功后才调用（而不是在 _parse_rows() 中），
+        否则某一行解析出错、整页重试时，前面的链接已记为已调度，重试后不会再调度其详情页
+        """
+        for item in items:
+            yield item
+            request = self.detail_request(item["contract_link"])
+            if request is not None:
+                yield request
+
+    def detail_request(self, link):
+        """调度详情页；断点中已完成、增量索引中已存在或本次已调度的链接返回 None"""
+        if link in self.scheduled_links or link in self.detail_done:
+            return None
+        if self.known_uuids and contract_uuid(link) in self.known_uuids:
+            return None
+        self.scheduled_links.add(link)
+        self.detail_progress.total += 1
+        self.detail_progress.refresh()
+        return scrapy.Request(
+            url=link,
+            headers=self.headers,
+            callback=self.parse_detail_page,
+            meta={"contract_link": link, STAGE_META: STAGE_DETAIL},
+            priority=DETAIL_PRIORITY,
+        )
+
+    def parse_detail_page(self, response):
+        """解析合同详情，产出 DetailItem 后立即调度其附件下载"""
+        self.detail_progress.update(1)
+        try:
+            fields = parse_detail(response.selector.root)
+        except Exception as e:
+            self.custom_logger.error(f"[错误] 解析合同详情失败: {e}")
+            return
+        if fields is None:
+            self.custom_logger.error(f"[错误] 未找到合同详情正文: {response.url}")
+            return
+
+        item = DetailItem(fields)
+        item["contract_link"] = response.meta.get("contract_link", response.url)
+        # 先生成附件任务：DetailPipeline 会把附件列表改写为字符串
+        tasks = self.detail_tasks(item)
+        yield item
+
+        if not tasks:
+            if item["attachment_download_url"]:
+                self.custom_logger.warning(f"合同公告日期无效，跳过附件: {item['contract_link']}")
+            return
+        yield from self.attachment_requests(tasks)
+
+    def attachment_requests(self, tasks):
+        self.attachment_progress.total += len(tasks)
+        self.attachment_progress.refresh()
+        if not self.user_agents:
+            self.user_agents = self.sample_user_agents()
+        yield from self.requests_for(tasks, self.user_agents, self.attachment_done, priority=ATTACHMENT_PRIORITY)
+
+    def closed(self, reason):
+        super().closed(reason)
+        self.close_attachment_download()
+        if self.detail_progress:
+            self.detail_progress.close()
+        for stage in (STAGE_DETAIL, STAGE_ATTACHMENT):
+            if self.checkpoints[stage] is not None:
+                self.checkpoints[stage].close()
+        self.detail_index.close()
@@ -4,8 +4,12 @@ import json
 import logging
 from datetime import datetime
 from scrapy.utils.project import get_project_settings
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
 from tqdm import tqdm
 from ContractSpider.items import ContractItem
+from ContractSpider.utils.checkpoint import KIND_PAGE, KIND_SHARD_COUNT, open_checkpoint
+from ContractSpider.utils.paging import PageTracker, SearchShard, build_shards
 
 
 class ContractSpider(scrapy.Spider):
@@ -49,6 +53,7 @@ class ContractSpider(scrapy.Spider):
 
     total_pages = -1
     current_page = 1
+    shared_queue = False  # 使用共享队列（ContractSpider.scheduler.SharedScheduler）时由调度器设置
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -64,12 +69,26 @@ class ContractSpider(scrapy.Spider):
 
         self.download_dir = "downloads"
 
-        # 配置 logger：contract_yyyy_mm_dd.log
+        # 分页模式：serial 逐页翻页；parallel 获取总页数后按窗口并发调度所有页
+        self.paging_mode = kwargs.get("paging_mode", settings.get("CONTRACT_PAGING_MODE", "serial"))
+        self.page_window = int(kwargs.get("page_window", settings.getint("CONTRACT_PAGE_WINDOW", 8)))
+        self.missing_rounds = settings.getint("CONTRACT_MISSING_ROUNDS", 1)  # 缺页补抓轮数
+
+        # 日期拆分：none 不拆分；day 按天拆分；adaptive 总数超过阈值时对半拆分
+        self.shard_mode = kwargs.get("shard_mode", settings.get("CONTRACT_SHARD_MODE", "none"))
+        self.shard_max_count = int(kwargs.get("shard_max_count", settings.getint("CONTRACT_SHARD_MAX_COUNT", 2000)))
+        self.shards = {}  # 每个搜索窗口独立的分页进度
+
+        # 断点续爬：默认继续上次同一日期范围的进度，-a resume=0 重新开始
+        self.resume = kwargs.get("resume", "1") == "1"
+        self.checkpoint = open_checkpoint(settings, f"{self.name}:{self.start_date}:{self.end_date}", self.resume)
+
+        # 配置 logger：{爬虫名}_yyyy_mm_dd.log（搜索页为 contract_yyyy_mm_dd.log）
         today_str = datetime.now().strftime("%Y_%m_%d")
-        log_file_path = f"logs/contract_{today_str}.log"
+        log_file_path = f"logs/{self.name}_{today_str}.log"
         os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
 
-        self.custom_logger = logging.getLogger("contract_logger")
+        self.custom_logger = logging.getLogger(f"{self.name}_logger")
         self.custom_logger.setLevel(logging.INFO)
 
         handler = logging.FileHandler(log_file_path, encoding="utf-8")
@@ -82,14 +101,34 @@ class ContractSpider(scrapy.Spider):
         # 初始化进度条（在获取总页数后设置 total）
         self.progress_bar = None
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        return spider
+
     def start_requests(self):
-        yield scrapy.FormRequest(
-            url=self.count_url,
-            method="POST",
-            headers=self.headers,
-            formdata=self.base_payload.copy(),
-            callback=self.parse_total_pages
-        )
+        # 逐页翻页依赖本进程的翻页状态，分布式爬取时总是按窗口并发调度
+        if self.paging_mode == "serial" and self.shard_mode == "none" and not self.shared_queue:
+            yield scrapy.FormRequest(
+                url=self.count_url,
+                method="POST",
+                headers=self.headers,
+                formdata=self.base_payload.copy(),
+                callback=self.parse_total_pages
+            )
+            return
+
+        # 按搜索窗口分别获取总数，各窗口并发翻页
+        shards = build_shards(self.start_date, self.end_date, self.shard_mode)
+        if not shards:
+            self.custom_logger.warning(f"日期范围为空: {self.start_date} ~ {self.end_date}")
+            return
+        self.custom_logger.info(f"搜索窗口数: {len(shards)}，拆分模式: {self.shard_mode}")
+        self._page_progress()
+        for shard in shards:
+            self.shards[shard.key] = shard
+            yield self._count_request(shard)
 
     def parse_total_pages(self, response):
         try:
@@ -153,33 +192,7 @@ class ContractSpider(scrapy.Spider):
                 self.current_page = page
                 self.custom_logger.info(f'current page: {self.current_page}')
 
-                for row in response_json.get("rows", []):
-                    item = ContractItem()
-                    item["sign_date"] = row.get("signDate", "").strip()
-                    item["publish_date"] = row.get("publishDate", "").strip()
-                    item["purchaser"] = row.get("purchaserName", "").strip()
-                    item["supplier"] = row.get("supplyName", "").strip()
-                    item["agent"] = row.get("agentName", "").strip()
-                    item[
-                        "contract_link"] = f'http://htgs.ccgp.gov.cn/GS8/contractpublish/detail/{row["uuid"]}?contractSign=0'
-                    item["project_name"] = row.get("projName", "").strip()
-                    item["contract_name"] = row.get("contractName", "").strip()
-
-                    publish_date = item["publish_date"]
-                    try:
-                        date_obj = datetime.strptime(publish_date.split()[0], "%Y-%m-%d")
-                        end_date_obj = datetime.strptime(self.end_date, "%Y-%m-%d")
-                        if date_obj == end_date_obj:
-                            continue
-                        folder_path = os.path.join(self.download_dir, date_obj.strftime("%Y-%m"))
-                        os.makedirs(folder_path, exist_ok=True)
-                        file_path = os.path.join(folder_path, f"{date_obj.strftime('%Y-%m-%d')}.xlsx")
-                    except ValueError:
-                        self.custom_logger.warning(f"无效日期格式: {publish_date}")
-                        continue
-
-                    item["file_path"] = file_path
-                    yield item
+                yield from self._emit_rows(self._parse_rows(response_json))
 
                 self.progress_bar.update(1)
                 self.retry_count = 0  # 成功解析，重置重试计数
@@ -232,5 +245,241 @@ class ContractSpider(scrapy.Spider):
                 dont_filter=True
             )
 
+    def _parse_rows(self, response_json):
+        """将一页 JSON 结果转换为 ContractItem"""
+        end_date_obj = datetime.strptime(self.end_date, "%Y-%m-%d")
+        for row in response_json.get("rows", []):
+            item = ContractItem()
+            item["sign_date"] = row.get("signDate", "").strip()
+            item["publish_date"] = row.get("publishDate", "").strip()
+            item["purchaser"] = row.get("purchaserName", "").strip()
+            item["supplier"] = row.get("supplyName", "").strip()
+            item["agent"] = row.get("agentName", "").strip()
+            item[
+                "contract_link"] = f'http://htgs.ccgp.gov.cn/GS8/contractpublish/detail/{row["uuid"]}?contractSign=0'
+            item["project_name"] = row.get("projName", "").strip()
+            item["contract_name"] = row.get("contractName", "").strip()
+
+            publish_date = item["publish_date"]
+            try:
+                date_obj = datetime.strptime(publish_date.split()[0], "%Y-%m-%d")
+                if date_obj == end_date_obj:
+                    continue
+                folder_path = os.path.join(self.download_dir, date_obj.strftime("%Y-%m"))
+                os.makedirs(folder_path, exist_ok=True)
+                file_path = os.path.join(folder_path, f"{date_obj.strftime('%Y-%m-%d')}.xlsx")
+            except (ValueError, IndexError):
+                self.custom_logger.warning(f"无效日期格式: {publish_date}")
+                continue
+
+            item["file_path"] = file_path
+            yield item
+
+    def _emit_rows(self, items):
+        """产出解析成功的合同数据；合并爬取在每条之后追加其详情页请求"""
+        yield from items
+
+    def _shard_payload(self, shard, page=0):
+        payload = self.base_payload.copy()
+        payload["searchPlacardStartDate"] = shard.start_date
+        payload["searchPlacardEndDate"] = shard.end_date
+        payload["currentPage"] = str(page)
+        return payload
+
+    def _count_request(self, shard):
+        return scrapy.FormRequest(
+            url=self.count_url,
+            method="POST",
+            headers=self.headers,
+            formdata=self._shard_payload(shard),
+            callback=self.parse_shard_count,
+            meta={"shard": shard.key, "count_retries": shard.count_retries},
+            dont_filter=True
+        )
 
+    def parse_shard_count(self, response):
+        """获取单个搜索窗口的总数，超过阈值时拆分窗口，否则开始并发翻页"""
+        key = response.meta["shard"]
+        shard = self.shards.get(key)
+        if shard is None:
+            # 分布式爬取时总数请求可能由其他节点调度
+            shard = self.shards[key] = SearchShard.from_key(key)
+        shard.count_retries = max(shard.count_retries, response.meta.get("count_retries", 0))
+        try:
+            total_count = int(json.loads(response.text))
+        except Exception as e:
+            self.custom_logger.error(f"[{shard.key}] 解析总数失败: {e}")
+            if shard.count_retries < self.max_retries:
+                shard.count_retries += 1
+                yield self._count_request(shard)
+            else:
+                self.custom_logger.error(f"[{shard.key}] 获取总数连续失败 {self.max_retries} 次，跳过该窗口")
+            return
+
+        if self.shard_mode == "adaptive" and total_count > self.shard_max_count and shard.days > 1:
+            del self.shards[shard.key]
+            children = shard.split()
+            self.custom_logger.info(
+                f"[{shard.key}] 合同数 {total_count} 超过 {self.shard_max_count}，拆分为: {[c.key for c in children]}"
+            )
+            for child in children:
+                self.shards[child.key] = child
+                yield self._count_request(child)
+            return
+
+        page_size = 20
+        total_pages = (total_count // page_size) + (1 if total_count % page_size != 0 else 0)
+        done = self._checkpointed_pages(shard, total_count, total_pages)
+        shard.total_count = total_count
+        # 分布式爬取时所有页一次性放入共享队列，由各节点分别取走，不再按窗口逐步补充
+        window = 0 if self.shared_queue else self.page_window
+        shard.tracker = PageTracker(total_pages, window=window, max_retries=self.max_retries, done=done)
+        self.custom_logger.info(f"[{shard.key}] 合同数: {total_count}, 总页数: {total_pages}, 已完成: {len(done)}")
+
+        progress_bar = self._page_progress()
+        progress_bar.total += total_pages
+        progress_bar.update(len(done))
+        yield from self._schedule_pages(shard)
+
+    def _page_progress(self):
+        """并发模式的进度条；分布式爬取的工作节点不运行 start_requests()，在第一次用到时创建"""
+        if self.progress_bar is None:
+            self.progress_bar = tqdm(total=0, desc="合同页", unit="页")
+        return self.progress_bar
+
+    def _checkpointed_pages(self, shard, total_count, total_pages):
+        """
+        读取断点中该窗口已完成的页。分页标记的是实时搜索结果中的位置，新发布的合同会使各页内容整体后移，
+        因此只有标记时记录的合同总数与本次相同才沿用；总数不同（或没有记录）时丢弃该窗口的分页标记，重新抓取全部页。
+        """
+        if self.checkpoint is None:
+            return set()
+        prefix = f"{shard.key}#"
+        recorded = self.checkpoint.done(KIND_SHARD_COUNT, f"{shard.key}@")
+        if recorded != {f"{shard.key}@{total_count}"}:
+            if self.checkpoint.done(KIND_PAGE, prefix):
+                self.custom_logger.warning(
+                    f"[{shard.key}] 合同总数与断点记录不同（{', '.join(sorted(recorded)) or '无记录'} -> {total_count}），重新抓取全部页"
+                )
+            self.checkpoint.discard(KIND_PAGE, prefix)
+            self.checkpoint.discard(KIND_SHARD_COUNT, f"{shard.key}@")
+            # 与该窗口的分页标记一起提交
+            self.checkpoint.mark(KIND_SHARD_COUNT, f"{shard.key}@{total_count}")
+            return set()
+        pages = {int(key[len(prefix):]) for key in self.checkpoint.done(KIND_PAGE, prefix)}
+        return {page for page in pages if page <= total_pages}
+
+    def _page_request(self, shard, page):
+        """构造并发模式下的分页请求"""
+        payload = self._shard_payload(shard, page)
+        return scrapy.FormRequest(
+            url=self.data_url,
+            method="POST",
+            headers=self.headers,
+            formdata=payload,
+            callback=self.parse_page,
+            meta={"page": page, "payload": payload, "shard": shard.key},
+            dont_filter=True
+        )
 
+    def _schedule_pages(self, shard):
+        for page in shard.tracker.next_pages():
+            yield self._page_request(shard, page)
+
+    def parse_page(self, response):
+        """并发模式下解析单页，完成后补充调度窗口内的后续页"""
+        if self.shared_queue:
+            yield from self._parse_shared_page(response)
+            return
+        shard = self.shards[response.meta["shard"]]
+        tracker = shard.tracker
+        page = response.meta["page"]
+        try:
+            if response.body == b'' or response.status != 200:
+                raise ValueError(f"返回空内容或状态码错误: {response.status}")
+            response_json = json.loads(response.text)
+            items = list(self._parse_rows(response_json))
+        except Exception as e:
+            self.custom_logger.error(f"[{shard.key}] 第 {page} 页解析失败: {e}")
+            if tracker.mark_failed(page):
+                self.custom_logger.warning(f"[{shard.key}] 第 {page} 页第 {tracker.retries[page]} 次重试")
+                yield self._page_request(shard, page)
+            else:
+                self.custom_logger.error(f"[{shard.key}] 第 {page} 页连续失败 {self.max_retries} 次，稍后补抓")
+                yield from self._schedule_pages(shard)
+            return
+
+        yield from self._emit_rows(items)
+        tracker.mark_done(page)
+        if self.checkpoint is not None:
+            # 由 ContractPipeline 在数据写入后提交
+            self.checkpoint.mark(KIND_PAGE, f"{shard.key}#{page}")
+        self.progress_bar.update(1)
+        self.custom_logger.info(f"[{shard.key}] 第 {page} 页完成，已完成 {len(tracker.done)}/{tracker.total_pages}")
+        yield from self._schedule_pages(shard)
+
+    def _parse_shared_page(self, response):
+        """分布式爬取时解析单页：页面可能由其他节点调度，重试次数随请求传递（meta["page_retries"]）"""
+        key = response.meta["shard"]
+        page = response.meta["page"]
+        try:
+            if response.body == b'' or response.status != 200:
+                raise ValueError(f"返回空内容或状态码错误: {response.status}")
+            response_json = json.loads(response.text)
+            items = list(self._parse_rows(response_json))
+        except Exception as e:
+            self.custom_logger.error(f"[{key}] 第 {page} 页解析失败: {e}")
+            retries = response.meta.get("page_retries", 0) + 1
+            if retries <= self.max_retries:
+                self.custom_logger.warning(f"[{key}] 第 {page} 页第 {retries} 次重试")
+                request = self._page_request(SearchShard.from_key(key), page)
+                request.meta["page_retries"] = retries
+                yield request
+            else:
+                self.custom_logger.error(f"[{key}] 第 {page} 页连续失败 {self.max_retries} 次，跳过该页")
+            return
+
+        yield from self._emit_rows(items)
+        if self.checkpoint is not None:
+            self.checkpoint.mark(KIND_PAGE, f"{key}#{page}")
+        self._page_progress().update(1)
+        self.custom_logger.info(f"[{key}] 第 {page} 页完成")
+
+    def spider_idle(self):
+        """所有在途页结束后，补抓缺页"""
+        incomplete = [
+            shard for shard in self.shards.values()
+            if shard.tracker is not None and shard.tracker.finished and shard.tracker.missing()
+        ]
+        if not incomplete:
+            return
+        if self.missing_rounds <= 0:
+            for shard in incomplete:
+                self.custom_logger.error(f"[{shard.key}] 以下页面最终失败: {shard.tracker.missing()}")
+            return
+
+        self.missing_rounds -= 1
+        for shard in incomplete:
+            pages = shard.tracker.requeue_missing()
+            self.custom_logger.warning(f"[{shard.key}] 重新调度缺页: {pages}")
+            for request in self._schedule_pages(shard):
+                self.crawler.engine.crawl(request)
+        raise DontCloseSpider
+
+    def closed(self, reason):
+        if self.progress_bar:
+            self.progress_bar.close()
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+        self.custom_logger.info(f"爬虫结束，原因：{reason}")
+        if self.shared_queue:
+            # 各页由多个节点分别完成，本节点的分页进度不完整
+            return
+        for shard in self.shards.values():
+            if shard.tracker is None:
+                self.custom_logger.error(f"[{shard.key}] 未获取到总数")
+                continue
+            self.custom_logger.info(
+                f"[{shard.key}] 完成 {len(shard.tracker.done)}/{shard.tracker.total_pages} 页，"
+                f"缺页: {shard.tracker.missing()}"
+            )
@@ -6,7 +6,10 @@ from datetime import datetime
 from scrapy.utils.project import get_project_settings
 from tqdm import tqdm
 from ContractSpider.items import DetailItem
+from ContractSpider.utils.checkpoint import KIND_DETAIL, open_checkpoint
+from ContractSpider.utils.detail_index import DetailIndex, contract_uuid
 from ContractSpider.utils.detail_link import DetailsExtractor
+from ContractSpider.utils.detail_parser import parse_detail
 
 
 class DetailSpider(scrapy.Spider):
@@ -36,6 +39,16 @@ class DetailSpider(scrapy.Spider):
         self.end_date = kwargs.get("DETAIL_END_DATE", settings.get("DETAIL_END_DATE", "2025-03-10"))
         self.extractor = DetailsExtractor(self.start_date, self.end_date)
 
+        # 断点续爬：默认跳过上次同一日期范围已保存的详情，-a resume=0 重新开始
+        self.resume = kwargs.get("resume", "1") == "1"
+        self.checkpoint = open_checkpoint(settings, f"{self.name}:{self.start_date}:{self.end_date}", self.resume)
+
+        # 增量抓取：跳过 detail_downloads 中已存在的合同，-a incremental=1 开启
+        self.incremental = kwargs.get("incremental", "1" if settings.getbool("DETAIL_INCREMENTAL") else "0") == "1"
+        self.detail_index = DetailIndex(settings.get("DETAIL_INDEX_PATH", os.path.join("logs", "detail_index.sqlite3")))
+        self.checkpoint_path = settings.get("CHECKPOINT_PATH") if settings.getbool("CHECKPOINT_ENABLED") else None
+        self.detail_folder = "detail_downloads"
+
         # 配置 logger：detail_yyyy_mm_dd.log
         today_str = datetime.now().strftime("%Y_%m_%d")
         log_file_path = f"logs/detail_{today_str}.log"
@@ -49,52 +62,53 @@ class DetailSpider(scrapy.Spider):
         self.custom_logger.addHandler(handler)
         self.custom_logger.propagate = False  # 防止打印到终端
 
-        self.progress_bar = None  # 初始化进度条
+        # 初始化进度条；分布式爬取的工作节点不运行 start_requests()，因此在这里创建
+        self.progress_bar = tqdm(total=0, desc="合同详情", unit="条")
 
     def start_requests(self):
-        urls = self.extractor.extract_urls(self)
-        self.progress_bar = tqdm(total=len(urls), desc="合同详情", unit="条")
-        for url in urls:
-            yield scrapy.Request(url=url, headers=self.headers, callback=self.parse)
+        # 链接按批从数据文件中读取，边读边发请求，进度条总数随读取进度增长
+        done = self.checkpoint.done(KIND_DETAIL) if self.checkpoint is not None else set()
+        known = self.load_known_uuids() if self.incremental else set()
+
+        total = skipped_done = skipped_known = 0
+        for urls in self.extractor.iter_url_batches(self):
+            total += len(urls)
+            remaining = []
+            for url in urls:
+                if url in done:
+                    skipped_done += 1
+                elif known and contract_uuid(url) in known:
+                    skipped_known += 1
+                else:
+                    remaining.append(url)
+            self.progress_bar.total += len(remaining)
+            self.progress_bar.refresh()
+            for url in remaining:
+                yield scrapy.Request(url=url, headers=self.headers, callback=self.parse, meta={"contract_link": url})
+
+        if self.checkpoint is not None:
+            self.custom_logger.info(f"断点续爬：共 {total} 条，已完成 {skipped_done} 条")
+        if self.incremental:
+            self.custom_logger.info(f"增量抓取：共 {total} 条，已存在 {skipped_known} 条，需抓取 {self.progress_bar.total} 条")
+
+    def load_known_uuids(self):
+        """刷新索引并返回已保存的合同 UUID"""
+        scanned = self.detail_index.refresh(self.detail_folder, self.checkpoint_path, self.custom_logger)
+        known = self.detail_index.uuids()
+        self.custom_logger.info(f"增量抓取：扫描 {scanned} 个新数据文件，索引 {len(known)} 个合同")
+        return known
 
     def parse(self, response):
         """解析合同详情并存储到 DetailItem"""
         try:
-            content = response.css("div.content_2020")
-
-            item = DetailItem()
-            item["contract_number"] = content.xpath(".//p/strong[contains(text(), '合同编号')]/text()").get("").strip().replace('一、合同编号：  ', '')
-            item["contract_name"] = content.xpath(".//p/strong[contains(text(), '合同名称')]/text()").get("").strip().replace('二、合同名称：  ', '')
-            item["project_number"] = content.xpath(".//p/strong[contains(text(), '项目编号')]/text()").get("").strip().replace('三、项目编号：  ', '')
-            item["project_name"] = content.xpath(".//p/strong[contains(text(), '项目名称')]/text()").get("").strip().replace('四、项目名称：  ', '')
-            item["purchaser"] = content.xpath(".//p[contains(text(), '采购人（甲方）')]/text()").get("").split("：")[-1].strip()
-            item["purchaser_address"] = content.xpath(".//p[contains(text(), '地  址')][1]/text()").get("").split("：")[-1].strip()
-            item["purchaser_contact"] = content.xpath(".//p[contains(text(), '联系方式')][1]/text()").get("").split("：")[-1].strip()
-            item["supplier"] = content.xpath(".//p[contains(text(), '供应商（乙方）')]/text()").get("").split("：")[-1].strip()
-            item["supplier_address"] = content.xpath(".//p[contains(text(), '地  址')][2]/text()").get("").split("：")[-1].strip()
-            item["supplier_contact"] = content.xpath(".//p[contains(text(), '联系方式')][2]/text()").get("").split("：")[-1].strip()
-            item["main_product_name"] = content.xpath(".//p[contains(text(), '主要标的名称')]/text()").get("").replace('主要标的名称：', '').replace(';', '')
-            item["specifications"] = content.xpath(".//p[contains(text(), '规格型号（或服务要求）')]/text()").get("").split("：")[-1].strip()
-            item["quantity"] = content.xpath(".//p[contains(text(), '主要标的数量')]/text()").get("").split("：")[-1].strip()
-            item["unit_price"] = content.xpath(".//p[contains(text(), '主要标的单价')]/text()").get("").split("：")[-1].strip()
-            item["contract_amount"] = content.xpath(".//p[contains(text(), '合同金额')]/text()").get("").strip().replace('合同金额：', '').replace('\t', '').replace('\n', '').replace('\r', '')
-            item["performance_location"] = content.xpath(".//p[contains(text(), '履约期限、地点等简要信息')]/text()").get("").strip().replace('履约期限、地点等简要信息：', '').replace('\t', '').replace('\n', '').replace('\r', '')
-            item["procurement_method"] = content.xpath(".//p[contains(text(), '采购方式')]/text()").get("").strip().strip().replace('合同金额：', '').replace('\t', '').replace('\n', '').replace('\r', '')
-            item["contract_sign_date"] = content.xpath(".//p/strong[contains(text(), '合同签订日期')]/text()").get("").strip().replace('七、合同签订日期：\r\n\t\t\t\t\t\t\t', '')
-            item["contract_announcement_date"] = content.xpath(".//p/strong[contains(text(), '合同公告日期')]/text()").get("").strip().replace('八、合同公告日期：\r\n\t\t\t\t\t\t\t', '')
-
-            # 解析附件
-            item["attachment_name"] = content.xpath(".//li[@class='fileInfo']/div/b/text()").getall()
-
-            attachment_scripts = content.xpath(".//li[@class='fileInfo']//a/@onclick").getall()
-            item["attachment_download_url"] = []
-
-            for script in attachment_scripts:
-                start = script.find("('") + 2
-                end = script.find("','")
-                if start != -1 and end != -1:
-                    file_id = script[start:end]
-                    item["attachment_download_url"].append(f"https://download.ccgp.gov.cn/oss/download?uuid={file_id}")
+            fields = parse_detail(response.selector.root)
+            if fields is None:
+                self.custom_logger.error(f"[错误] 未找到合同详情正文: {response.url}")
+                self.progress_bar.update(1)
+                return
+
+            item = DetailItem(fields)
+            item["contract_link"] = response.meta.get("contract_link", response.url)
 
             yield item
 
@@ -107,6 +121,9 @@ class DetailSpider(scrapy.Spider):
 
     def closed(self, reason):
         """爬虫结束时关闭进度条"""
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+        self.detail_index.close()
         if self.progress_bar:
             self.progress_bar.close()
             self.custom_logger.info("所有合同详情爬取完成。")
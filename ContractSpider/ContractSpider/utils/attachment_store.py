@@ -0,0 +1,125 @@
+# 按内容寻址的附件存储：相同内容只保存一份，各合同下的文件名以硬链接指向同一份内容
+#
+# 目录结构：
+#   attachments/.store/<sha256[:2]>/<sha256>     唯一内容
+#   attachments/.store/manifest.sqlite3          内容、下载 UUID 与合同文件名的对应关系
+#   attachments/YYYY-MM/{合同编号}_{合同名称}_{序号}.ext -> 硬链接（不支持时复制）
+
+import os
+import shutil
+import sqlite3
+from typing import Dict, Iterable, Optional, Set
+
+STORE_FOLDER = ".store"
+
+
+class AttachmentStore:
+    """
+    - put(): 将校验通过的临时文件按 sha256 存入仓库，内容已存在时直接丢弃临时文件
+    - link(): 为合同文件名创建指向仓库内容的硬链接
+    - sha_for_uuid(): 下载前按附件 UUID 查询是否已有内容，避免重复下载
+    """
+
+    def __init__(self, base_folder: str):
+        self.root = os.path.join(base_folder, STORE_FOLDER)
+        os.makedirs(self.root, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(self.root, "manifest.sqlite3"), timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS blobs (sha256 TEXT PRIMARY KEY, size INTEGER, ext TEXT)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS uuids (uuid TEXT PRIMARY KEY, sha256 TEXT NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS links (path TEXT PRIMARY KEY, sha256 TEXT NOT NULL)")
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def sha_for_uuid(self, uuid: str) -> Optional[str]:
+        row = self.conn.execute("SELECT sha256 FROM uuids WHERE uuid = ?", (uuid,)).fetchone()
+        if row is None or not os.path.exists(self.blob_path(row[0])):
+            return None
+        return row[0]
+
+    def put(self, part: str, sha256: str, uuid: Optional[str] = None, ext: str = "") -> str:
+        """存入内容并记录 UUID，返回 sha256"""
+        blob = self.blob_path(sha256)
+        if os.path.exists(blob):
+            os.remove(part)
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(part, blob)
+
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO blobs (sha256, size, ext) VALUES (?, ?, ?)",
+                (sha256, os.path.getsize(blob), ext or ""),
+            )
+            if uuid:
+                self.conn.execute("INSERT OR REPLACE INTO uuids (uuid, sha256) VALUES (?, ?)", (uuid, sha256))
+        return sha256
+
+    def link(self, sha256: str, file_path: str) -> str:
+        """为合同文件名创建指向内容的硬链接（文件名没有扩展名时补上内容的扩展名），返回最终路径"""
+        if not os.path.splitext(file_path)[1]:
+            row = self.conn.execute("SELECT ext FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+            file_path = f"{file_path}{row[0] if row else ''}"
+
+        if not os.path.exists(file_path):
+            os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+            tmp_path = f"{file_path}.tmp"
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            try:
+                os.link(self.blob_path(sha256), tmp_path)
+            except OSError:
+                # 跨磁盘或文件系统不支持硬链接时退化为复制
+                shutil.copy2(self.blob_path(sha256), tmp_path)
+            os.replace(tmp_path, file_path)
+
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO links (path, sha256) VALUES (?, ?)", (file_path, sha256))
+        return file_path
+
+    def close(self):
+        self.conn.close()
+
+
+class FolderIndex:
+    """
+    附件目录的内存索引：每个文件夹只扫描一次，之后 O(1) 判断合同文件是否已下载。
+    与原先的 glob("{文件名}.*") 等价，并且文件名本身已带扩展名时也能匹配。
+    ignore_suffixes 中的临时文件（.part / .tmp 等）不计入。
+    """
+
+    def __init__(self, base_folder: str, ignore_suffixes: Iterable[str] = ()):
+        self.base_folder = base_folder
+        self.ignore_suffixes = tuple(ignore_suffixes)
+        self.folders: Dict[str, Set[str]] = {}
+
+    def _scan(self, folder: str) -> Set[str]:
+        keys = self.folders.get(folder)
+        if keys is None:
+            keys = set()
+            path = os.path.join(self.base_folder, folder)
+            if os.path.isdir(path):
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            self._add_name(keys, entry.name)
+            self.folders[folder] = keys
+        return keys
+
+    def _add_name(self, keys: Set[str], name: str):
+        if self.ignore_suffixes and name.endswith(self.ignore_suffixes):
+            return
+        keys.add(name)
+        # 去掉任意个扩展名后的文件名，对应 glob("{stem}.*")
+        index = name.find(".")
+        while index > 0:
+            keys.add(name[:index])
+            index = name.find(".", index + 1)
+
+    def exists(self, folder: str, file_name: str) -> bool:
+        return file_name in self._scan(folder)
+
+    def add(self, folder: str, file_name: str):
+        self._add_name(self._scan(folder), file_name)
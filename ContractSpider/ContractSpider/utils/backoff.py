@@ -0,0 +1,84 @@
+# 非阻塞退避重试：按请求延迟重新入队，等待期间不阻塞 reactor 与其他下载
+
+import random
+from typing import Dict
+
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest
+
+BACKOFF_META = "backoff_attempts"  # 已退避的次数，决定下一次的延迟上限
+RESCHEDULED_META = "backoff_rescheduled"  # 原请求已被重新调度，errback 应忽略
+
+
+class BackoffScheduler:
+    """
+    将需要重试的请求在一段延迟后通过 engine.crawl() 重新入队：
+    - 延迟为指数退避加完全抖动：uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    - 仍有等待中的请求时阻止爬虫因空闲而关闭
+    同一个 crawler 内的中间件共享一个调度器。
+    """
+
+    def __init__(self, crawler, base_delay: float = 2.0, max_delay: float = 60.0):
+        self.crawler = crawler
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.pending: Dict[int, object] = {}  # id(request) -> DelayedCall
+        crawler.signals.connect(self.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = getattr(crawler, "backoff_scheduler", None)
+        if scheduler is None:
+            scheduler = cls(
+                crawler,
+                base_delay=crawler.settings.getfloat("BACKOFF_BASE_DELAY", 2.0),
+                max_delay=crawler.settings.getfloat("BACKOFF_MAX_DELAY", 60.0),
+            )
+            crawler.backoff_scheduler = scheduler
+        return scheduler
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def schedule(self, request, spider) -> float:
+        """延迟后重新入队 request，返回本次延迟的秒数"""
+        from twisted.internet import reactor
+
+        attempt = request.meta.get(BACKOFF_META, 0)
+        request.meta[BACKOFF_META] = attempt + 1
+        request.meta.pop(RESCHEDULED_META, None)
+        request.dont_filter = True
+
+        delay = self.delay(attempt)
+        self.pending[id(request)] = reactor.callLater(delay, self._enqueue, request, spider)
+        return delay
+
+    def reschedule(self, request, retry_request, spider) -> IgnoreRequest:
+        """
+        在下载中间件中使用：调度 retry_request 并标记原请求，
+        返回的 IgnoreRequest 由调用方抛出以结束原请求。
+        """
+        delay = self.schedule(retry_request, spider)
+        request.meta[RESCHEDULED_META] = True
+        return IgnoreRequest(f"{delay:.1f} 秒后重试: {request.url}")
+
+    def _enqueue(self, request, spider):
+        self.pending.pop(id(request), None)
+        self.crawler.engine.crawl(request)
+
+    def spider_idle(self, spider):
+        if self.pending:
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        for call in self.pending.values():
+            if call.active():
+                call.cancel()
+        self.pending.clear()
+
+
+def is_rescheduled(failure) -> bool:
+    """errback 中判断失败是否只是因为请求已被退避重新调度"""
+    request = getattr(failure, "request", None)
+    return bool(failure.check(IgnoreRequest) and request is not None and request.meta.get(RESCHEDULED_META))
@@ -0,0 +1,73 @@
+# 按目标文件缓存数据行，批量写入，避免每条数据都重新打开一次文件
+
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+
+class BufferedWriter:
+    """
+    按 file_path 在内存中累积数据行，达到阈值或调用 flush() 时批量写入。
+    - write_func(file_path, df): 实际执行写入的函数
+    - max_rows: 所有文件缓存行数之和达到该值时自动刷新
+    - retry_interval: 刷新失败后，写入失败的行仍计入缓存行数；该秒数内 append() 不再自动刷新，
+      避免某个日文件持续写入失败时每条数据都重试一次全部写入（显式调用 flush() 不受限制）
+    """
+
+    def __init__(self, write_func: Callable[[str, pd.DataFrame], None], max_rows: int = 200,
+                 retry_interval: float = 30):
+        self.write_func = write_func
+        self.max_rows = max_rows
+        self.retry_interval = retry_interval
+        self.buffers: Dict[str, List[dict]] = OrderedDict()
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+        self.failed = False  # 上次刷新是否有文件写入失败
+
+    def append(self, file_path: str, row: dict) -> int:
+        """缓存一行数据，达到阈值时刷新，返回本次写入的行数"""
+        self.buffers.setdefault(file_path, []).append(row)
+        self.pending_rows += 1
+        if self.max_rows and self.pending_rows >= self.max_rows:
+            if self.failed and time.monotonic() - self.last_flush < self.retry_interval:
+                return 0
+            return self.flush()
+        return 0
+
+    def flush(self, file_path: Optional[str] = None) -> int:
+        """将缓存写入对应文件（可只刷新指定文件），写入失败的文件保留在缓存中等待下次刷新"""
+        written = 0
+        errors = []
+        targets = list(self.buffers) if file_path is None else [file_path]
+        for file_path in targets:
+            rows = self.buffers.get(file_path)
+            if rows is None:
+                continue
+            if not rows:
+                del self.buffers[file_path]
+                continue
+            try:
+                self.write_func(file_path, pd.DataFrame(rows))
+            except Exception as e:
+                errors.append((file_path, e))
+                continue
+            written += len(rows)
+            self.pending_rows -= len(rows)
+            del self.buffers[file_path]
+
+        self.last_flush = time.monotonic()
+        self.failed = bool(errors)
+        if errors:
+            file_path, error = errors[0]
+            raise BufferFlushError(f"{len(errors)} 个文件写入失败，例如 {file_path}: {error}", written)
+        return written
+
+
+class BufferFlushError(Exception):
+    """批量写入部分失败，written 为已成功写入的行数"""
+
+    def __init__(self, message: str, written: int = 0):
+        super().__init__(message)
+        self.written = written
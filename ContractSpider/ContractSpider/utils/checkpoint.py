@@ -0,0 +1,86 @@
+# 断点续爬：使用 SQLite 记录每个任务已完成的分页、详情链接与附件 UUID
+
+import os
+import sqlite3
+from typing import Iterable, Optional, Set
+
+KIND_PAGE = "page"
+KIND_DETAIL = "detail"
+KIND_ATTACHMENT = "attachment"
+KIND_SHARD_COUNT = "shard_count"  # 搜索窗口标记分页时的合同总数，key 为 "{窗口}@{总数}"
+
+
+class CheckpointStore:
+    """
+    按任务（job，例如 "detail:2025-03-01:2025-03-10"）记录已完成的工作。
+    mark() 只写入内存，commit() 时才落盘，调用方应在对应数据真正写入磁盘后再提交，
+    这样异常退出时不会把未保存的数据记为已完成。
+    """
+
+    def __init__(self, path: str, job: str):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.job = job
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " job TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL,"
+            " PRIMARY KEY (job, kind, key))"
+        )
+        self.conn.commit()
+        self.pending = []
+
+    def mark(self, kind: str, key: str):
+        """记录一项已完成的工作（提交前不落盘）"""
+        self.pending.append((self.job, kind, key))
+
+    def mark_many(self, kind: str, keys: Iterable[str]):
+        self.pending.extend((self.job, kind, key) for key in keys)
+
+    def commit(self) -> int:
+        """将已记录的工作写入数据库，返回提交的条数"""
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, []
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO checkpoints (job, kind, key) VALUES (?, ?, ?)", pending)
+        return len(pending)
+
+    def done(self, kind: str, prefix: str = "") -> Set[str]:
+        """已提交的工作集合，可按 key 前缀过滤"""
+        rows = self.conn.execute(
+            "SELECT key FROM checkpoints WHERE job = ? AND kind = ? AND substr(key, 1, ?) = ?",
+            (self.job, kind, len(prefix), prefix),
+        )
+        return {row[0] for row in rows}
+
+    def discard(self, kind: str, prefix: str = ""):
+        """删除当前任务中 key 以 prefix 开头的记录（包括尚未提交的）"""
+        self.pending = [p for p in self.pending if not (p[1] == kind and p[2].startswith(prefix))]
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM checkpoints WHERE job = ? AND kind = ? AND substr(key, 1, ?) = ?",
+                (self.job, kind, len(prefix), prefix),
+            )
+
+    def clear(self):
+        """清空当前任务的断点，重新开始"""
+        self.pending = []
+        with self.conn:
+            self.conn.execute("DELETE FROM checkpoints WHERE job = ?", (self.job,))
+
+    def close(self):
+        self.conn.close()
+
+
+def open_checkpoint(settings, job: str, resume: bool = True) -> Optional[CheckpointStore]:
+    """根据配置打开断点记录，未启用时返回 None；resume 为 False 时清空该任务的断点"""
+    if not settings.getbool("CHECKPOINT_ENABLED", False):
+        return None
+    store = CheckpointStore(settings.get("CHECKPOINT_PATH", os.path.join("logs", "checkpoint.sqlite3")), job)
+    if not resume:
+        store.clear()
+    return store
@@ -0,0 +1,86 @@
+# 已抓取详情的合同 UUID 索引，用于增量抓取详情页
+
+import os
+import re
+import sqlite3
+from typing import Iterable, Optional, Set
+
+from ContractSpider.utils.checkpoint import KIND_DETAIL
+from ContractSpider.utils.storage import list_day_sources, read_table
+
+LINK_COLUMN = "网页链接"
+_UUID_PATTERN = re.compile(r"/detail/([^/?#]+)")
+
+
+def contract_uuid(link) -> Optional[str]:
+    """从详情链接 .../contractpublish/detail/{uuid}?contractSign=0 中取出合同 UUID"""
+    if not isinstance(link, str):
+        return None
+    match = _UUID_PATTERN.search(link)
+    return match.group(1) if match else None
+
+
+class DetailIndex:
+    """
+    已抓取合同 UUID 的持久化索引：
+    - refresh() 扫描 detail_downloads 中新增或修改过的日文件，并合并断点记录中的详情链接
+    - add_links() 由 DetailPipeline 在日文件提交后调用，保持索引最新
+    """
+
+    def __init__(self, path: str):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS detail_uuids (uuid TEXT PRIMARY KEY)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS indexed_sources (path TEXT PRIMARY KEY, mtime REAL)")
+
+    def add_links(self, links: Iterable[str]) -> int:
+        uuids = {uuid for uuid in map(contract_uuid, links) if uuid}
+        if not uuids:
+            return 0
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO detail_uuids (uuid) VALUES (?)", [(u,) for u in uuids])
+        return len(uuids)
+
+    def uuids(self) -> Set[str]:
+        return {row[0] for row in self.conn.execute("SELECT uuid FROM detail_uuids")}
+
+    def refresh(self, base_folder: str, checkpoint_path: Optional[str] = None, logger=None) -> int:
+        """增量扫描详情数据与断点记录，返回新扫描的数据源数量"""
+        indexed = dict(self.conn.execute("SELECT path, mtime FROM indexed_sources"))
+        scanned = 0
+        for path in list_day_sources(base_folder, "0000-00-00", "9999-99-99"):
+            mtime = os.path.getmtime(path)
+            if indexed.get(path) == mtime:
+                continue
+            try:
+                df = read_table(path, columns=[LINK_COLUMN])
+            except Exception as e:
+                if logger:
+                    logger.error(f"❌ 读取 {path} 失败，跳过索引: {e}")
+                continue
+            if LINK_COLUMN in df.columns:
+                self.add_links(df[LINK_COLUMN].dropna())
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO indexed_sources (path, mtime) VALUES (?, ?)", (path, mtime))
+            scanned += 1
+
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self._merge_checkpoint(checkpoint_path)
+        return scanned
+
+    def _merge_checkpoint(self, checkpoint_path: str):
+        conn = sqlite3.connect(checkpoint_path, timeout=30)
+        try:
+            rows = conn.execute("SELECT key FROM checkpoints WHERE kind = ?", (KIND_DETAIL,))
+            self.add_links(row[0] for row in rows)
+        except sqlite3.OperationalError:
+            pass  # 断点库尚未创建表
+        finally:
+            conn.close()
+
+    def close(self):
+        self.conn.close()
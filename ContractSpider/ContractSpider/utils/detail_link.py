@@ -1,8 +1,9 @@
 import os
-import glob
 import pandas as pd
 from scrapy.utils.project import get_project_settings
 
+from ContractSpider.utils.storage import iter_table, list_day_sources
+
 class DetailsExtractor:
     def __init__(self, start_date, end_date):
         self.settings = get_project_settings()
@@ -10,45 +11,31 @@ class DetailsExtractor:
         self.end_date = end_date
         self.downloads_folder = "downloads"  # 根目录
         self.target_column = "网页链接"  # 需要提取的列名
-        self.urls = []
+        self.read_formats = self.settings.getlist("STORAGE_READ_FORMATS", ["parquet", "xlsx"])
+        self.chunk_size = self.settings.getint("STORAGE_READ_CHUNK_SIZE", 10000)
 
     def get_matching_files(self):
-        """获取符合日期范围的 Excel 文件（遍历子文件夹）"""
-        matching_files = []
-        start_month = self.start_date[:7]  # 例如 "2025-03"
-        end_month = self.end_date[:7]  # 例如 "2025-04"
-
-        for folder in os.listdir(self.downloads_folder):
-            folder_path = os.path.join(self.downloads_folder, folder)
-            if not os.path.isdir(folder_path):
-                continue  # 跳过非文件夹
-
-            if start_month <= folder <= end_month:  # 只处理符合时间范围的子文件夹
-                for file_path in glob.glob(os.path.join(folder_path, "*.xlsx")):
-                    filename = os.path.basename(file_path)
-                    date_str = filename.split('.')[0]  # 假设文件名格式为 YYYY-MM-DD.xlsx
-                    if self.start_date <= date_str <= self.end_date:
-                        matching_files.append(file_path)
+        """获取符合日期范围的数据文件（Parquet 分区目录或 Excel 文件）"""
+        return list_day_sources(self.downloads_folder, self.start_date, self.end_date, prefer=self.read_formats)
 
-        return matching_files
-
-    def extract_urls(self, spider):
-        """从 Excel 文件中提取 URL"""
+    def iter_url_batches(self, spider):
+        """从搜索页数据中逐个文件、逐块提取 URL，每次产出一批（列表），不在内存中保留全部链接"""
         matching_files = self.get_matching_files()
         if not matching_files:
-            spider.custom_logger.info("❌ 未找到匹配的 Excel 文件")
-            return []
+            spider.custom_logger.info("❌ 未找到匹配的数据文件")
+            return
 
         for file_path in matching_files:
+            count = 0
             try:
-                df = pd.read_excel(file_path, dtype=str)  # 读取 Excel 文件
-                if self.target_column in df.columns:
+                for df in iter_table(file_path, columns=[self.target_column], chunk_size=self.chunk_size):
+                    if self.target_column not in df.columns:
+                        spider.custom_logger.error(f"⚠️ {file_path} 中未找到 '{self.target_column}' 列")
+                        break
                     urls = df[self.target_column].dropna().tolist()  # 读取非空的网页链接
-                    self.urls.extend(urls)
-                    spider.custom_logger.info(f"✅ 从 {file_path} 提取 {len(urls)} 个链接")
+                    count += len(urls)
+                    yield urls
                 else:
-                    spider.custom_logger.error(f"⚠️ {file_path} 中未找到 '{self.target_column}' 列")
+                    spider.custom_logger.info(f"✅ 从 {file_path} 提取 {count} 个链接")
             except Exception as e:
                 spider.custom_logger.error(f"❌ 读取 {file_path} 失败: {e}")
-
-        return self.urls
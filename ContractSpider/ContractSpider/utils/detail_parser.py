@@ -0,0 +1,123 @@
+# 合同详情页解析：一次遍历 div.content_2020 下的段落，按标签查表填充 DetailItem 字段
+#
+# 页面中每个字段是一段 “标签：值” 文本，例如：
+#   <p><strong>一、合同编号：  HT2025...</strong></p>
+#   <p>地  址：某市人民路 100 号</p>
+# 标签去掉序号与空白后查 LABEL_FIELDS；“地址”“联系方式”按所在的甲方 / 乙方段落区分。
+
+import re
+from typing import Dict, Optional
+
+DETAIL_FIELDS = (
+    "contract_number", "contract_name", "project_number", "project_name",
+    "purchaser", "purchaser_address", "purchaser_contact",
+    "supplier", "supplier_address", "supplier_contact",
+    "main_product_name", "specifications", "quantity", "unit_price", "contract_amount",
+    "performance_location", "procurement_method", "contract_sign_date", "contract_announcement_date",
+)
+
+LABEL_FIELDS = {
+    "合同编号": "contract_number",
+    "合同名称": "contract_name",
+    "项目编号": "project_number",
+    "项目名称": "project_name",
+    "采购人（甲方）": "purchaser",
+    "供应商（乙方）": "supplier",
+    "主要标的名称": "main_product_name",
+    "规格型号（或服务要求）": "specifications",
+    "主要标的数量": "quantity",
+    "主要标的单价": "unit_price",
+    "合同金额": "contract_amount",
+    "履约期限、地点等简要信息": "performance_location",
+    "采购方式": "procurement_method",
+    "合同签订日期": "contract_sign_date",
+    "合同公告日期": "contract_announcement_date",
+}
+
+# 原先的实现对这些字段取最后一个冒号之后的文本，例如 “联系方式：联系人：王老师 电话：021-66668888” 只保留电话；
+# 保持不变，已保存的数据列不受影响
+LAST_SEGMENT_FIELDS = {
+    "purchaser", "purchaser_address", "purchaser_contact",
+    "supplier", "supplier_address", "supplier_contact",
+    "specifications", "quantity", "unit_price",
+}
+
+# 出现在甲方、乙方两段中的标签，字段名为 {当前段落}_{后缀}
+PARTY_LABELS = {"地址": "address", "联系方式": "contact"}
+PARTY_FIELDS = {"purchaser", "supplier"}
+
+DOWNLOAD_URL = "https://download.ccgp.gov.cn/oss/download?uuid={}"
+
+_LABEL_PREFIX = re.compile(r"^[一二三四五六七八九十]+、")
+_LABEL_SPACES = re.compile(r"[\s　]+")
+_VALUE_CONTROLS = re.compile(r"[\r\n\t]+")
+_ONCLICK_UUID = re.compile(r"\('([^']*)','")
+
+
+def clean_value(text: str) -> str:
+    """去掉换行与制表符，全角与不换行空格视为普通空格，再去掉首尾空白"""
+    return _VALUE_CONTROLS.sub("", text).replace("\xa0", " ").replace("　", " ").strip()
+
+
+def split_label(text: str):
+    """拆分 “标签：值”，返回 (标准化后的标签, 值)；没有冒号时返回 (None, None)"""
+    index = text.find("：")
+    if index < 0:
+        return None, None
+    label = _LABEL_PREFIX.sub("", _LABEL_SPACES.sub("", text[:index]))
+    label = label.replace("(", "（").replace(")", "）")
+    return label, text[index + 1:]
+
+
+def find_content(root):
+    """在 lxml 文档中定位正文 div.content_2020"""
+    for div in root.iter("div"):
+        if "content_2020" in (div.get("class") or "").split():
+            return div
+    return None
+
+
+def parse_detail(root) -> Optional[Dict[str, object]]:
+    """
+    解析详情页（lxml 根节点，例如 response.selector.root），返回 DetailItem 各字段；
+    找不到正文时返回 None。缺少的字段为空字符串，附件字段为列表。
+    """
+    content = find_content(root)
+    if content is None:
+        return None
+
+    fields: Dict[str, object] = dict.fromkeys(DETAIL_FIELDS, "")
+    names, urls = [], []
+    party = "purchaser"
+
+    for element in content.iter("p", "li"):
+        if element.tag == "li":
+            if "fileInfo" in (element.get("class") or "").split():
+                names.extend(b.text for b in element.iterfind("div/b") if b.text)
+                for a in element.iter("a"):
+                    match = _ONCLICK_UUID.search(a.get("onclick") or "")
+                    if match:
+                        urls.append(DOWNLOAD_URL.format(match.group(1)))
+            continue
+
+        label, value = split_label("".join(element.itertext()))
+        if label is None:
+            continue
+        field = LABEL_FIELDS.get(label)
+        if field in PARTY_FIELDS:
+            party = field
+        elif field is None and label in PARTY_LABELS:
+            field = f"{party}_{PARTY_LABELS[label]}"
+        if field is None or fields[field]:
+            continue  # 未知标签，或同一字段已经取到值
+
+        if field in LAST_SEGMENT_FIELDS:
+            value = value.rpartition("：")[2]
+        value = clean_value(value)
+        if field == "main_product_name":
+            value = value.replace(";", "")
+        fields[field] = value
+
+    fields["attachment_name"] = names
+    fields["attachment_download_url"] = urls
+    return fields
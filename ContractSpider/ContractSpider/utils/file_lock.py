@@ -0,0 +1,89 @@
+# 跨进程文件锁：多个爬虫进程（并行回填、重叠日期的多次运行）读-改-写同一个日文件时串行化
+#
+# 锁加在旁边的 {文件}.lock 上而不是数据文件本身：数据文件通过临时文件 + os.replace 原子替换，
+# 替换后是新的 inode，加在旧文件上的锁会失效。锁文件保留在原处，不需要清理。
+# POSIX 使用 fcntl.flock，Windows 使用 msvcrt.locking；进程退出时操作系统自动释放锁。
+
+import os
+import time
+from typing import Optional
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+    def _unlock(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock(fd):
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class FileLockTimeout(TimeoutError):
+    pass
+
+
+class FileLock:
+    """
+    with FileLock(file_path, timeout=60): ...
+    排他锁，不可重入：同一进程内对同一文件只能持有一把锁。等待期间阻塞当前线程，
+    超过 timeout 秒（None 表示一直等待）抛出 FileLockTimeout。
+    timeout=0 只尝试一次，锁被占用时立即抛出 FileLockTimeout；在 reactor 线程中（管道）只能这样使用，
+    由调用方稍后重试，不能阻塞等待。
+    """
+
+    SUFFIX = ".lock"
+
+    def __init__(self, path: str, timeout: Optional[float] = None, poll_interval: float = 0.05):
+        self.lock_path = f"{path}{self.SUFFIX}"
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.fd = None
+
+    def acquire(self):
+        folder = os.path.dirname(self.lock_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            try:
+                _lock(fd)
+                break
+            except OSError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    os.close(fd)
+                    if not self.timeout:
+                        raise FileLockTimeout(f"文件锁被其他进程占用: {self.lock_path}")
+                    raise FileLockTimeout(f"等待文件锁超时（{self.timeout}s）: {self.lock_path}")
+                time.sleep(self.poll_interval)
+        self.fd = fd
+
+    def release(self):
+        if self.fd is None:
+            return
+        try:
+            _unlock(self.fd)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+    @property
+    def locked(self) -> bool:
+        return self.fd is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
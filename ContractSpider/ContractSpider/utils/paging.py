@@ -0,0 +1,124 @@
+# 搜索页分页进度：以集合记录已完成的页，支持滑动窗口并发与缺页补抓，以及按日期拆分搜索窗口
+
+from collections import deque
+from datetime import date, datetime, timedelta
+from typing import Iterable, List
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+class PageTracker:
+    """
+    记录一个搜索条件下的分页进度：
+    - window: 同时在途的最大页数（0 表示一次性调度全部页）
+    - max_retries: 单页连续失败的最大重试次数，超过后记为缺页
+    """
+
+    def __init__(self, total_pages: int, window: int = 0, max_retries: int = 3, done: Iterable[int] = ()):
+        self.total_pages = total_pages
+        self.window = window
+        self.max_retries = max_retries
+        self.done = set(done)
+        self.in_flight = set()
+        self.failed = set()
+        self.retries = {}
+        self.pending = deque(p for p in range(1, total_pages + 1) if p not in self.done)
+
+    def next_pages(self) -> List[int]:
+        """取出可以立即调度的页，保证在途页数不超过窗口大小"""
+        pages = []
+        while self.pending and (not self.window or len(self.in_flight) < self.window):
+            page = self.pending.popleft()
+            if page in self.done or page in self.in_flight:
+                continue
+            self.in_flight.add(page)
+            pages.append(page)
+        return pages
+
+    def mark_done(self, page: int):
+        self.in_flight.discard(page)
+        self.failed.discard(page)
+        self.retries.pop(page, None)
+        self.done.add(page)
+
+    def mark_failed(self, page: int) -> bool:
+        """记录一次失败，返回 True 表示应立即重试该页（仍计为在途）"""
+        retries = self.retries.get(page, 0) + 1
+        self.retries[page] = retries
+        if retries <= self.max_retries:
+            return True
+        self.in_flight.discard(page)
+        self.failed.add(page)
+        return False
+
+    def missing(self) -> List[int]:
+        """已放弃的缺页"""
+        return sorted(self.failed - self.done)
+
+    def requeue_missing(self) -> List[int]:
+        """将缺页重新放回待调度队列，并清空其重试计数"""
+        pages = self.missing()
+        for page in pages:
+            self.failed.discard(page)
+            self.retries.pop(page, None)
+            self.pending.append(page)
+        return pages
+
+    @property
+    def finished(self) -> bool:
+        return not self.pending and not self.in_flight
+
+    @property
+    def complete(self) -> bool:
+        return len(self.done) >= self.total_pages
+
+
+class SearchShard:
+    """一个搜索日期窗口（起止日期均包含），拥有独立的分页进度"""
+
+    def __init__(self, start_date: str, end_date: str):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.key = f"{start_date}~{end_date}"
+        self.total_count = None
+        self.count_retries = 0
+        self.tracker = None
+
+    @classmethod
+    def from_key(cls, key: str) -> "SearchShard":
+        """由 key（起始日期~结束日期）还原窗口，用于处理其他节点调度的请求"""
+        start_date, end_date = key.split("~")
+        return cls(start_date, end_date)
+
+    @property
+    def days(self) -> int:
+        return (_to_date(self.end_date) - _to_date(self.start_date)).days + 1
+
+    def split(self) -> List["SearchShard"]:
+        """按天数对半拆分"""
+        start = _to_date(self.start_date)
+        mid = start + timedelta(days=self.days // 2 - 1)
+        return [
+            SearchShard(self.start_date, mid.strftime(DATE_FORMAT)),
+            SearchShard((mid + timedelta(days=1)).strftime(DATE_FORMAT), self.end_date),
+        ]
+
+
+def build_shards(start_date: str, end_date: str, mode: str = "none") -> List[SearchShard]:
+    """
+    将左闭右开的日期范围 [start_date, end_date) 划分为搜索窗口：
+    - none / adaptive: 整个范围一个窗口（adaptive 在获取总数后再按需拆分）
+    - day: 每天一个窗口
+    """
+    start = _to_date(start_date)
+    last = _to_date(end_date) - timedelta(days=1)
+    if last < start:
+        return []
+    if mode == "day":
+        days = ((start + timedelta(days=i)).strftime(DATE_FORMAT) for i in range((last - start).days + 1))
+        return [SearchShard(day, day) for day in days]
+    return [SearchShard(start.strftime(DATE_FORMAT), last.strftime(DATE_FORMAT))]
+
+
+def _to_date(value: str) -> date:
+    return datetime.strptime(value, DATE_FORMAT).date()
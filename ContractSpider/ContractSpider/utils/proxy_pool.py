@@ -0,0 +1,322 @@
+# 代理池：从服务商获取代理，按成功率、延迟与封禁信号为每个代理打分，淘汰劣质代理
+#
+# 提供方（PROXY_PROVIDER）：
+#   static - 使用 PROXY_API_URL（隧道代理，服务端自动切换出口 IP）
+#   api    - 定时请求 PROXY_FETCH_URL 获取代理列表
+#   stub   - 使用 PROXY_STUB_LIST 中的固定列表，便于本地测试
+
+import json
+import random
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from scrapy import signals
+
+BAN_STATUS = (403, 407)
+PROXY_META = "proxy_pool_proxy"  # 本次请求从代理池取出的代理，用于回报结果
+
+
+class ProxyPoolEmpty(Exception):
+    """当前没有可用代理"""
+
+
+class StaticProvider:
+    blocking = False
+
+    def __init__(self, proxies: List[str]):
+        self.proxies = [p for p in proxies if p]
+
+    def fetch(self) -> List[str]:
+        return list(self.proxies)
+
+
+class ApiProvider:
+    """
+    请求服务商接口获取代理，支持：
+    - 纯文本，每行一个 ip:port
+    - JSON，{"data": [{"server": "ip:port"} 或 {"ip": ..., "port": ...}]}
+    获取到的地址按 url_template 拼接账号密码
+    """
+    blocking = True
+
+    def __init__(self, fetch_url: str, url_template: str = "http://{server}", timeout: float = 10):
+        self.fetch_url = fetch_url
+        self.url_template = url_template
+        self.timeout = timeout
+
+    def fetch(self) -> List[str]:
+        import requests
+
+        response = requests.get(self.fetch_url, timeout=self.timeout)
+        response.raise_for_status()
+        return [self.url_template.format(server=server) for server in self.parse(response.text)]
+
+    @staticmethod
+    def parse(text: str) -> List[str]:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return [line.strip() for line in text.splitlines() if line.strip()]
+
+        if isinstance(data, dict):
+            data = data.get("data") or []
+        servers = []
+        for entry in data:
+            if isinstance(entry, str):
+                servers.append(entry)
+            elif isinstance(entry, dict):
+                if entry.get("server"):
+                    servers.append(entry["server"])
+                elif entry.get("ip") and entry.get("port"):
+                    servers.append(f"{entry['ip']}:{entry['port']}")
+        return servers
+
+
+class ProxyHealth:
+    """单个代理的健康统计，latency 为下载耗时的指数加权平均"""
+
+    def __init__(self, proxy: str):
+        self.proxy = proxy
+        self.requests = 0
+        self.successes = 0
+        self.bans = 0
+        self.consecutive_failures = 0
+        self.latency = None
+        self.in_flight = 0
+
+    @property
+    def success_rate(self) -> float:
+        # 加入先验，未使用过的代理也有机会被选中
+        return (self.successes + 1) / (self.requests + 2)
+
+    def score(self) -> float:
+        latency = self.latency if self.latency is not None else 1.0
+        return self.success_rate / (1 + latency) / (1 + self.in_flight)
+
+
+class ProxyPool:
+    """
+    同一个 crawler 共享一个代理池：
+    - get() 返回当前评分最高的代理
+    - report_response() / report_exception() 回报请求结果，更新评分并淘汰劣质代理
+    - 被淘汰的代理在 evict_cooldown 秒内不会被重新加入
+    """
+
+    def __init__(self, provider, stats=None, min_size: int = 1, fetch_interval: float = 60,
+                 max_bans: int = 3, max_consecutive_failures: int = 5, min_success_rate: float = 0.3,
+                 min_samples: int = 10, evict_cooldown: float = 300, latency_alpha: float = 0.3):
+        self.provider = provider
+        self.stats = stats
+        self.min_size = min_size
+        self.fetch_interval = fetch_interval
+        self.max_bans = max_bans
+        self.max_consecutive_failures = max_consecutive_failures
+        self.min_success_rate = min_success_rate
+        self.min_samples = min_samples
+        self.evict_cooldown = evict_cooldown
+        self.latency_alpha = latency_alpha
+
+        self.enabled = bool(getattr(provider, "proxies", True))  # 未配置任何代理时直连
+        self.proxies: Dict[str, ProxyHealth] = {}
+        self.evicted: Dict[str, float] = {}  # proxy -> 淘汰时间
+        self.refreshing = False
+        self.last_refresh = 0.0
+        self.refresh_task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pool = getattr(crawler, "proxy_pool", None)
+        if pool is not None:
+            return pool
+
+        settings = crawler.settings
+        pool = cls(
+            build_provider(settings),
+            stats=crawler.stats,
+            min_size=settings.getint("PROXY_POOL_MIN_SIZE", 1),
+            fetch_interval=settings.getfloat("PROXY_FETCH_INTERVAL", 60),
+            max_bans=settings.getint("PROXY_MAX_BANS", 3),
+            max_consecutive_failures=settings.getint("PROXY_MAX_CONSECUTIVE_FAILURES", 5),
+            min_success_rate=settings.getfloat("PROXY_MIN_SUCCESS_RATE", 0.3),
+            min_samples=settings.getint("PROXY_MIN_SAMPLES", 10),
+            evict_cooldown=settings.getfloat("PROXY_EVICT_COOLDOWN", 300),
+        )
+        crawler.proxy_pool = pool
+        crawler.signals.connect(pool.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(pool.spider_closed, signal=signals.spider_closed)
+        return pool
+
+    # ---------- 获取代理 ----------
+
+    def refresh(self):
+        """从提供方补充代理；阻塞型提供方在线程中获取，不阻塞 reactor"""
+        if self.refreshing:
+            return
+        self.last_refresh = time.monotonic()
+        if not self.provider.blocking:
+            self.add(self.provider.fetch())
+            return
+
+        from twisted.internet import threads
+
+        self.refreshing = True
+        d = threads.deferToThread(self.provider.fetch)
+        d.addCallback(self.add)
+        d.addErrback(self._refresh_failed)
+        d.addBoth(self._refresh_done)
+
+    def _refresh_failed(self, failure):
+        self._inc("proxy_pool/refresh_errors")
+
+    def _refresh_done(self, _):
+        self.refreshing = False
+
+    def add(self, proxies: List[str]) -> int:
+        now = time.monotonic()
+        added = 0
+        for proxy in proxies:
+            evicted_at = self.evicted.get(proxy)
+            if proxy in self.proxies or (evicted_at is not None and now - evicted_at < self.evict_cooldown):
+                continue
+            self.evicted.pop(proxy, None)
+            self.proxies[proxy] = ProxyHealth(proxy)
+            added += 1
+        self._inc("proxy_pool/added", added)
+        self._set("proxy_pool/size", len(self.proxies))
+        return added
+
+    def get(self) -> str:
+        """返回评分最高的代理，并计入在途请求"""
+        if len(self.proxies) < self.min_size or time.monotonic() - self.last_refresh > self.fetch_interval:
+            self.refresh()
+        if not self.proxies:
+            raise ProxyPoolEmpty("代理池为空，等待提供方补充")
+
+        best = max(self.proxies.values(), key=lambda h: (h.score(), random.random()))
+        best.in_flight += 1
+        return best.proxy
+
+    def assign(self, request) -> Optional[str]:
+        """为请求分配代理，同时记录以便回报结果；代理池未启用时返回 None"""
+        self.release(request)
+        if not self.enabled:
+            return None
+        proxy = self.get()
+        request.meta["proxy"] = proxy
+        request.meta[PROXY_META] = proxy
+        return proxy
+
+    def release(self, request) -> Optional[ProxyHealth]:
+        proxy = request.meta.pop(PROXY_META, None)
+        health = self.proxies.get(proxy)
+        if health is not None:
+            health.in_flight = max(0, health.in_flight - 1)
+        return health
+
+    # ---------- 回报结果 ----------
+
+    def report_response(self, request, response):
+        health = self.release(request)
+        if health is None:
+            return
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            health.latency = latency if health.latency is None else (
+                self.latency_alpha * latency + (1 - self.latency_alpha) * health.latency
+            )
+
+        if response.status in BAN_STATUS or (response.status == 200 and not response.body):
+            health.bans += 1
+            self._inc("proxy_pool/bans")
+            self._record(health, success=False)
+        else:
+            self._record(health, success=response.status < 400)
+
+    def report_exception(self, request, exception):
+        health = self.release(request)
+        if health is not None:
+            self._record(health, success=False)
+
+    def _record(self, health: ProxyHealth, success: bool):
+        health.requests += 1
+        if success:
+            health.successes += 1
+            health.consecutive_failures = 0
+            self._inc("proxy_pool/success")
+        else:
+            health.consecutive_failures += 1
+            self._inc("proxy_pool/failure")
+        if self._should_evict(health):
+            self.evict(health.proxy)
+
+    def _should_evict(self, health: ProxyHealth) -> bool:
+        if health.bans >= self.max_bans or health.consecutive_failures >= self.max_consecutive_failures:
+            return True
+        return health.requests >= self.min_samples and health.success_rate < self.min_success_rate
+
+    def evict(self, proxy: str):
+        health = self.proxies.get(proxy)
+        if health is None:
+            return
+        if len(self.proxies) == 1 and not self.provider.blocking:
+            # 固定列表只剩最后一个代理（例如隧道代理）时不淘汰，只重置统计
+            self.proxies[proxy] = ProxyHealth(proxy)
+            self.proxies[proxy].in_flight = health.in_flight
+            return
+        del self.proxies[proxy]
+        self.evicted[proxy] = time.monotonic()
+        self._inc("proxy_pool/evicted")
+        self._set("proxy_pool/size", len(self.proxies))
+        if len(self.proxies) < self.min_size:
+            self.refresh()
+
+    # ---------- 信号与统计 ----------
+
+    def spider_opened(self, spider):
+        from twisted.internet import task
+
+        if not self.enabled:
+            return
+        self.refresh()
+        if self.provider.blocking and self.fetch_interval > 0:
+            self.refresh_task = task.LoopingCall(self.refresh)
+            self.refresh_task.start(self.fetch_interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.refresh_task is not None and self.refresh_task.running:
+            self.refresh_task.stop()
+        for health in self.proxies.values():
+            key = f"proxy_pool/proxies/{proxy_host(health.proxy)}"
+            self._set(f"{key}/requests", health.requests)
+            self._set(f"{key}/success_rate", round(health.success_rate, 3))
+            self._set(f"{key}/latency", None if health.latency is None else round(health.latency, 3))
+            self._set(f"{key}/bans", health.bans)
+
+    def _inc(self, key: str, count: int = 1):
+        if self.stats is not None and count:
+            self.stats.inc_value(key, count)
+
+    def _set(self, key: str, value):
+        if self.stats is not None:
+            self.stats.set_value(key, value)
+
+
+def proxy_host(proxy: str) -> str:
+    """去掉账号密码，避免写入统计和日志"""
+    parsed = urlparse(proxy if "://" in proxy else f"http://{proxy}")
+    return f"{parsed.hostname}:{parsed.port}" if parsed.port else str(parsed.hostname)
+
+
+def build_provider(settings):
+    provider = settings.get("PROXY_PROVIDER", "static")
+    if provider == "static":
+        return StaticProvider([settings.get("PROXY_API_URL", "")])
+    if provider == "stub":
+        return StaticProvider(settings.getlist("PROXY_STUB_LIST"))
+    if provider == "api":
+        return ApiProvider(
+            settings.get("PROXY_FETCH_URL"),
+            url_template=settings.get("PROXY_URL_TEMPLATE", "http://{server}"),
+        )
+    raise ValueError(f"未知的代理提供方: {provider}，可选: static, api, stub")
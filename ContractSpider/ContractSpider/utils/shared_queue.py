@@ -0,0 +1,212 @@
+# 分布式爬取的共享存储：请求队列（按优先级出队）与去重集合，供多个进程 / 机器上的爬虫共同使用
+#
+# 两种后端接口相同：
+#   - sqlite: 单个 SQLite 文件，适合同一台机器上的多个进程以及本地测试（网络文件系统上的锁不可靠）
+#   - redis:  多台机器共享一个 Redis（或兼容 Redis 协议的服务），需安装 redis
+# 队列中保存的是序列化后的请求（bytes），序列化由调用方（SharedScheduler）负责。
+#
+# 出队不删除，而是租出（lease）：请求在租约到期前对其他节点不可见，处理完成后 ack() 才删除；
+# 节点崩溃或被杀时未确认的请求在租约到期后由 requeue_expired() 放回队列，由其他节点重新处理。
+# 因此每个请求至少被处理一次，节点崩溃时可能重复处理少量请求。
+
+import os
+import sqlite3
+import time
+from typing import Iterable, Optional, Tuple
+
+
+class SqliteQueueBackend:
+    """
+    queue 表按 (队列名, 优先级降序, 入队顺序) 出队，出队在 BEGIN IMMEDIATE 事务中完成，
+    多个进程同时出队时同一请求只会被取到一次；租出的请求 lease_until 为租约到期时间（Unix 时间戳），
+    待处理的请求为 NULL。seen 表记录各去重集合中的请求指纹。
+    """
+
+    def __init__(self, path: str, timeout: float = 30):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS queue ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, priority INTEGER NOT NULL, data BLOB NOT NULL,"
+            " lease_until REAL)"
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(queue)")]
+        if "lease_until" not in columns:  # 旧版本创建的队列
+            self.conn.execute("ALTER TABLE queue ADD COLUMN lease_until REAL")
+            self.conn.execute("DROP INDEX IF EXISTS queue_order")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS queue_lease_order ON queue (name, lease_until, priority DESC, id)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen (name TEXT NOT NULL, fingerprint TEXT NOT NULL, PRIMARY KEY (name, fingerprint))"
+        )
+
+    def push(self, name: str, data: bytes, priority: int = 0):
+        self.conn.execute("INSERT INTO queue (name, priority, data) VALUES (?, ?, ?)", (name, priority, data))
+
+    def pop(self, name: str, lease: float) -> Optional[Tuple[int, bytes]]:
+        """租出优先级最高、最早入队的一项，租期 lease 秒，返回 (项目 id, 数据)；没有待处理的项时返回 None"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT id, data FROM queue WHERE name = ? AND lease_until IS NULL ORDER BY priority DESC, id LIMIT 1",
+                (name,),
+            ).fetchone()
+            if row is not None:
+                self.conn.execute("UPDATE queue SET lease_until = ? WHERE id = ?", (time.time() + lease, row[0]))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def ack(self, name: str, item_ids: Iterable[int]):
+        """处理完成，删除租出的项"""
+        self.conn.executemany("DELETE FROM queue WHERE id = ?", [(item_id,) for item_id in item_ids])
+
+    def touch(self, name: str, item_ids: Iterable[int], lease: float):
+        """续租仍在处理的项；lease = 0 表示立即到期（节点退出时归还未处理完的项）"""
+        lease_until = time.time() + lease
+        self.conn.executemany(
+            "UPDATE queue SET lease_until = ? WHERE id = ? AND lease_until IS NOT NULL",
+            [(lease_until, item_id) for item_id in item_ids],
+        )
+
+    def requeue_expired(self, name: str) -> int:
+        """将租约已到期的项放回队列，返回放回的数量"""
+        cursor = self.conn.execute(
+            "UPDATE queue SET lease_until = NULL WHERE name = ? AND lease_until <= ?", (name, time.time())
+        )
+        return cursor.rowcount
+
+    def size(self, name: str) -> int:
+        """队列中的项数，包括已租出、尚未确认的项"""
+        return self.conn.execute("SELECT COUNT(*) FROM queue WHERE name = ?", (name,)).fetchone()[0]
+
+    def has_items(self, name: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM queue WHERE name = ? LIMIT 1", (name,)).fetchone() is not None
+
+    def add_seen(self, name: str, fingerprint: str) -> bool:
+        """加入去重集合，返回 True 表示之前没有见过"""
+        cursor = self.conn.execute("INSERT OR IGNORE INTO seen (name, fingerprint) VALUES (?, ?)", (name, fingerprint))
+        return cursor.rowcount > 0
+
+    def clear(self, name: str):
+        """清空同名的队列与去重集合"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute("DELETE FROM queue WHERE name = ?", (name,))
+        self.conn.execute("DELETE FROM seen WHERE name = ?", (name,))
+        self.conn.execute("COMMIT")
+
+    def close(self):
+        self.conn.close()
+
+
+class RedisQueueBackend:
+    """
+    队列为有序集合 {name}:queue，分数为 -priority；成员以 20 位入队序号开头，同优先级按入队顺序出队。
+    出队时在 Lua 脚本中以 ZPOPMIN（Redis 5.0+）取出并移入有序集合 {name}:leased（分数为租约到期时间），
+    原分数保存在哈希 {name}:priority 中以便放回；多个客户端同时出队时同一请求只会被取到一次。
+    租约时间使用 Redis 服务器的时钟，各节点的时钟不需要同步。去重集合为 {name}:seen。
+    """
+
+    SEQ_WIDTH = 20
+
+    POP_SCRIPT = """
+    local popped = redis.call('ZPOPMIN', KEYS[1])
+    if #popped == 0 then return false end
+    local now = redis.call('TIME')
+    redis.call('ZADD', KEYS[2], now[1] + now[2] / 1e6 + tonumber(ARGV[1]), popped[1])
+    redis.call('HSET', KEYS[3], popped[1], popped[2])
+    return popped[1]
+    """
+
+    TOUCH_SCRIPT = """
+    local now = redis.call('TIME')
+    local lease_until = now[1] + now[2] / 1e6 + tonumber(ARGV[1])
+    for i = 2, #ARGV do
+        redis.call('ZADD', KEYS[1], 'XX', lease_until, ARGV[i])
+    end
+    """
+
+    REQUEUE_SCRIPT = """
+    local now = redis.call('TIME')
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now[1] + now[2] / 1e6)
+    for _, member in ipairs(expired) do
+        redis.call('ZADD', KEYS[1], redis.call('HGET', KEYS[3], member), member)
+        redis.call('ZREM', KEYS[2], member)
+        redis.call('HDEL', KEYS[3], member)
+    end
+    return #expired
+    """
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("SHARED_QUEUE_BACKEND = 'redis' 需要安装 redis：pip install redis") from e
+        self.client = redis.Redis.from_url(url)
+        self.pop_script = self.client.register_script(self.POP_SCRIPT)
+        self.touch_script = self.client.register_script(self.TOUCH_SCRIPT)
+        self.requeue_script = self.client.register_script(self.REQUEUE_SCRIPT)
+
+    @staticmethod
+    def keys(name: str):
+        return [f"{name}:queue", f"{name}:leased", f"{name}:priority"]
+
+    def push(self, name: str, data: bytes, priority: int = 0):
+        seq = self.client.incr(f"{name}:seq")
+        member = str(seq).zfill(self.SEQ_WIDTH).encode() + data
+        self.client.zadd(f"{name}:queue", {member: -priority})
+
+    def pop(self, name: str, lease: float) -> Optional[Tuple[bytes, bytes]]:
+        member = self.pop_script(keys=self.keys(name), args=[lease])
+        if not member:
+            return None
+        return member, member[self.SEQ_WIDTH:]
+
+    def ack(self, name: str, item_ids: Iterable[bytes]):
+        item_ids = list(item_ids)
+        if item_ids:
+            pipe = self.client.pipeline()
+            pipe.zrem(f"{name}:leased", *item_ids)
+            pipe.hdel(f"{name}:priority", *item_ids)
+            pipe.execute()
+
+    def touch(self, name: str, item_ids: Iterable[bytes], lease: float):
+        item_ids = list(item_ids)
+        if item_ids:
+            self.touch_script(keys=[f"{name}:leased"], args=[lease] + item_ids)
+
+    def requeue_expired(self, name: str) -> int:
+        return self.requeue_script(keys=self.keys(name))
+
+    def size(self, name: str) -> int:
+        """队列中的项数，包括已租出、尚未确认的项"""
+        return self.client.zcard(f"{name}:queue") + self.client.zcard(f"{name}:leased")
+
+    def has_items(self, name: str) -> bool:
+        return self.size(name) > 0
+
+    def add_seen(self, name: str, fingerprint: str) -> bool:
+        return self.client.sadd(f"{name}:seen", fingerprint) == 1
+
+    def clear(self, name: str):
+        self.client.delete(*self.keys(name), f"{name}:seen", f"{name}:seq")
+
+    def close(self):
+        self.client.close()
+
+
+def open_backend(settings):
+    """根据 SHARED_QUEUE_BACKEND 打开共享存储"""
+    backend = settings.get("SHARED_QUEUE_BACKEND", "sqlite")
+    if backend == "sqlite":
+        return SqliteQueueBackend(settings.get("SHARED_QUEUE_SQLITE_PATH", os.path.join("logs", "shared_queue.sqlite3")))
+    if backend == "redis":
+        return RedisQueueBackend(settings.get("SHARED_QUEUE_REDIS_URL", "redis://localhost:6379/0"))
+    raise ValueError(f"不支持的 SHARED_QUEUE_BACKEND: {backend}")
+
@@ -0,0 +1,33 @@
+# 爬取阶段：搜索页（contract）→ 详情页（detail）→ 附件（attachment）
+#
+# 单阶段爬虫的请求都属于与爬虫同名的阶段；合并爬虫（chain）在请求 meta 中标明阶段，
+# 各阶段的代理中间件只处理本阶段的请求，并把请求放入以阶段命名的下载槽，
+# 从而可以通过 DOWNLOAD_SLOTS 分别限制各阶段的并发数与下载延迟。
+
+STAGE_META = "stage"
+STAGE_CONTRACT = "contract"
+STAGE_DETAIL = "detail"
+STAGE_ATTACHMENT = "attachment"
+STAGES = (STAGE_CONTRACT, STAGE_DETAIL, STAGE_ATTACHMENT)
+
+
+def request_stage(request, spider) -> str:
+    """请求所属的阶段：meta 中未标明时为爬虫的默认阶段（单阶段爬虫即爬虫名）"""
+    return request.meta.get(STAGE_META) or getattr(spider, "default_stage", spider.name)
+
+
+def claim_request(request, spider, stage: str) -> bool:
+    """下载中间件在 process_request 中调用：请求属于 stage 时返回 True，合并模式下同时指定下载槽"""
+    if request_stage(request, spider) != stage:
+        return False
+    if getattr(spider, "stage_slots", False):
+        request.meta.setdefault("download_slot", stage)
+    return True
+
+
+def stage_checkpoint(spider, stage: str):
+    """各阶段的断点记录：合并爬虫每个阶段独立提交（spider.checkpoints），单阶段爬虫为 spider.checkpoint"""
+    checkpoints = getattr(spider, "checkpoints", None)
+    if checkpoints is not None:
+        return checkpoints.get(stage)
+    return getattr(spider, "checkpoint", None)
@@ -0,0 +1,211 @@
+# 按日期分区的数据存储：支持 xlsx 与 Parquet 两种格式
+#
+# 目录结构（两种格式可以并存）：
+#   {base_folder}/YYYY-MM/YYYY-MM-DD.xlsx
+#   {base_folder}/YYYY-MM/YYYY-MM-DD/part-*.parquet
+#
+# 用法（按需导出 Excel）：
+#   python -m ContractSpider.utils.storage downloads 2025-03-01 2025-03-10 --sheet Contracts
+
+import argparse
+import glob
+import os
+import uuid
+from typing import Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+FORMAT_XLSX = "xlsx"
+FORMAT_PARQUET = "parquet"
+SUPPORTED_FORMATS = (FORMAT_XLSX, FORMAT_PARQUET)
+
+
+def parse_formats(value) -> List[str]:
+    """解析 STORAGE_FORMATS 配置，支持列表或逗号分隔的字符串"""
+    if isinstance(value, str):
+        value = value.split(",")
+    formats = [v.strip().lower() for v in value if v and v.strip()]
+    unknown = [v for v in formats if v not in SUPPORTED_FORMATS]
+    if unknown:
+        raise ValueError(f"不支持的存储格式: {unknown}，可选: {SUPPORTED_FORMATS}")
+    if FORMAT_PARQUET in formats:
+        require_pyarrow()
+    return formats
+
+
+def require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("Parquet 存储需要安装 pyarrow：pip install pyarrow")
+
+
+def day_of(file_path: str) -> str:
+    """从 YYYY-MM-DD.xlsx 或 YYYY-MM-DD 分区目录路径中取出日期"""
+    name = os.path.basename(os.path.normpath(file_path))
+    return name[:-5] if name.endswith(".xlsx") else name
+
+
+def day_partition(base_folder: str, day: str) -> str:
+    return os.path.join(base_folder, day[:7], day)
+
+
+class ParquetPartitionWriter:
+    """
+    每次 write() 在当天分区目录下新增一个 part 文件，不改写已有文件。
+    所有列统一以字符串写入，保证各 part 的 schema 一致。
+    """
+
+    def __init__(self, base_folder: str):
+        require_pyarrow()
+        self.base_folder = base_folder
+        self.run_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.seq = 0
+
+    def write(self, file_path: str, df: pd.DataFrame) -> str:
+        """写入一批数据，file_path 为对应的 xlsx 路径或日期"""
+        folder = day_partition(self.base_folder, day_of(file_path))
+        os.makedirs(folder, exist_ok=True)
+
+        self.seq += 1
+        part_path = os.path.join(folder, f"part-{self.run_id}-{self.seq:05d}.parquet")
+        tmp_path = f"{part_path}.tmp"
+        df.astype("string").to_parquet(tmp_path, engine="pyarrow", index=False)
+        os.replace(tmp_path, part_path)
+        return part_path
+
+
+def list_day_sources(base_folder: str, start_date: str, end_date: str,
+                     prefer: Iterable[str] = (FORMAT_PARQUET, FORMAT_XLSX)) -> List[str]:
+    """
+    列出日期范围内（闭区间）每天的数据源路径，按日期排序。
+    同一天两种格式都存在时按 prefer 的顺序选择。
+    """
+    if not os.path.isdir(base_folder):
+        return []
+
+    prefer = list(prefer)
+    sources = {}
+    for month in sorted(os.listdir(base_folder)):
+        month_path = os.path.join(base_folder, month)
+        if not os.path.isdir(month_path) or not (start_date[:7] <= month <= end_date[:7]):
+            continue
+
+        for name in os.listdir(month_path):
+            path = os.path.join(month_path, name)
+            if name.endswith(".xlsx") and os.path.isfile(path):
+                fmt = FORMAT_XLSX
+            elif os.path.isdir(path) and glob.glob(os.path.join(path, "*.parquet")):
+                fmt = FORMAT_PARQUET
+            else:
+                continue
+            if fmt not in prefer:
+                continue
+
+            day = day_of(path)
+            if not (start_date <= day <= end_date):
+                continue
+            current = sources.get(day)
+            if current is None or prefer.index(fmt) < prefer.index(current[0]):
+                sources[day] = (fmt, path)
+
+    return [sources[day][1] for day in sorted(sources)]
+
+
+def read_table(path: str, columns: Optional[List[str]] = None, sheet_name=0) -> pd.DataFrame:
+    """读取一天的数据：Parquet 分区目录或 xlsx 文件，统一返回字符串列"""
+    if os.path.isdir(path):
+        parts = sorted(glob.glob(os.path.join(path, "*.parquet")))
+        if not parts:
+            return pd.DataFrame(columns=columns or [])
+        frames = [_read_parquet_part(part, columns) for part in parts]
+        return pd.concat(frames, ignore_index=True)
+
+    df = pd.read_excel(path, sheet_name=sheet_name, dtype=str, engine="openpyxl")
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
+
+
+def _read_parquet_part(path: str, columns: Optional[List[str]]) -> pd.DataFrame:
+    if columns is None:
+        return pd.read_parquet(path, engine="pyarrow")
+    # 旧 part 可能缺少新增的列，只读取存在的列
+    import pyarrow.parquet as pq
+    names = pq.read_schema(path).names
+    return pd.read_parquet(path, engine="pyarrow", columns=[c for c in columns if c in names])
+
+
+def iter_table(path: str, columns: Optional[List[str]] = None, chunk_size: int = 10000) -> Iterator[pd.DataFrame]:
+    """
+    分块读取一天的数据，每块最多 chunk_size 行，内存占用与文件大小无关：
+    Parquet 按 row group 逐批读取，xlsx 以 read_only 模式逐行读取。
+    与 read_table() 一样统一返回字符串列，缺少的列不会出现在结果中。
+    """
+    if os.path.isdir(path):
+        import pyarrow.parquet as pq
+
+        for part in sorted(glob.glob(os.path.join(path, "*.parquet"))):
+            parquet_file = pq.ParquetFile(part)
+            names = parquet_file.schema_arrow.names
+            read_columns = None if columns is None else [c for c in columns if c in names]
+            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=read_columns):
+                yield batch.to_pandas()
+        return
+
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = ["" if h is None else str(h) for h in header]
+        keep = [i for i, h in enumerate(header) if columns is None or h in columns]
+        names = [header[i] for i in keep]
+
+        chunk = []
+        for row in rows:
+            chunk.append([None if i >= len(row) or row[i] is None else str(row[i]) for i in keep])
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk, columns=names, dtype=object)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=names, dtype=object)
+    finally:
+        wb.close()
+
+
+def export_excel(base_folder: str, start_date: str, end_date: str, sheet_name: str = "Sheet1") -> List[str]:
+    """将 Parquet 分区按天导出为 YYYY-MM-DD.xlsx（覆盖同名文件），返回导出的文件列表"""
+    exported = []
+    for path in list_day_sources(base_folder, start_date, end_date, prefer=[FORMAT_PARQUET]):
+        df = read_table(path)
+        file_path = f"{os.path.normpath(path)}.xlsx"
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "wb") as f, pd.ExcelWriter(f, engine="openpyxl") as writer:
+            df.to_excel(writer, index=False, sheet_name=sheet_name)
+        os.replace(tmp_path, file_path)
+        exported.append(file_path)
+    return exported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="将 Parquet 分区导出为按天的 Excel 文件")
+    parser.add_argument("base_folder", help="数据目录，例如 downloads 或 detail_downloads")
+    parser.add_argument("start_date", help="开始日期 YYYY-MM-DD（含）")
+    parser.add_argument("end_date", help="结束日期 YYYY-MM-DD（含）")
+    parser.add_argument("--sheet", default=None, help="工作表名称，默认按目录推断")
+    args = parser.parse_args(argv)
+
+    sheet_name = args.sheet
+    if sheet_name is None:
+        sheet_name = "Details" if "detail" in os.path.basename(os.path.normpath(args.base_folder)) else "Contracts"
+
+    for file_path in export_excel(args.base_folder, args.start_date, args.end_date, sheet_name):
+        print(f"✅ 导出: {file_path}")
+
+
+if __name__ == "__main__":
+    main()
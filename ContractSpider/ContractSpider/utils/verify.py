@@ -0,0 +1,208 @@
+# 附件完整性校验：校验函数为模块级函数，可以提交到进程池中执行，不阻塞 reactor
+#
+# 分两级：
+#   1. quick_check(): 只读取文件头尾的结构检查（PDF %%EOF、ZIP 中央目录、图片文件头、大小），O(1)
+#   2. verify_file(): 完整解析文件，只对按扩展名抽样或可疑的文件执行；
+#      OLE 格式（.xls / .doc / .ppt）没有可用的解析库（openpyxl 只支持 xlsx），只做快速检查
+
+import asyncio
+import multiprocessing
+import os
+import random
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+
+TAIL_SIZE = 65536 + 22  # ZIP 注释最长 65535 字节，EOCD 记录 22 字节
+
+ZIP_EXTENSIONS = (".zip", ".docx", ".xlsx", ".pptx")
+OLE_EXTENSIONS = (".xls", ".doc", ".ppt")
+OLE_HEADER = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+
+def quick_check(file_path: str, ext: Optional[str] = None, expected_size: Optional[int] = None) -> Tuple[bool, str]:
+    """只读取文件头尾的结构检查，返回 (是否通过, 失败原因)"""
+    ext = (ext or os.path.splitext(file_path)[-1]).lower()
+    try:
+        size = os.path.getsize(file_path)
+        if expected_size is not None and size != expected_size:
+            return False, f"文件大小 {size} 与 Content-Length {expected_size} 不一致"
+        if size <= 100:
+            return False, "文件过小"
+
+        with open(file_path, "rb") as f:
+            head = f.read(16)
+            f.seek(max(0, size - TAIL_SIZE))
+            tail = f.read()
+    except OSError as e:
+        return False, str(e)
+
+    if ext == ".pdf":
+        if not head.startswith(b"%PDF-"):
+            return False, "缺少 PDF 文件头"
+        if b"%%EOF" not in tail[-2048:] or b"startxref" not in tail:
+            return False, "缺少 PDF 结尾（%%EOF / startxref）"
+    elif ext in ZIP_EXTENSIONS:
+        if not head.startswith(b"PK"):
+            return False, "缺少 ZIP 文件头"
+        if b"PK\x05\x06" not in tail:
+            return False, "缺少 ZIP 中央目录"
+    elif ext in OLE_EXTENSIONS:
+        if not head.startswith(OLE_HEADER):
+            return False, "缺少 OLE 文件头"
+    elif ext == ".rar":
+        if not head.startswith(b"Rar!\x1a\x07"):
+            return False, "缺少 RAR 文件头"
+    elif ext in (".jpg", ".jpeg"):
+        if not head.startswith(b"\xff\xd8\xff"):
+            return False, "缺少 JPEG 文件头"
+        if b"\xff\xd9" not in tail[-1024:]:
+            return False, "缺少 JPEG 结束标记"
+    elif ext == ".png":
+        if not head.startswith(b"\x89PNG\r\n\x1a\n"):
+            return False, "缺少 PNG 文件头"
+        if b"IEND" not in tail[-64:]:
+            return False, "缺少 PNG 结束块"
+    elif ext == ".bmp":
+        if not head.startswith(b"BM") or int.from_bytes(head[2:6], "little") > size:
+            return False, "BMP 文件头无效或文件被截断"
+    elif ext == ".gif":
+        if not head.startswith((b"GIF87a", b"GIF89a")) or not tail.endswith(b";"):
+            return False, "GIF 文件头或结束标记无效"
+    return True, ""
+
+
+def verify_file(file_path: str, ext: Optional[str] = None) -> Tuple[bool, str]:
+    """
+    尝试按类型打开文件，返回 (是否通过, 失败原因)。
+    ext 为空时取 file_path 的扩展名（校验 .part 临时文件时需要显式传入）。
+    """
+    ext = (ext or os.path.splitext(file_path)[-1]).lower()
+
+    try:
+        if ext == ".xlsx":
+            from openpyxl import load_workbook
+            with open(file_path, 'rb') as f:  # openpyxl 会拒绝 .part 等扩展名的路径
+                load_workbook(f)
+
+        elif ext in [".docx"]:
+            from docx import Document
+            Document(file_path)
+
+        elif ext == ".pdf":
+            import PyPDF2
+            with open(file_path, 'rb') as f:
+                reader = PyPDF2.PdfReader(f)
+                _ = reader.pages[0]
+
+        elif ext in [".zip"]:
+            with zipfile.ZipFile(file_path, 'r') as zf:
+                bad = zf.testzip()
+                if bad:
+                    raise ValueError(f"ZIP 文件损坏: {bad}")
+
+        elif ext in [".rar"]:
+            import rarfile
+            with rarfile.RarFile(file_path, 'r') as rf:
+                rf.testrar()  # 若失败将抛出异常
+
+        elif ext in [".txt"]:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                _ = f.read(1024)  # 尝试读取前1KB
+
+        elif ext in [".jpg", ".jpeg", ".png", ".bmp"]:
+            from PIL import Image
+            with Image.open(file_path) as img:
+                img.verify()  # PIL验证图像完整性
+
+        else:
+            # 不支持类型，默认以非空文件判断
+            if os.path.getsize(file_path) <= 100:
+                return False, "文件过小"
+
+        return True, ""
+
+    except Exception as e:
+        return False, str(e)
+
+
+class VerifyPool:
+    """
+    分级校验，完整校验在有界进程池中执行：
+    - max_workers: 校验进程数，0 表示在当前进程内直接校验
+    - max_pending: 同时排队或执行中的完整校验数上限，超过时调用方等待，形成背压
+    - full_rates: 各扩展名通过快速检查后仍做完整校验的抽样比例，未列出的使用 default_full_rate
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 16,
+                 full_rates: Optional[Dict[str, float]] = None, default_full_rate: float = 0.05):
+        self.max_workers = max_workers
+        self.max_pending = max(1, max_pending)
+        self.full_rates = {k.lower(): float(v) for k, v in (full_rates or {}).items()}
+        self.default_full_rate = default_full_rate
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.counts = {"quick": 0, "full": 0, "failed": 0}
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            max_workers=settings.getint("ATTACHMENT_VERIFY_WORKERS", 2),
+            max_pending=settings.getint("ATTACHMENT_VERIFY_MAX_PENDING", 16),
+            full_rates=settings.getdict("ATTACHMENT_VERIFY_FULL_RATES"),
+            default_full_rate=settings.getfloat("ATTACHMENT_VERIFY_DEFAULT_FULL_RATE", 0.05),
+        )
+
+    def needs_full_check(self, ext: str, suspicious: bool = False) -> bool:
+        if (ext or "").lower() in OLE_EXTENSIONS:
+            return False  # 无法完整解析，可疑文件也只能依靠快速检查
+        if suspicious:
+            return True
+        rate = self.full_rates.get((ext or "").lower(), self.default_full_rate)
+        return rate >= 1 or random.random() < rate
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # spawn 与 Windows 行为一致，也避免在 reactor 运行中 fork
+            self.executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    async def verify(self, file_path: str, ext: Optional[str] = None, expected_size: Optional[int] = None,
+                     suspicious: bool = False) -> Tuple[bool, str]:
+        """先做快速检查，失败直接返回；通过后按抽样比例或可疑标记决定是否完整校验"""
+        ext = (ext or os.path.splitext(file_path)[-1]).lower()
+        ok, reason = quick_check(file_path, ext, expected_size)
+        self.counts["quick"] += 1
+        if not ok:
+            self.counts["failed"] += 1
+            return ok, reason
+        if not self.needs_full_check(ext, suspicious):
+            return ok, reason
+
+        self.counts["full"] += 1
+        ok, reason = await self._full_check(file_path, ext)
+        if not ok:
+            self.counts["failed"] += 1
+        return ok, reason
+
+    async def _full_check(self, file_path: str, ext: str) -> Tuple[bool, str]:
+        if not self.max_workers:
+            return verify_file(file_path, ext)
+
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_pending)
+        async with self.semaphore:
+            try:
+                future = self._get_executor().submit(verify_file, file_path, ext)
+                return await asyncio.wrap_future(future)
+            except BrokenProcessPool as e:
+                # 校验进程异常退出（例如解析损坏文件时崩溃），重建进程池，本次记为失败
+                self.executor = None
+                return False, f"校验进程异常退出: {e}"
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,149 @@
+# 基于 openpyxl write_only 模式的流式工作簿，先写临时文件再原子替换
+
+import os
+from typing import Dict, List, Optional
+
+from openpyxl import Workbook, load_workbook
+
+from ContractSpider.utils.file_lock import FileLock, FileLockTimeout
+
+
+class StreamingWorkbook:
+    """
+    一个日文件对应一个流式工作簿：
+    - 打开时将已有数据逐行拷贝到 write_only 工作簿（不在内存中保留整表）
+    - append() 逐行写入，内存占用与已写入行数无关
+    - commit() 在文件锁内保存到临时文件后 os.replace 覆盖目标文件，中途被杀不会损坏原文件；
+      打开之后目标文件被其他进程提交过时，基于最新内容重新拷贝并写入本次的行，不会覆盖其他进程的数据
+    - 锁被占用或保存失败时本次的行保留在 pending 中，可以稍后再次 commit()
+    """
+
+    TMP_SUFFIX = ".tmp"
+
+    def __init__(self, file_path: str, sheet_name: str, headers: List[str]):
+        self.file_path = file_path
+        self.tmp_path = f"{file_path}{self.TMP_SUFFIX}"
+        self.sheet_name = sheet_name
+        self.headers = list(headers)
+        self.lock = FileLock(file_path, timeout=0)  # 在 reactor 线程中提交，不等待锁
+        self.rows = 0  # 本次新写入的行数
+        self.pending = []  # 本次新写入的行，合并或重试时重新写入；提交间隔的行数有限（DETAIL_COMMIT_ROWS）
+        self.stale = False  # 工作簿需要在提交前重新打开（上次保存失败）
+        self.merged = False  # 提交时是否与其他进程的写入合并过
+        self.closed = False
+        # 上次异常退出残留的临时文件在提交时（持有锁）被覆盖，这里不删除，以免删掉其他进程正在写的文件
+        self._open()
+
+    def _open(self):
+        self.wb = Workbook(write_only=True)
+        self.ws = None
+        self.existing_rows = 0  # 从原文件拷贝的行数
+        self.source_stamp = self._stamp()
+        self._copy_existing()
+        if self.ws is None:
+            self.ws = self.wb.create_sheet(self.sheet_name)
+            self.ws.append(self.headers)
+
+    def _stamp(self):
+        """目标文件的版本标识，原子替换后 inode 改变；文件不存在时为 None"""
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _copy_existing(self):
+        """逐行拷贝原文件内容，目标表按表头名称映射到当前列顺序"""
+        if not os.path.exists(self.file_path):
+            return
+
+        src = load_workbook(self.file_path, read_only=True)
+        try:
+            for src_ws in src.worksheets:
+                ws = self.wb.create_sheet(src_ws.title)
+                rows = src_ws.iter_rows(values_only=True)
+                if src_ws.title != self.sheet_name:
+                    for row in rows:
+                        ws.append(row)
+                    continue
+
+                self.ws = ws
+                ws.append(self.headers)
+                src_headers = next(rows, None)
+                if not src_headers:
+                    continue
+                index = self._column_index(src_headers)
+                for row in rows:
+                    if not any(cell is not None for cell in row):
+                        continue
+                    ws.append([row[i] if i is not None and i < len(row) else None for i in index])
+                    self.existing_rows += 1
+        finally:
+            src.close()
+
+    def _column_index(self, src_headers) -> List[Optional[int]]:
+        positions = {name: i for i, name in enumerate(src_headers) if name is not None}
+        return [positions.get(name) for name in self.headers]
+
+    def append(self, row: Dict[str, object]):
+        """按表头顺序写入一行"""
+        values = [row.get(name) for name in self.headers]
+        if not self.stale:
+            self.ws.append(values)
+        self.pending.append(values)
+        self.rows += 1
+
+    def commit(self) -> bool:
+        """
+        在文件锁内保存到临时文件并原子替换目标文件，成功返回 True。
+        锁被其他进程占用时不等待，返回 False；保存失败时抛出异常。两种情况下本次的行都保留，
+        之后再次调用 commit() 重试（可以继续 append()）。
+        """
+        if self.closed:
+            return True
+        try:
+            self.lock.acquire()
+        except FileLockTimeout:
+            return False
+        try:
+            changed = self._stamp() != self.source_stamp
+            if changed or self.stale:
+                # 打开后其他进程提交过该文件，或上次保存失败（write_only 工作簿只能保存一次），
+                # 基于最新内容重新拷贝，再写入本次的行
+                self._reopen()
+                self.merged = self.merged or changed
+            self.wb.save(self.tmp_path)
+            os.replace(self.tmp_path, self.file_path)
+        except Exception:
+            self.stale = True
+            # 持有锁时临时文件只可能是本进程写的
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+            raise
+        finally:
+            self.lock.release()
+        self.closed = True
+        self.pending = []
+        return True
+
+    def _reopen(self):
+        self._discard_workbook()
+        self._open()
+        for values in self.pending:
+            self.ws.append(values)
+        self.stale = False
+
+    def abort(self):
+        """放弃本次写入；临时文件只在提交时（持有锁）写入，这里不需要清理"""
+        self.closed = True
+        self.pending = []
+        self._discard_workbook()
+
+    def _discard_workbook(self):
+        """结束未保存的 write_only 工作簿并删除 openpyxl 的缓存文件，否则被回收时会报错"""
+        for ws in self.wb.worksheets:
+            try:
+                ws.close()
+                ws._writer.cleanup()
+            except Exception:
+                pass  # 已保存过（保存中途失败）的工作表不能再关闭，缓存文件已由 openpyxl 清理
@@ -0,0 +1,118 @@
+# 详情页解析基准：原先逐字段 XPath 的实现与单次遍历的 parse_detail() 的吞吐对比
+#
+# 用法（在 scrapy.cfg 所在目录执行）：
+#   python -m benchmarks.bench_detail_parser --rounds 2000
+#
+# 样例页面位于 benchmarks/fixtures/detail/*.html。分别统计包含 HTML 解析（与爬取时一致）
+# 和只计字段提取的 页/秒，并列出两种实现结果不同的字段。
+
+import argparse
+import glob
+import os
+import time
+
+from scrapy.http import HtmlResponse
+
+from ContractSpider.utils.detail_parser import parse_detail
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "detail")
+
+
+def legacy_parse(response):
+    """改写前 DetailSpider.parse 的字段提取，作为性能与结果的基准"""
+    content = response.css("div.content_2020")
+
+    item = {}
+    item["contract_number"] = content.xpath(".//p/strong[contains(text(), '合同编号')]/text()").get("").strip().replace('一、合同编号：  ', '')
+    item["contract_name"] = content.xpath(".//p/strong[contains(text(), '合同名称')]/text()").get("").strip().replace('二、合同名称：  ', '')
+    item["project_number"] = content.xpath(".//p/strong[contains(text(), '项目编号')]/text()").get("").strip().replace('三、项目编号：  ', '')
+    item["project_name"] = content.xpath(".//p/strong[contains(text(), '项目名称')]/text()").get("").strip().replace('四、项目名称：  ', '')
+    item["purchaser"] = content.xpath(".//p[contains(text(), '采购人（甲方）')]/text()").get("").split("：")[-1].strip()
+    item["purchaser_address"] = content.xpath(".//p[contains(text(), '地  址')][1]/text()").get("").split("：")[-1].strip()
+    item["purchaser_contact"] = content.xpath(".//p[contains(text(), '联系方式')][1]/text()").get("").split("：")[-1].strip()
+    item["supplier"] = content.xpath(".//p[contains(text(), '供应商（乙方）')]/text()").get("").split("：")[-1].strip()
+    item["supplier_address"] = content.xpath(".//p[contains(text(), '地  址')][2]/text()").get("").split("：")[-1].strip()
+    item["supplier_contact"] = content.xpath(".//p[contains(text(), '联系方式')][2]/text()").get("").split("：")[-1].strip()
+    item["main_product_name"] = content.xpath(".//p[contains(text(), '主要标的名称')]/text()").get("").replace('主要标的名称：', '').replace(';', '')
+    item["specifications"] = content.xpath(".//p[contains(text(), '规格型号（或服务要求）')]/text()").get("").split("：")[-1].strip()
+    item["quantity"] = content.xpath(".//p[contains(text(), '主要标的数量')]/text()").get("").split("：")[-1].strip()
+    item["unit_price"] = content.xpath(".//p[contains(text(), '主要标的单价')]/text()").get("").split("：")[-1].strip()
+    item["contract_amount"] = content.xpath(".//p[contains(text(), '合同金额')]/text()").get("").strip().replace('合同金额：', '').replace('\t', '').replace('\n', '').replace('\r', '')
+    item["performance_location"] = content.xpath(".//p[contains(text(), '履约期限、地点等简要信息')]/text()").get("").strip().replace('履约期限、地点等简要信息：', '').replace('\t', '').replace('\n', '').replace('\r', '')
+    item["procurement_method"] = content.xpath(".//p[contains(text(), '采购方式')]/text()").get("").strip().strip().replace('合同金额：', '').replace('\t', '').replace('\n', '').replace('\r', '')
+    item["contract_sign_date"] = content.xpath(".//p/strong[contains(text(), '合同签订日期')]/text()").get("").strip().replace('七、合同签订日期：\r\n\t\t\t\t\t\t\t', '')
+    item["contract_announcement_date"] = content.xpath(".//p/strong[contains(text(), '合同公告日期')]/text()").get("").strip().replace('八、合同公告日期：\r\n\t\t\t\t\t\t\t', '')
+
+    item["attachment_name"] = content.xpath(".//li[@class='fileInfo']/div/b/text()").getall()
+    item["attachment_download_url"] = []
+    for script in content.xpath(".//li[@class='fileInfo']//a/@onclick").getall():
+        start = script.find("('") + 2
+        end = script.find("','")
+        if start != -1 and end != -1:
+            item["attachment_download_url"].append(f"https://download.ccgp.gov.cn/oss/download?uuid={script[start:end]}")
+    return item
+
+
+def new_parse(response):
+    return parse_detail(response.selector.root)
+
+
+def load_pages():
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.html"))):
+        with open(path, "rb") as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def make_response(name, body):
+    return HtmlResponse(url=f"http://www.ccgp.gov.cn/contract/{name}", body=body, encoding="utf-8")
+
+
+def run(parse, pages, rounds):
+    """每轮新建响应，计时包含 HTML 解析"""
+    began = time.perf_counter()
+    for _ in range(rounds):
+        for name, body in pages:
+            parse(make_response(name, body))
+    return rounds * len(pages) / (time.perf_counter() - began)
+
+
+def run_extract(parse, pages, rounds):
+    """响应预先解析好，只计字段提取"""
+    responses = [make_response(name, body) for name, body in pages]
+    for response in responses:
+        response.selector  # noqa: B018 触发解析并缓存
+    began = time.perf_counter()
+    for _ in range(rounds):
+        for response in responses:
+            parse(response)
+    return rounds * len(responses) / (time.perf_counter() - began)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="详情页解析基准")
+    parser.add_argument("--rounds", type=int, default=2000, help="每个样例页面解析的次数")
+    args = parser.parse_args()
+
+    pages = load_pages()
+    if not pages:
+        raise SystemExit(f"❌ 未找到样例页面: {FIXTURES}")
+
+    for name, body in pages:
+        response = make_response(name, body)
+        legacy, new = legacy_parse(response), new_parse(response)
+        diffs = [key for key in legacy if legacy[key] != new.get(key)]
+        print(f"{name}: {len(legacy) - len(diffs)}/{len(legacy)} 个字段一致")
+        for key in diffs:
+            print(f"    {key}: {legacy[key]!r} -> {new.get(key)!r}")
+
+    for title, runner in (("含 HTML 解析", run), ("仅字段提取", run_extract)):
+        legacy_rate = runner(legacy_parse, pages, args.rounds)
+        new_rate = runner(new_parse, pages, args.rounds)
+        print(f"[{title}] 逐字段 XPath: {legacy_rate:10,.0f} 页/秒  单次遍历: {new_rate:10,.0f} 页/秒  "
+              f"加速比: {new_rate / legacy_rate:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# 附件任务提取基准：逐行 iterrows 版本与向量化 build_tasks() 的吞吐对比
+#
+# 用法（在 scrapy.cfg 所在目录执行）：
+#   python -m benchmarks.bench_process_excel --rows 100000
+#
+# 生成一个合成的详情表（合同编号 / 合同名称 / 合同公告日期 / 附件下载链接），
+# 分别统计读取与提取的 行/秒，并检查两种实现的输出完全一致。
+
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from ContractSpider.spiders.attachment import AttachmentSpider
+from ContractSpider.utils.storage import read_table
+
+LINK_PATTERNS = (
+    "http://www.ccgp.gov.cn/oss/download?uuid={uuid}",
+    "http://www.ccgp.gov.cn/oss/download?uuid={uuid}&name=合同{n}.pdf",
+    "http://download.ccgp.gov.cn/oss/{uuid}/附件{n}.docx",
+    "https://www.ccgp.gov.cn/files/{uuid}.zip?v=1",
+)
+
+
+def make_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    records = []
+    for i in range(rows):
+        date = (start + timedelta(days=rng.randrange(90))).strftime("%Y-%m-%d")
+        if rng.random() < 0.02:
+            date = ""  # 日期缺失
+        links = [
+            rng.choice(LINK_PATTERNS).format(uuid=f"{rng.getrandbits(64):016X}", n=n)
+            for n in range(rng.randrange(0, 4))
+        ]
+        records.append({
+            "合同编号": f"HT{i:08d}",
+            "合同名称": f"采购合同{i}",
+            "合同公告日期": date,
+            "附件下载链接": " , ".join(links) if links else None,
+        })
+    return pd.DataFrame(records)
+
+
+def make_spider(start_date: str, end_date: str) -> AttachmentSpider:
+    # 只需要任务提取用到的属性，不初始化日志文件、进程池与附件仓库
+    spider = AttachmentSpider.__new__(AttachmentSpider)
+    spider.start_date = start_date
+    spider.end_date = end_date
+    spider.target_column = "附件下载链接"
+    spider.contract_number_column = "合同编号"
+    spider.contract_name_column = "合同名称"
+    spider.custom_logger = logging.getLogger("bench_process_excel")
+    return spider
+
+
+def legacy_build_tasks(spider, df):
+    """改写前的逐行实现，作为正确性与性能的基准"""
+    def is_within_date_range(contract_date):
+        if not contract_date or pd.isna(contract_date):
+            return False
+        try:
+            contract_date = datetime.strptime(str(contract_date), "%Y-%m-%d")
+        except ValueError:
+            return False
+        if spider.start_date and contract_date < datetime.strptime(spider.start_date, "%Y-%m-%d"):
+            return False
+        if spider.end_date and contract_date > datetime.strptime(spider.end_date, "%Y-%m-%d"):
+            return False
+        return True
+
+    attachment_list = []
+    for _, row in df.iterrows():
+        contract_date = row.get("合同公告日期", "")
+        if not is_within_date_range(contract_date):
+            continue
+
+        attachment_links = row[spider.target_column]
+        if pd.isna(attachment_links):
+            continue
+
+        links = [link.strip() for link in str(attachment_links).split(",") if link.strip()]
+        for index, link in enumerate(links, start=1):
+            folder_name = datetime.strptime(contract_date, "%Y-%m-%d").strftime("%Y-%m")
+            ext = spider.get_file_extension(link)
+            attachment_list.append({
+                "folder_name": folder_name,
+                "file_name": f"{row[spider.contract_number_column]}_{row[spider.contract_name_column]}_{index}{ext}",
+                "url": link,
+            })
+    return attachment_list
+
+
+def timed(func, *args, **kwargs):
+    began = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser(description="附件任务提取基准")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--start", default="2025-01-15")
+    parser.add_argument("--end", default="2025-03-15")
+    parser.add_argument("--skip-legacy", action="store_true", help="只测试向量化实现")
+    args = parser.parse_args()
+
+    spider = make_spider(args.start, args.end)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "2025-01-01.xlsx")
+        _, elapsed = timed(make_frame(args.rows).to_excel, path, index=False)
+        print(f"生成 {args.rows} 行详情表: {elapsed:.1f}s")
+
+        df, elapsed = timed(read_table, path)
+        print(f"读取:        {elapsed:8.2f}s  {len(df) / elapsed:12,.0f} 行/秒")
+
+    tasks, elapsed = timed(spider.build_tasks, df)
+    print(f"向量化提取:  {elapsed:8.2f}s  {len(df) / elapsed:12,.0f} 行/秒  ({len(tasks)} 个任务)")
+
+    if args.skip_legacy:
+        return
+    expected, legacy_elapsed = timed(legacy_build_tasks, spider, df)
+    print(f"逐行提取:    {legacy_elapsed:8.2f}s  {len(df) / legacy_elapsed:12,.0f} 行/秒  ({len(expected)} 个任务)")
+    print(f"加速比: {legacy_elapsed / elapsed:.1f}x")
+
+    if tasks != expected:
+        mismatch = next(i for i, (a, b) in enumerate(zip(tasks, expected)) if a != b) \
+            if len(tasks) == len(expected) else min(len(tasks), len(expected))
+        raise SystemExit(f"❌ 两种实现的输出不一致，第 {mismatch} 个任务起不同")
+    print("✅ 两种实现的输出一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+# 离线回放：用 benchmarks/fixtures 中录制的响应驱动各爬虫的回调与管道，不访问网络
+#
+# 用法（在 scrapy.cfg 所在目录执行）：
+#   python -m benchmarks.replay              # 回放并与 fixtures/expected.json 比对
+#   python -m benchmarks.replay --repeat 20  # 重复回放样例，测吞吐（重复时不比对）
+#   python -m benchmarks.replay --update     # 解析或写入逻辑有意变更后，更新期望结果
+#
+# 三个阶段依次执行，后一阶段读取前一阶段写出的数据，与实际运行一致：
+#   contract   - search/*.json 作为分页响应交给 ContractSpider.parse_page()，结果写入 ContractPipeline
+#   detail     - 为上一阶段的每个合同链接依次套用 detail/*.html，交给 DetailSpider.parse() 与 DetailPipeline
+#   attachment - AttachmentSpider.start_requests() 读取详情数据，按 attachments/manifest.json 返回样例附件
+# 每个阶段分别统计回调与管道耗时、items/秒，并在单独一轮中用 tracemalloc 统计内存峰值。
+# 全部在临时目录中运行，不影响项目下的 downloads / detail_downloads / attachments。
+
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)  # 回放时会切换工作目录
+os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "ContractSpider.settings")
+os.environ.setdefault("TQDM_DISABLE", "1")  # 爬虫内部创建的进度条不输出
+
+import scrapy  # noqa: E402
+from scrapy.exceptions import DropItem  # noqa: E402
+from scrapy.http import FormRequest, HtmlResponse, Request, Response, TextResponse  # noqa: E402
+from scrapy.utils.project import get_project_settings  # noqa: E402
+
+from tqdm import tqdm  # noqa: E402
+
+from ContractSpider.pipelines import ContractPipeline, DetailPipeline  # noqa: E402
+from ContractSpider.spiders.attachment import AttachmentSpider  # noqa: E402
+from ContractSpider.spiders.contract import ContractSpider  # noqa: E402
+from ContractSpider.spiders.details import DetailSpider  # noqa: E402
+from ContractSpider.utils.paging import PageTracker, SearchShard  # noqa: E402
+from ContractSpider.utils.storage import FORMAT_XLSX, list_day_sources, parse_formats, read_table  # noqa: E402
+from ContractSpider.utils.verify import VerifyPool  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+EXPECTED_PATH = os.path.join(FIXTURES, "expected.json")
+
+# 样例数据的日期范围（搜索页结束日期不含，与 ContractSpider 一致）
+START_DATE = "2025-03-01"
+END_DATE = "2025-03-12"
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.dropped = 0
+        self.callback_time = 0.0
+        self.pipeline_time = 0.0
+        self.peak = None
+
+    @property
+    def total_time(self) -> float:
+        return self.callback_time + self.pipeline_time
+
+
+class Timer:
+    """累加代码块耗时到 stats 的指定属性"""
+
+    def __init__(self, stats: StageStats, attr: str):
+        self.stats = stats
+        self.attr = attr
+
+    def __enter__(self):
+        self.began = time.perf_counter()
+
+    def __exit__(self, *exc):
+        setattr(self.stats, self.attr, getattr(self.stats, self.attr) + time.perf_counter() - self.began)
+
+
+def read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def load_fixtures():
+    search = [read_bytes(p) for p in sorted(glob.glob(os.path.join(FIXTURES, "search", "*.json")))]
+    detail = [read_bytes(p) for p in sorted(glob.glob(os.path.join(FIXTURES, "detail", "*.html")))]
+    with open(os.path.join(FIXTURES, "attachments", "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    attachments = {}
+    for uuid, entry in manifest.items():
+        headers = {"Content-Type": entry["content_type"]}
+        if entry.get("content_disposition"):
+            headers["Content-Disposition"] = entry["content_disposition"]
+        attachments[uuid] = (read_bytes(os.path.join(FIXTURES, "attachments", entry["file"])), headers)
+    return search, detail, attachments
+
+
+def relpath(path: str) -> str:
+    return os.path.normpath(path).replace(os.sep, "/")
+
+
+# ---------- 各阶段 ----------
+
+def replay_contract(settings, pages, repeat, stats: StageStats):
+    spider = ContractSpider(CONTRACT_START_DATE=START_DATE, CONTRACT_END_DATE=END_DATE, resume="0")
+    spider.progress_bar = tqdm(total=0)
+    shard = SearchShard(START_DATE, END_DATE)
+    shard.tracker = PageTracker(len(pages) * repeat, window=0, max_retries=spider.max_retries)
+    spider.shards[shard.key] = shard
+    pipeline = ContractPipeline(
+        flush_rows=settings.getint("CONTRACT_FLUSH_ROWS", 200),
+        flush_interval=0,  # 不启动定时刷新，结束时统一刷新
+        formats=parse_formats(settings.get("STORAGE_FORMATS", [FORMAT_XLSX])),
+    )
+    pipeline.open_spider(spider)
+
+    items = []
+    for page in range(1, len(pages) * repeat + 1):
+        request = FormRequest(spider.data_url, formdata={"currentPage": str(page)},
+                              meta={"page": page, "payload": {}, "shard": shard.key}, dont_filter=True)
+        response = TextResponse(request.url, body=pages[(page - 1) % len(pages)], encoding="utf-8", request=request)
+        with Timer(stats, "callback_time"):
+            outputs = list(spider.parse_page(response))
+        for output in outputs:
+            if not isinstance(output, scrapy.Item):
+                continue  # 后续分页或重试请求，回放中只按样例页顺序推进
+            with Timer(stats, "pipeline_time"):
+                pipeline.process_item(output, spider)
+            items.append(dict(output))
+
+    with Timer(stats, "pipeline_time"):
+        pipeline.close_spider(spider)
+    spider.closed("finished")
+    stats.items = len(items)
+    return items
+
+
+def replay_detail(settings, links, pages, stats: StageStats):
+    spider = DetailSpider(DETAIL_START_DATE=START_DATE, DETAIL_END_DATE=END_DATE, resume="0")
+    spider.progress_bar = tqdm(total=0)
+    pipeline = DetailPipeline(
+        commit_rows=settings.getint("DETAIL_COMMIT_ROWS", 500),
+        formats=parse_formats(settings.get("STORAGE_FORMATS", [FORMAT_XLSX])),
+    )
+
+    items = []
+    for index, link in enumerate(links):
+        request = Request(link, meta={"contract_link": link})
+        response = HtmlResponse(link, body=pages[index % len(pages)], encoding="utf-8", request=request)
+        with Timer(stats, "callback_time"):
+            outputs = list(spider.parse(response))
+        for output in outputs:
+            items.append(dict(output))
+            try:
+                with Timer(stats, "pipeline_time"):
+                    pipeline.process_item(output, spider)
+            except DropItem:
+                stats.dropped += 1
+
+    with Timer(stats, "pipeline_time"):
+        pipeline.close_spider(spider)
+    spider.closed("finished")
+    stats.items = len(items)
+    return items
+
+
+def replay_attachment(attachments, stats: StageStats):
+    spider = AttachmentSpider(ATTACHMENT_START_DATE=START_DATE, ATTACHMENT_END_DATE=END_DATE, resume="0")
+    # 回放只做快速结构检查，且在当前进程内执行：避免计入进程池启动时间，也不受抽样随机性影响
+    spider.verify_pool.shutdown()
+    spider.verify_pool = VerifyPool(max_workers=0, default_full_rate=0)
+
+    # items 以读取到的附件任务数计（相同附件只下载一次，其余建立链接）
+    iter_task_batches = spider.iter_task_batches
+
+    def counted_batches():
+        for batch in iter_task_batches():
+            stats.items += len(batch)
+            yield batch
+
+    spider.iter_task_batches = counted_batches
+    with Timer(stats, "callback_time"):
+        queue = deque(spider.start_requests())
+
+    async def drain():
+        while queue:
+            request = queue.popleft()
+            body, headers = attachments.get(spider.attachment_uuid(request.url), (b"", {}))
+            response = Response(request.url, status=200 if body else 404, headers=headers, body=body, request=request)
+            with Timer(stats, "callback_time"):
+                async for output in spider.save_attachment(response):
+                    if isinstance(output, Request):
+                        queue.append(output)  # 重试请求，未知附件重试到上限后放弃
+
+    asyncio.run(drain())
+    spider.closed("finished")
+
+    files = []
+    for path in glob.glob(os.path.join(spider.save_folder, "*", "*")):
+        if os.path.basename(os.path.dirname(path)).startswith("."):
+            continue
+        files.append([relpath(path), sha256_of(path)])
+    return sorted(files)
+
+
+def sha256_of(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def close_log_files(workdir: str):
+    """关闭爬虫在临时目录中打开的日志文件，否则 Windows 上无法删除临时目录"""
+    for logger in [logging.getLogger()] + [logging.getLogger(name) for name in list(logging.root.manager.loggerDict)]:
+        for handler in list(getattr(logger, "handlers", [])):
+            if getattr(handler, "baseFilename", "").startswith(workdir):
+                handler.close()
+                logger.removeHandler(handler)
+
+
+def table_rows(base_folder: str):
+    """各日数据文件的行数，用于比对管道写入结果"""
+    return {relpath(path): len(read_table(path)) for path in list_day_sources(base_folder, START_DATE, END_DATE)}
+
+
+# ---------- 运行与报告 ----------
+
+def replay(repeat: int, trace_memory: bool):
+    search, detail, attachments = load_fixtures()
+    stages = [StageStats("contract"), StageStats("detail"), StageStats("attachment")]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            settings = get_project_settings()
+
+            def run(stats, func, *args):
+                if trace_memory:
+                    tracemalloc.start()
+                try:
+                    return func(*args)
+                finally:
+                    if trace_memory:
+                        stats.peak = tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+                    close_log_files(os.getcwd())
+
+            contract_items = run(stages[0], replay_contract, settings, search, repeat, stages[0])
+            links = [item["contract_link"] for item in contract_items]
+            detail_items = run(stages[1], replay_detail, settings, links, detail, stages[1])
+            attachment_files = run(stages[2], replay_attachment, attachments, stages[2])
+            output = {
+                "contract_items": contract_items,
+                "detail_items": detail_items,
+                "contract_files": table_rows("downloads"),
+                "detail_files": table_rows("detail_downloads"),
+                "attachment_files": attachment_files,
+            }
+        finally:
+            os.chdir(cwd)
+    return stages, normalize(output)
+
+
+def normalize(output):
+    """统一路径分隔符，使期望结果可跨平台比对"""
+    for item in output["contract_items"]:
+        item["file_path"] = relpath(item["file_path"])
+    return json.loads(json.dumps(output, ensure_ascii=False, sort_keys=True))
+
+
+def compare(actual, expected):
+    diffs = []
+    for key in sorted(set(actual) | set(expected)):
+        a, e = actual.get(key), expected.get(key)
+        if a == e:
+            continue
+        if isinstance(a, list) and isinstance(e, list):
+            if len(a) != len(e):
+                diffs.append(f"{key}: 数量 {len(e)} -> {len(a)}")
+            for index, (x, y) in enumerate(zip(a, e)):
+                if x != y:
+                    diffs.append(f"{key}[{index}]: {y} -> {x}")
+                    break
+        else:
+            diffs.append(f"{key}: {e} -> {a}")
+    return diffs
+
+
+def report(stages, memory_stages):
+    print(f"{'阶段':<12}{'items':>8}{'回调(s)':>10}{'管道(s)':>10}{'items/秒':>12}{'内存峰值(MiB)':>16}")
+    for stats, memory in zip(stages, memory_stages):
+        rate = stats.items / stats.total_time if stats.total_time else 0
+        peak = f"{memory.peak / 1024 / 1024:.1f}" if memory.peak is not None else "-"
+        print(f"{stats.name:<12}{stats.items:>8}{stats.callback_time:>10.3f}{stats.pipeline_time:>10.3f}"
+              f"{rate:>12,.0f}{peak:>16}")
+        if stats.dropped:
+            print(f"{'':<12}丢弃 {stats.dropped} 条")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线回放样例响应，测量解析与写入性能并比对结果")
+    parser.add_argument("--repeat", type=int, default=1, help="重复回放样例分页的次数")
+    parser.add_argument("--update", action="store_true", help="用本次结果覆盖 fixtures/expected.json")
+    parser.add_argument("--no-memory", action="store_true", help="不单独运行内存统计")
+    args = parser.parse_args()
+
+    stages, output = replay(args.repeat, trace_memory=False)
+    memory_stages = stages if args.no_memory else replay(args.repeat, trace_memory=True)[0]
+    report(stages, memory_stages)
+
+    if args.update:
+        with open(EXPECTED_PATH, "w", encoding="utf-8") as f:
+            json.dump(output, f, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f"💾 已更新期望结果: {EXPECTED_PATH}")
+        return
+    if args.repeat != 1:
+        print("重复回放时不比对期望结果")
+        return
+    if not os.path.exists(EXPECTED_PATH):
+        raise SystemExit("❌ 缺少期望结果，先运行 --update 生成")
+    with open(EXPECTED_PATH, "r", encoding="utf-8") as f:
+        expected = json.load(f)
+    diffs = compare(output, expected)
+    if diffs:
+        print("❌ 回放结果与期望不一致：")
+        for diff in diffs:
+            print(f"    {diff}")
+        raise SystemExit(1)
+    print("✅ 回放结果与期望一致")
+
+
+if __name__ == "__main__":
+    main()